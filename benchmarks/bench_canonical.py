@@ -0,0 +1,102 @@
+"""
+Benchmark of GenderExtractor.extract_canonical on synthetic name sets.
+
+Compares the blocking-index implementation with the reference implementation that compares
+each name with every canonical name found so far, and checks that both give the same mapping.
+
+Usage:
+    python -m benchmarks.bench_canonical --sizes 100 1000 3000
+"""
+import argparse
+import difflib
+import random
+import time
+from collections import defaultdict
+
+from src.gender import GenderExtractor
+
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Волков', 'Соколов', 'Лебедев',
+            'Козлов', 'Новиков', 'Морозов', 'Васильев', 'Зайцев', 'Павлов', 'Семенов', 'Голубев', 'Виноградов',
+            'Богданов', 'Воробьев', 'Федоров', 'Михайлов', 'Беляев', 'Тарасов', 'Белов', 'Комаров', 'Орлов']
+FIRST_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Евгений', 'Иван', 'Михаил',
+               'Артем', 'Владимир', 'Николай', 'Олег', 'Павел', 'Роман', 'Виктор', 'Юрий', 'Игорь']
+PATRONYMICS = ['Александрович', 'Сергеевич', 'Дмитриевич', 'Андреевич', 'Алексеевич', 'Иванович',
+               'Михайлович', 'Владимирович', 'Николаевич', 'Викторович', 'Юрьевич', 'Игоревич']
+CASE_ENDINGS = ['', 'а', 'у', 'ым', 'е']
+
+
+def reference_canonical(extractor, names_dict):
+    """Quadratic reference implementation: compares each name with every canonical name."""
+    canonical_map = {}
+    reverse_map = defaultdict(list)
+
+    for raw_name, components in names_dict.items():
+        full = extractor.get_full_name(components)
+        matched = None
+
+        for canon_name, canon_comp in canonical_map.items():
+            if full == canon_name:
+                matched = canon_name
+                break
+            elif extractor.match_by_initials(canon_comp, components):
+                matched = canon_name
+                break
+            elif difflib.SequenceMatcher(None, extractor.get_full_name(canon_comp), full).ratio() > 0.88:
+                matched = canon_name
+                break
+
+        if matched:
+            reverse_map[matched].append(raw_name)
+        else:
+            canonical_map[full] = components
+            reverse_map[full].append(raw_name)
+
+    return reverse_map
+
+
+def synthetic_names(size, seed=0):
+    """Generates a dict of raw name → name components with case forms and initials of the same people."""
+    rng = random.Random(seed)
+    names = {}
+    while len(names) < size:
+        last, first, middle = rng.choice(SURNAMES), rng.choice(FIRST_NAMES), rng.choice(PATRONYMICS)
+        suffix = str(rng.randrange(size)) if rng.random() < 0.5 else ''
+        last = f"{last}{suffix}"
+        ending = rng.choice(CASE_ENDINGS)
+        if rng.random() < 0.2:
+            components = {'last': last + ending, 'first': first[0], 'middle': middle[0]}
+            raw_name = f"{last + ending} {first[0]}.{middle[0]}."
+        else:
+            components = {'last': last + ending, 'first': first + ending, 'middle': middle + ending}
+            raw_name = ' '.join(components.values())
+        names[raw_name] = components
+    return names
+
+
+def run(sizes, repeat):
+    extractor = GenderExtractor(russian_names_db=False)
+    print(f"{'names':>8} {'reference, s':>14} {'blocking, s':>12} {'speedup':>8}")
+    for size in sizes:
+        names = synthetic_names(size)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = reference_canonical(extractor, names)
+        reference_time = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = extractor.extract_canonical(names)
+        blocking_time = (time.perf_counter() - start) / repeat
+
+        if dict(result) != dict(expected):
+            raise AssertionError(f"Mappings differ for {size} names")
+        print(f"{size:>8} {reference_time:>14.4f} {blocking_time:>12.4f} {reference_time / blocking_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
@@ -0,0 +1,71 @@
+"""
+Benchmark of the import time of the package modules.
+
+Each module is imported in a fresh interpreter; the time of the import (without the interpreter
+startup) is measured several times and the median is reported, together with the heavy
+dependencies that the import pulled in. Heavy dependencies are expected to be loaded lazily,
+on first use.
+
+Usage:
+    python -m benchmarks.bench_import --repeat 5 --max-ms 100
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = ['src.articles', 'src.districts', 'src.metrics', 'src.models', 'src.llm', 'src.gender', 'src.punishments']
+# Modules whose import time is checked against --max-ms
+FAST_MODULES = ['src.articles', 'src.districts']
+HEAVY_DEPENDENCIES = ['pandas', 'numpy', 'natasha', 'spacy', 'pymorphy2', 'pytrovich', 'russiannames',
+                      'google.generativeai', 'pyarrow']
+
+_MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=5):
+    """Returns the median import time of a module (seconds) and the heavy dependencies it imported."""
+    timings, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _MEASURE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        loaded = result['loaded']
+    return statistics.median(timings), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=100.0,
+                        help=f"fail if importing any of {FAST_MODULES} takes longer (median)")
+    args = parser.parse_args()
+
+    failed = []
+    print(f"{'module':>16} {'import, ms':>11}  heavy dependencies loaded")
+    for module in args.modules:
+        try:
+            seconds, loaded = measure(module, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f"{module:>16} {'error':>11}  {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"{module:>16} {seconds * 1000:>11.1f}  {', '.join(loaded) or '-'}")
+        if module in FAST_MODULES and (seconds * 1000 > args.max_ms or loaded):
+            failed.append(module)
+
+    if failed:
+        print(f"Too slow or loading heavy dependencies on import: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,493 @@
+"""
+Benchmark suite of the extractors on the bundled datasets, with regression thresholds.
+
+Inputs are the charge strings of data/raw/articles_examples_v1.csv and the court codes of the
+court dictionaries in data/interim, scaled synthetically to the requested number of rows
+(charges get new person names, court lookups get random decision dates). Each benchmark runs in
+a fresh interpreter, so that its peak RSS is measured separately, and reports rows/sec, p50/p99
+latency (per row or per batch of rows) and peak RSS.
+
+Each benchmark is run several times (--repeat) and the median of each metric is reported. Results
+are compared with the stored baselines: a benchmark fails if its throughput drops, or its p99
+latency or peak RSS grows, by more than the thresholds (tail latency is noisier, so it has a
+threshold of its own). Only results of the same number of rows as the baseline are compared.
+
+Baselines are machine-specific: they are stored with the machine they were recorded on (platform,
+CPU model, number of CPUs, Python version) and the time of a fixed calibration loop. On another
+machine the comparison is skipped (--ignore-machine compares anyway); throughput and latency are
+scaled by the ratio of the calibration times, so that a slower or throttled run of the same
+machine is not reported as a regression. Record baselines on the machine that runs the
+comparison with --update-baseline.
+
+The thread and process benchmarks of the Articles Extractor split each batch into chunks of
+PARALLEL_CHUNKSIZE rows for PARALLEL_WORKERS workers (at least two, at most four, so they exercise
+the parallel path even on one CPU). On a machine with a single CPU they only measure the overhead
+of the parallel modes, not their scaling.
+
+Benchmarks whose dependencies are not installed (e.g. natasha for name extraction) are skipped.
+
+Usage:
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --only articles_serial districts_bulk --scale 50
+    python -m benchmarks.bench_suite --threshold 0.2 --rss-threshold 0.3
+    python -m benchmarks.bench_suite --update-baseline
+    python -m benchmarks.bench_suite --ignore-machine
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+ARTICLES_PATH = os.path.join(DATA_DIR, 'raw', 'articles_examples_v1.csv')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+BATCH_SIZE = 10000
+# The batches of the parallel benchmarks are split into chunks: a batch of one chunk is parsed serially
+PARALLEL_CHUNKSIZE = BATCH_SIZE // 8
+PARALLEL_WORKERS = max(2, min(4, os.cpu_count() or 1))
+# Machine properties that must match for results to be comparable with a baseline
+MACHINE_KEYS = ('system', 'machine', 'processor', 'cpu_count', 'python')
+
+
+def charge_strings(rows, seed=0):
+    """Charge strings of the bundled dataset with new synthetic person names, repeated up to rows."""
+    from benchmarks.bench_canonical import FIRST_NAMES, PATRONYMICS, SURNAMES
+
+    # The file has unquoted commas inside values, so it is read line by line
+    with open(ARTICLES_PATH, encoding='utf-8') as file:
+        lines = [line.rstrip('\n').strip('"') for line in file][1:]
+    rng = random.Random(seed)
+    strings = []
+    for index in range(rows):
+        line = lines[index % len(lines)]
+        if index >= len(lines) and ' - ' in line:
+            name = f"{rng.choice(SURNAMES)}{rng.randrange(1000)} {rng.choice(FIRST_NAMES)} {rng.choice(PATRONYMICS)}"
+            line = f"{name} - {line.split(' - ', 1)[1]}"
+        strings.append(line)
+    return strings
+
+
+def court_codes(rows, seed=0):
+    """Court codes of the court dictionaries (and a few unknown codes) with random decision dates."""
+    from src.districts import find_dictionary_versions, read_court_dict
+
+    codes = sorted({code for path in find_dictionary_versions() for code in read_court_dict(path)['court_code'].dropna()})
+    codes += ['00RS0000', '99MS9999']
+    rng = random.Random(seed)
+    dates = [f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(366)]
+    return [rng.choice(codes) for _ in range(rows)], [rng.choice(dates) for _ in range(rows)]
+
+
+def decision_texts(rows, seed=0, ambiguous_share=0.0):
+    """
+    Synthetic decision texts with a resolutive part naming a person and a punishment. A share of
+    the texts get a suspended sentence, which the rule-based fast path leaves to the model.
+    """
+    from benchmarks.bench_canonical import FIRST_NAMES, PATRONYMICS, SURNAMES
+
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(rows):
+        name = f"{rng.choice(SURNAMES)}а {rng.choice(FIRST_NAMES)}а {rng.choice(PATRONYMICS)}а"
+        text = ("Установил: подсудимый совершил преступление. " * 20 +
+                f"ПРИГОВОРИЛ: {name} признать виновным в совершении преступления, предусмотренного ч.1 "
+                f"ст.158 УК РФ, и назначить ему наказание в виде штрафа в размере {rng.randint(5, 50)} "
+                f"000 рублей.")
+        if rng.random() < ambiguous_share:
+            text = text.replace("в виде штрафа в размере", "в виде лишения свободы на срок 1 год условно, "
+                                "с испытательным сроком 1 год, и штрафа в размере")
+        texts.append(text)
+    return texts
+
+
+def person_names(rows, seed=0):
+    """Synthetic (first name, surname, patronymic) triples of men and women."""
+    from benchmarks.bench_canonical import FIRST_NAMES, PATRONYMICS, SURNAMES
+
+    female_first_names = ['Анна', 'Елена', 'Ольга', 'Наталья', 'Татьяна', 'Ирина', 'Мария', 'Светлана']
+    rng = random.Random(seed)
+    names = []
+    for _ in range(rows):
+        if rng.random() < 0.5:
+            names.append((rng.choice(FIRST_NAMES), rng.choice(SURNAMES), rng.choice(PATRONYMICS)))
+        else:
+            # Иванович -> Ивановна
+            patronymic = rng.choice(PATRONYMICS)[:-3] + 'вна'
+            names.append((rng.choice(female_first_names), rng.choice(SURNAMES) + 'а', patronymic))
+    return names
+
+
+def _batches(items, batch_size=BATCH_SIZE):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _timed(func, items):
+    """Calls func on each item and returns the latencies in seconds."""
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_articles_process_string(rows):
+    from src.articles import ArticlesExtractor
+    extractor = ArticlesExtractor()
+    return 'row', _timed(extractor.process_string, charge_strings(rows))
+
+
+def _bench_articles(rows, mode):
+    import pandas as pd
+    from src.articles import ArticlesExtractor
+    extractor = ArticlesExtractor()
+    frames = [pd.DataFrame({'accused': batch}) for batch in _batches(charge_strings(rows))]
+    try:
+        return 'batch', _timed(lambda df: extractor.process_dataframe(
+            df, 'accused', mode=mode, n_workers=PARALLEL_WORKERS, chunksize=PARALLEL_CHUNKSIZE
+        ), frames)
+    finally:
+        extractor.close_workers()
+
+
+def bench_articles_serial(rows):
+    return _bench_articles(rows, 'serial')
+
+
+def bench_articles_thread(rows):
+    return _bench_articles(rows, 'thread')
+
+
+def bench_articles_process(rows):
+    return _bench_articles(rows, 'process')
+
+
+def bench_districts_single(rows):
+    from src.districts import MunicipalityExtractor
+    extractor = MunicipalityExtractor()
+    codes, dates = court_codes(rows)
+    return 'row', _timed(lambda item: extractor.get_municipality(*item), list(zip(codes, dates)))
+
+
+def bench_districts_bulk(rows):
+    import pandas as pd
+    from src.districts import MunicipalityExtractor
+    extractor = MunicipalityExtractor()
+    codes, dates = court_codes(rows)
+    frames = [pd.DataFrame({'court_code': code_batch, 'date': date_batch})
+              for code_batch, date_batch in zip(_batches(codes), _batches(dates))]
+    return 'batch', _timed(lambda df: extractor.process_dataframe(df, 'court_code', date_column='date'), frames)
+
+
+def bench_gender_canonical(rows):
+    from benchmarks.bench_canonical import synthetic_names
+    from src.gender import GenderExtractor
+    extractor = GenderExtractor()
+    name_sets = [synthetic_names(200, seed) for seed in range(max(1, rows // 200))]
+    return 'batch', _timed(extractor.extract_canonical, name_sets)
+
+
+def bench_gender_extract_names(rows):
+    from src.gender import GenderExtractor
+    extractor = GenderExtractor()
+    GenderExtractor.warm_up()
+    return 'row', _timed(lambda text: extractor.extract_names(text, canonical=True), decision_texts(rows))
+
+
+def bench_gender_names_batched(rows):
+    from src.gender import GenderExtractor
+    extractor = GenderExtractor()
+    GenderExtractor.warm_up()
+    batches = list(_batches(decision_texts(rows), 256))
+    return 'batch', _timed(lambda texts: extractor.extract_names_many(texts, canonical=True, syntax=False), batches)
+
+
+def bench_gender_detect(rows):
+    from src.gender import GenderExtractor
+    extractor = GenderExtractor()
+    GenderExtractor.warm_up()
+    return 'row', _timed(lambda name: extractor.detect_gender(*name), person_names(rows))
+
+
+def bench_punishments_rules(rows):
+    from src.llm import FakeModel
+    from src.punishments import PunishmentExtractor
+
+    extractor = PunishmentExtractor(model=FakeModel(), fast_path=True)
+    texts = [extractor.remove_double_spaces(extractor.extract_resolutive_part(text))
+             for text in decision_texts(rows, ambiguous_share=0.5)]
+    extractor.rule_based_punishments(texts[:1])
+    return 'batch', _timed(extractor.rule_based_punishments, list(_batches(texts, 64)))
+
+
+def bench_punishments_fast_path(rows):
+    from src.llm import FakeModel
+    from src.punishments import PunishmentExtractor
+
+    response = '```json\n{"Иванов Иван Иванович": {"1": {"punishment": "штраф", "type": "", "severity": ' \
+               '{"years": 0, "months": 0, "rubles": 20000, "days": 0, "hours": 0}}}}\n```'
+    extractor = PunishmentExtractor(model=FakeModel(response, latency=0.05, seed=0), fast_path=True)
+    extractor.rule_based_punishments([extractor.remove_double_spaces(extractor.extract_resolutive_part(text))
+                                      for text in decision_texts(1)])
+    batches = list(_batches(decision_texts(rows, ambiguous_share=0.5), 100))
+    return 'batch', _timed(lambda texts: asyncio.run(extractor.find_punishments_async(texts, concurrency=32)), batches)
+
+
+def bench_punishments_fake_llm(rows):
+    from src.llm import FakeModel
+    from src.punishments import PunishmentExtractor
+
+    response = '```json\n{"Иванов Иван Иванович": {"1": {"punishment": "штраф", "type": "", "severity": ' \
+               '{"years": 0, "months": 0, "rubles": 20000, "days": 0, "hours": 0}}}}\n```'
+    extractor = PunishmentExtractor(model=FakeModel(response, latency=0.05, seed=0))
+    texts = [extractor.remove_double_spaces(extractor.extract_resolutive_part(text)) for text in decision_texts(rows)]
+    semaphore = asyncio.Semaphore(32)
+
+    async def timed(text):
+        start = time.perf_counter()
+        async with semaphore:
+            await extractor.find_punishment_async(text)
+        return time.perf_counter() - start
+
+    async def run():
+        return await asyncio.gather(*(timed(text) for text in texts))
+
+    return 'row', asyncio.run(run())
+
+
+# name: (benchmark function, default number of rows)
+BENCHMARKS = {
+    'articles_process_string': (bench_articles_process_string, 20000),
+    'articles_serial': (bench_articles_serial, 100000),
+    'articles_thread': (bench_articles_thread, 100000),
+    'articles_process': (bench_articles_process, 100000),
+    'districts_single': (bench_districts_single, 20000),
+    'districts_bulk': (bench_districts_bulk, 200000),
+    'gender_canonical': (bench_gender_canonical, 2000),
+    'gender_extract_names': (bench_gender_extract_names, 500),
+    'gender_names_batched': (bench_gender_names_batched, 2000),
+    'gender_detect': (bench_gender_detect, 20000),
+    'punishments_rules': (bench_punishments_rules, 2000),
+    'punishments_fast_path': (bench_punishments_fast_path, 1000),
+    'punishments_fake_llm': (bench_punishments_fake_llm, 1000),
+}
+
+
+def cpu_model():
+    """CPU model name (from /proc/cpuinfo on Linux)."""
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def calibrate(repeat=5):
+    """
+    Median seconds of a fixed pure-Python workload (regex matching, string and dict operations,
+    like the extractors), a measure of the current speed of the machine.
+    """
+    pattern = re.compile(r"ст\.?\s*(\d+)")
+    text = "Иванов Иван Иванович - ст.158 ч.2 п.а, ст. 30 ч.3 - ст.161 ч.1 УК РФ"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        counts = {}
+        for index in range(20000):
+            for match in pattern.finditer(text):
+                key = f"{match.group(1)}:{index % 100}"
+                counts[key] = counts.get(key, 0) + 1
+            text.lower().split()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def machine_info():
+    """Properties of the machine that results depend on, and its calibration time."""
+    return {
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'processor': cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version().rsplit('.', 1)[0],
+        'calibration_seconds': calibrate(),
+    }
+
+
+def same_machine(machine, baseline_machine):
+    return baseline_machine is not None and \
+        all(machine.get(key) == baseline_machine.get(key) for key in MACHINE_KEYS)
+
+
+def load_baselines(path):
+    """Returns (machine info, {benchmark: result}) of a baseline file (machine info is None if unknown)."""
+    if not os.path.exists(path):
+        return None, {}
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    if 'benchmarks' not in data:
+        # Baselines recorded without machine information
+        return None, data
+    return data.get('machine'), data['benchmarks']
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def peak_rss():
+    """Peak RSS in bytes of this process and of its (finished) child processes."""
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def run_benchmark(name, rows):
+    """Runs a benchmark in this process and returns its metrics."""
+    function = BENCHMARKS[name][0]
+    start = time.perf_counter()
+    unit, latencies = function(rows)
+    seconds = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds,
+        'latency_unit': unit,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_mb': peak_rss() / 2 ** 20,
+    }
+
+
+def run_isolated(name, rows, repeat=1):
+    """
+    Runs a benchmark in a fresh interpreter repeat times.
+
+    Returns:
+        dict: Medians of the metrics, or {'error': message} if the benchmark failed (e.g. a
+            dependency is missing).
+    """
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.bench_suite', '--child', name,
+                                  '--rows', str(rows)], capture_output=True, text=True)
+        if process.returncode != 0:
+            lines = process.stderr.strip().splitlines()
+            return {'error': lines[-1] if lines else f"exit code {process.returncode}"}
+        runs.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    result = dict(runs[0])
+    for metric in ('seconds', 'rows_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+        result[metric] = statistics.median(run[metric] for run in runs)
+    return result
+
+
+def compare(name, result, baseline, threshold, latency_threshold, rss_threshold, speed=1.0):
+    """
+    Returns the regressions of a result against its baseline.
+
+    Args:
+        speed (float): Speed of the machine relative to the baseline run (ratio of the calibration
+            times): the baseline throughput is multiplied and its latency divided by it.
+    """
+    regressions = []
+    rows_per_sec, p99_ms = baseline['rows_per_sec'] * speed, baseline['p99_ms'] / speed
+    if result['rows_per_sec'] < rows_per_sec * (1 - threshold):
+        regressions.append(f"rows/sec {result['rows_per_sec']:.0f} < {rows_per_sec:.0f}")
+    if result['p99_ms'] > p99_ms * (1 + latency_threshold):
+        regressions.append(f"p99 {result['p99_ms']:.3f} ms > {p99_ms:.3f} ms")
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + rss_threshold):
+        regressions.append(f"peak RSS {result['peak_rss_mb']:.0f} MB > {baseline['peak_rss_mb']:.0f} MB")
+    return [f"{name}: {regression}" for regression in regressions]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='benchmarks to run (all by default)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of the default numbers of rows')
+    parser.add_argument('--rows', type=int, help='number of rows of every benchmark')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark (medians are reported)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative drop of rows/sec')
+    parser.add_argument('--latency-threshold', type=float, default=1.0,
+                        help='allowed relative growth of p99 latency')
+    parser.add_argument('--rss-threshold', type=float, default=0.25, help='allowed relative growth of peak RSS')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--ignore-machine', action='store_true',
+                        help='compare with baselines recorded on another machine')
+    parser.add_argument('--output', help='write the results to a JSON file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_benchmark(args.child, args.rows)))
+        return
+
+    baseline_machine, baselines = load_baselines(args.baseline)
+    machine = machine_info()
+    comparable = args.ignore_machine or same_machine(machine, baseline_machine)
+    speed = 1.0
+    if baseline_machine is not None:
+        speed = baseline_machine['calibration_seconds'] / machine['calibration_seconds']
+    print(f"Machine: {machine['processor']}, {machine['cpu_count']} CPUs, Python {machine['python']}, "
+          f"calibration {machine['calibration_seconds'] * 1000:.0f} ms, speed vs baseline {speed:.2f}")
+    if machine['cpu_count'] == 1:
+        print("One CPU: the thread and process benchmarks measure the overhead of the parallel modes, not their "
+              "scaling.")
+    if baselines and not comparable:
+        print("The baselines were recorded on another machine (or without machine information) and are not "
+              "compared; record them here with --update-baseline or pass --ignore-machine.")
+
+    results, regressions = {}, []
+    print(f"{'benchmark':>24} {'rows':>9} {'rows/sec':>11} {'p50, ms':>9} {'p99, ms':>9} {'unit':>6} "
+          f"{'RSS, MB':>8}  baseline")
+    for name in args.only or BENCHMARKS:
+        rows = args.rows or max(1, int(BENCHMARKS[name][1] * args.scale))
+        result = run_isolated(name, rows, args.repeat)
+        if 'error' in result:
+            print(f"{name:>24} skipped: {result['error']}")
+            continue
+        results[name] = result
+        status = '-'
+        if name in baselines and not comparable:
+            status = 'other machine'
+        elif name in baselines and baselines[name]['rows'] != rows:
+            status = f"baseline of {baselines[name]['rows']} rows"
+        elif name in baselines:
+            failures = compare(name, result, baselines[name], args.threshold, args.latency_threshold,
+                               args.rss_threshold, speed)
+            regressions.extend(failures)
+            status = 'REGRESSION' if failures else 'ok'
+        print(f"{name:>24} {rows:>9} {result['rows_per_sec']:>11.0f} {result['p50_ms']:>9.3f} "
+              f"{result['p99_ms']:>9.3f} {result['latency_unit']:>6} {result['peak_rss_mb']:>8.0f}  {status}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'machine': machine, 'benchmarks': results}, file, indent=2)
+    if args.update_baseline:
+        # Results of another machine are not mixed with the new ones
+        if same_machine(machine, baseline_machine):
+            baselines.update(results)
+        else:
+            baselines = results
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({'machine': machine, 'benchmarks': baselines}, file, indent=2, sort_keys=True)
+        print(f"Baseline updated: {args.baseline}")
+    elif regressions:
+        print('\n'.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,162 +1,524 @@
 import re
-from concurrent.futures import ThreadPoolExecutor
-import pandas as pd
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import repeat
+from src.incremental import fingerprint, mark_rows, row_hashes, stale_rows, update_column
+from src.metrics import NULL_METRICS
+from src.models import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Precompiled patterns shared by all extractor instances and worker processes
+COURT_TYPES = {"CRIMINAL": ["УК", "Уголовного", "уголовного"],
+               "ADMIN": ["КОАП", "об административных правонарушениях", "КоАП"],
+               "MATERIAL": ["УПК"]}
+
+PERSON_SPLIT_PATTERN = re.compile(r';\s*(?=[А-Я])')
+ARTICLE_SPLIT_PATTERN = re.compile(r'[;,]\s*(?=ст\.)')
+ARTICLE_PATTERN = re.compile(r'ст\.\s*(\d+\.?\d*)')  # Matches article (e.g., 30 or 228.1)
+PART_PATTERN = re.compile(r'ч\.\s*(\d+)')  # Matches part (e.g., ч.1)
+SUBPART_PATTERN = re.compile(r'п(?:п|\.)\.?\s*([а-я,]+)')  # Matches subparts (e.g., пп. е,ж,з or п.в)
+SPACES_PATTERN = re.compile(r'\s+')
+CODE_TYPE_PATTERN = re.compile(
+    r'(' + '|'.join(re.escape(item) for sublist in COURT_TYPES.values() for item in sublist) + ')'
+)
+CODE_TYPE_LOOKUP = {item: key for key, values in COURT_TYPES.items() for item in values}
+
+PARSER_VERSION = 1  # increase when the parsing code changes the results, so that incremental results are recomputed
+EXECUTION_MODES = ("serial", "thread", "process")
+OUTPUT_FORMATS = ("records", "long", "arrow")
+CODE_TYPE_CATEGORIES = list(COURT_TYPES) + ['UNKNOWN']
+LONG_TABLE_COLUMNS = ['row_id', 'person_idx', 'code_type', 'article', 'part', 'subpart']
+
+
+def divide_into_person_blocks(input_string):
+    """
+    Divides the input string into blocks for each person.
+    """
+    return PERSON_SPLIT_PATTERN.split(input_string)
+
+
+def extract_article_info(article_text):
+    """
+    Extracts article, part, and subpart information from a single article text.
+    """
+    article_match = ARTICLE_PATTERN.search(article_text)
+    part_match = PART_PATTERN.search(article_text)
+    subpart_match = SUBPART_PATTERN.search(article_text)
+
+    article = article_match.group(1) if article_match else None
+    part = part_match.group(1) if part_match else None
+    subpart = subpart_match.group(1) if subpart_match else None
+
+    if subpart:
+        subpart = SPACES_PATTERN.sub('', subpart)  # Remove spaces
+        subpart = subpart.lower()  # Convert to lowercase
+        subpart = subpart.split(',')  # Split into list
+
+    return article, part, subpart
+
+
+def split_articles(person_block):
+    """
+    Splits a person block into individual articles, handling commas, semicolons, and article ranges.
+    """
+    expanded_articles = []
+    for article in ARTICLE_SPLIT_PATTERN.split(person_block):
+        if '-' in article:  # Handle article ranges
+            for part in article.split('-'):
+                expanded_articles.append(part.strip())
+        else:
+            expanded_articles.append(article.strip())
+
+    return expanded_articles
+
+
+def extract_articles_for_person(person_block):
+    """
+    Extracts article information and code type for a single person block.
+    """
+    code_type_match = CODE_TYPE_PATTERN.search(person_block)
+    code_type = None
+    if code_type_match:
+        code_type = CODE_TYPE_LOOKUP.get(code_type_match.group(1), 'UNKNOWN')
+
+    articles_list = []
+    for article_text in split_articles(person_block):
+        article, part, subpart = extract_article_info(article_text)
+        if article:  # Only add if article is found
+            articles_list.append({
+                'article': article,
+                'part': part,
+                'subpart': subpart
+            })
+
+    return articles_list, code_type
+
+
+def remove_duplicate_articles(articles_list):
+    """
+    Removes duplicate article dictionaries from the list.
+    """
+    unique_articles = []
+    seen = set()
+    for article in articles_list:
+        article_tuple = (
+            ('article', article['article']),
+            ('part', article['part']),
+            ('subpart', tuple(article['subpart']) if article['subpart'] else None)
+        )
+        if article_tuple not in seen:
+            seen.add(article_tuple)
+            unique_articles.append(article)
+    return unique_articles
+
+
+def charge_key(person_block):
+    """
+    Returns the normalized charge portion of a person block, i.e. the block without the
+    name prefix before the first dash. The prefix is kept when it contains an article or
+    a code reference, so that parsing the key always gives the same result as the block.
+    """
+    name, separator, charges = person_block.partition('-')
+    if separator and not ARTICLE_PATTERN.search(name) and not CODE_TYPE_PATTERN.search(name):
+        return charges.strip()
+    return person_block
+
+
+class ChargeCache:
+    """
+    Bounded LRU cache of parsed person blocks keyed by their charge portion (see charge_key).
+
+    Blocks that differ only in the defendant name share one entry. Thread-safe.
+    """
+
+    def __init__(self, maxsize=100000, remove_duplicates=True):
+        self.maxsize = maxsize
+        self.remove_duplicates = remove_duplicates
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, person_block):
+        """Returns (articles_list, code_type) for a person block, parsing it only on a miss."""
+        key = charge_key(person_block)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            articles_list, code_type = extract_articles_for_person(key)
+            if self.remove_duplicates:
+                articles_list = remove_duplicate_articles(articles_list)
+            entry = (tuple((a['article'], a['part'], tuple(a['subpart']) if a['subpart'] else a['subpart'])
+                           for a in articles_list), code_type)
+            with self._lock:
+                self.misses += 1
+                self._data[key] = entry
+                if len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+        articles, code_type = entry
+        return [{'article': article,
+                 'part': part,
+                 'subpart': list(subpart) if subpart else subpart} for article, part, subpart in articles], code_type
+
+    def stats(self):
+        """Returns hit/miss statistics of the cache."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def clear(self):
+        """Removes all entries and resets the statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def extract_info(person_blocks, remove_duplicates=True, cache=None):
+    """
+    Extracts legal information for all person blocks of a single input string.
+
+    Args:
+        cache (ChargeCache): Optional cache of parsed person blocks.
+    """
+    result = []
+    for index, person_block in enumerate(person_blocks, start=1):
+        if cache is not None:
+            articles_list, code_type = cache.parse(person_block)
+        else:
+            articles_list, code_type = extract_articles_for_person(person_block)
+            if remove_duplicates:
+                articles_list = remove_duplicate_articles(articles_list)
+
+        result.append({
+            'person': f'Person {index}',
+            'articles': articles_list,
+            'code_type': code_type
+        })
+
+    return result
+
+
+def parse_charges(input_string, remove_duplicates=True, cache=None):
+    """
+    Stateless parser for a single charge string. Safe to call from any thread or process.
+
+    Returns None for missing (non-string) values.
+    """
+    if not isinstance(input_string, str):
+        return None
+    return extract_info(divide_into_person_blocks(input_string), remove_duplicates, cache)
+
+
+def _encode_result(result, code_type_codes, article_catalog, subpart_catalog):
+    """
+    Encodes one parse result as (person_idx, code_type, article, part, subpart) integer tuples,
+    interning article and subpart values into the catalogs. Missing values are encoded as -1.
+    """
+    rows = []
+    for person_idx, person in enumerate(result, start=1):
+        code_type = code_type_codes.get(person['code_type'], -1)
+        if not person['articles']:
+            rows.append((person_idx, code_type, -1, -1, -1))
+            continue
+        for article in person['articles']:
+            article_code = article_catalog.setdefault(article['article'], len(article_catalog))
+            part = int(article['part']) if article['part'] else -1
+            for subpart in article['subpart'] or [None]:
+                subpart_code = subpart_catalog.setdefault(subpart, len(subpart_catalog)) if subpart else -1
+                rows.append((person_idx, code_type, article_code, part, subpart_code))
+    return rows
+
+
+def build_long_table(results, row_ids=None):
+    """
+    Converts parse results into a flat long table with one row per person, article and subpart.
+
+    Columns: row_id, person_idx (1-based), code_type, article, part, subpart. The code_type,
+    article and subpart columns are categoricals, so their values are stored once in the
+    category catalog. Persons without articles keep one row with missing article values,
+    missing inputs (None results) produce no rows.
+
+    Args:
+        results (list): Results as returned by ArticlesExtractor.process_many.
+        row_ids: Optional sequence of row identifiers (e.g. DataFrame index), defaults to positions.
+    """
+    code_type_codes = {code_type: code for code, code_type in enumerate(CODE_TYPE_CATEGORIES)}
+    article_catalog = {}
+    subpart_catalog = {}
+    encoded = {}  # rows sharing a result object (see deduplicate) are encoded once
+    columns = {name: array('q') for name in LONG_TABLE_COLUMNS}
+
+    for position, result in enumerate(results):
+        if not result:
+            continue
+        rows = encoded.get(id(result))
+        if rows is None:
+            rows = encoded[id(result)] = _encode_result(result, code_type_codes, article_catalog, subpart_catalog)
+        for person_idx, code_type, article, part, subpart in rows:
+            columns['row_id'].append(position)
+            columns['person_idx'].append(person_idx)
+            columns['code_type'].append(code_type)
+            columns['article'].append(article)
+            columns['part'].append(part)
+            columns['subpart'].append(subpart)
+
+    positions = np.asarray(columns['row_id'], dtype=np.int64)
+    parts = np.asarray(columns['part'], dtype=np.int64)
+    return pd.DataFrame({
+        'row_id': positions if row_ids is None else np.asarray(row_ids)[positions],
+        'person_idx': np.asarray(columns['person_idx'], dtype=np.int32),
+        'code_type': pd.Categorical.from_codes(np.asarray(columns['code_type'], dtype=np.int8),
+                                               categories=CODE_TYPE_CATEGORIES),
+        'article': pd.Categorical.from_codes(np.asarray(columns['article'], dtype=np.int32),
+                                             categories=list(article_catalog)),
+        'part': pd.arrays.IntegerArray(parts.astype(np.int32), parts < 0),
+        'subpart': pd.Categorical.from_codes(np.asarray(columns['subpart'], dtype=np.int32),
+                                             categories=list(subpart_catalog)),
+    }, columns=LONG_TABLE_COLUMNS)
+
+
+def to_arrow(long_table):
+    """Converts a long table into a pyarrow Table with dictionary-encoded categoricals."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("pyarrow is required for the arrow output. Install it with `pip install pyarrow`.")
+    return pa.Table.from_pandas(long_table, preserve_index=False)
+
+
+def _parse_chunk(chunk, remove_duplicates, cache=None):
+    """Parse a list of charge strings."""
+    return [parse_charges(input_string, remove_duplicates, cache) for input_string in chunk]
+
+
+def _iter_chunks(strings, chunksize):
+    for start in range(0, len(strings), chunksize):
+        yield strings[start:start + chunksize]
+
 
 class ArticlesExtractor:
     """
     Extract articles, parts and subparts from legal codes:
-    
+
     - Criminal Code (Ugolovnyi Kodeks)
     - Code of Administrative Offenses (Kodeks ob Administrativnykh Pravonarusheniyakh)
-    
+
     Takes a string containing articles under which charges are filed and extracts structured
     information about the specific articles, parts and subparts referenced.
     """
-    
-    def __init__(self, remove_duplicates=True):
-        """Initialize the extractor without input string"""
+
+    def __init__(self, remove_duplicates=True, cache_size=100000, metrics=None):
+        """
+        Initialize the extractor without input string
+
+        Args:
+            remove_duplicates (bool): If True, removes duplicate article dictionaries for each person.
+            cache_size (int): Maximum number of parsed person blocks kept in the LRU cache.
+                Set to 0 or None to disable caching.
+            metrics (Metrics): Records the "articles.parse" stage of process_many (see src.metrics).
+        """
         self.input_string = None
         self.person_blocks = None
         self.remove_duplicates = remove_duplicates
+        self.cache_size = cache_size
+        self.cache = ChargeCache(cache_size, remove_duplicates) if cache_size else None
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+
+    def __getstate__(self):
+        # Copies sent to worker processes start with an empty cache; worker pools stay in this process
+        state = dict(self.__dict__)
+        state['cache'] = None
+        state.pop('_pools', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = ChargeCache(self.cache_size, self.remove_duplicates) if self.cache_size else None
+
+    def close_workers(self):
+        """Stops the worker processes kept by the "process" mode (see src.parallel.run_in_pool)."""
+        from src.parallel import close_pools
+        close_pools(self)
+
+    def version(self):
+        """Fingerprint of the parsing rules (patterns, code types, settings) for incremental processing."""
+        patterns = [pattern.pattern for pattern in (PERSON_SPLIT_PATTERN, ARTICLE_SPLIT_PATTERN, ARTICLE_PATTERN,
+                                                    PART_PATTERN, SUBPART_PATTERN, CODE_TYPE_PATTERN)]
+        return fingerprint(PARSER_VERSION, patterns, COURT_TYPES, self.remove_duplicates)
+
+    def cache_info(self):
+        """Returns hit/miss statistics of the parse cache (None if caching is disabled)."""
+        return self.cache.stats() if self.cache is not None else None
 
     def process_string(self, input_string):
-        """Process a single input string"""
-        self.input_string = input_string
-        self.person_blocks = self._divide_into_person_blocks()
-        return self.extract_info()
+        """Process a single input string. Does not modify the extractor state."""
+        return self.extract_info(self._divide_into_person_blocks(input_string))
 
-    def process_dataframe(self, df, column_name, parallel=True, n_workers=4):
+    def process_many(self, strings, mode="serial", n_workers=None, chunksize=10000, deduplicate=True,
+                     output="records"):
         """
-        Process multiple strings from a DataFrame column
+        Process a pandas Series or any iterable of charge strings.
+
+        Args:
+            strings: pandas Series or iterable of charge strings. Non-string values give None.
+            mode (str): "serial", "thread" or "process". The process mode is not GIL-bound
+                and scales with the number of cores. Its worker processes are started on the first
+                call and reused by later calls; each keeps its own cache (see close_workers).
+            n_workers (int): Number of workers for "thread" and "process" modes
+                (defaults to the number of CPUs).
+            chunksize (int): Number of strings dispatched to a worker at once.
+            deduplicate (bool): If True, each unique string is parsed only once and the result
+                is scattered back to all rows holding it (such rows share the result object).
+            output (str): "records" for nested dictionaries, "long" for a flat pandas DataFrame
+                (see build_long_table) or "arrow" for the same table as a pyarrow Table.
+                The row_id column holds the Series index or the position of the string.
+
+        Returns:
+            list: Results in input order, one per input string, or a long table.
         """
-        if parallel:
-            with ThreadPoolExecutor(max_workers=n_workers) as executor:
-                results = list(executor.map(self.process_string, df[column_name]))
-        else:
-            results = df[column_name].apply(self.process_string).tolist()
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown mode: {mode}. Use one of {EXECUTION_MODES}")
+        if output not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output: {output}. Use one of {OUTPUT_FORMATS}")
+        # A Series can only be given if pandas is imported: checking sys.modules does not import it
+        is_series = 'pandas' in sys.modules and isinstance(strings, pd.Series)
+        row_ids = strings.index if is_series else None
+        strings = strings.tolist() if is_series else list(strings)
+
+        with self.metrics.stage("articles.parse", rows=len(strings)):
+            if deduplicate:
+                unique_strings = list(dict.fromkeys(s for s in strings if isinstance(s, str)))
+                parsed = dict(zip(unique_strings, self._parse_all(unique_strings, mode, n_workers, chunksize)))
+                results = [parsed.get(s) if isinstance(s, str) else None for s in strings]
+            else:
+                results = self._parse_all(strings, mode, n_workers, chunksize)
+        if self.metrics.enabled:
+            self.metrics.skip("articles.parse", "not_text", sum(result is None for result in results))
+            self.metrics.skip("articles.parse", "no_articles", sum(
+                result is not None and not any(person['articles'] for person in result) for result in results
+            ))
+
+        if output == "records":
+            return results
+        long_table = build_long_table(results, row_ids)
+        return to_arrow(long_table) if output == "arrow" else long_table
+
+    def _parse_all(self, strings, mode, n_workers, chunksize):
+        """
+        Parses a list of strings in the given execution mode, preserving order.
+        """
+        if mode == "serial" or len(strings) <= chunksize:
+            return _parse_chunk(strings, self.remove_duplicates, self.cache)
+
+        n_workers = n_workers or os.cpu_count() or 1
+        if mode == "process":
+            from src.parallel import run_in_pool
+            return run_in_pool(self, "parse_strings", strings, n_workers, chunksize, ())
+
+        from concurrent.futures import ThreadPoolExecutor
+        results = []
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            chunk_results = executor.map(_parse_chunk, _iter_chunks(strings, chunksize),
+                                         repeat(self.remove_duplicates), repeat(self.cache))
+            for chunk_result in chunk_results:
+                results.extend(chunk_result)
         return results
 
-    def _divide_into_person_blocks(self):
+    def parse_strings(self, strings):
+        """Parses a list of charge strings with the cache of the extractor (the batch method of the worker pool)."""
+        return _parse_chunk(strings, self.remove_duplicates, self.cache)
+
+    def process_dataframe(self, df, column_name, parallel=True, n_workers=4, mode=None, chunksize=10000,
+                          deduplicate=True, output="records", incremental=False, output_column="articles"):
+        """
+        Process multiple strings from a DataFrame column. Each unique string is parsed only once.
+
+        Args:
+            mode (str): "serial", "thread" or "process". If not given, "thread" is used
+                when parallel is True and "serial" otherwise.
+            output (str): "records", "long" or "arrow" (see process_many). The row_id column
+                of the long table holds the DataFrame index.
+            incremental (bool): Store the results in df[output_column], with the content hash of the
+                input and the version of the extractor (see version) in the '<output_column>_input_hash'
+                and '<output_column>_version' columns, and return df. Only the rows whose input or
+                version differs from the stored ones are parsed. Requires the "records" output.
+        """
+        if mode is None:
+            mode = "thread" if parallel else "serial"
+        if not incremental:
+            return self.process_many(df[column_name], mode=mode, n_workers=n_workers, chunksize=chunksize,
+                                     deduplicate=deduplicate, output=output)
+        if output != "records":
+            raise ValueError(f"Incremental processing requires the records output, not {output}")
+
+        hashes = row_hashes(df, [column_name])
+        version = self.version()
+        rows = stale_rows(df, output_column, hashes, version)
+        self.metrics.count("articles.parse", "reused", len(df) - len(rows))
+        results = self.process_many(df[column_name].iloc[rows], mode=mode, n_workers=n_workers,
+                                    chunksize=chunksize, deduplicate=deduplicate)
+        update_column(df, output_column, rows, results)
+        mark_rows(df, output_column, rows, hashes, version)
+        return df
+
+    def _divide_into_person_blocks(self, input_string=None):
         """
         Divides the input string into blocks for each person.
         """
-        return re.split(r';\s*(?=[А-Я])', self.input_string)
+        if input_string is None:
+            input_string = self.input_string
+        return divide_into_person_blocks(input_string)
 
     def _extract_article_info(self, article_text):
         """
         Extracts article, part, and subpart information from a single article text.
         """
-        article_pattern = re.compile(r'ст\.\s*(\d+\.?\d*)')  # Matches article (e.g., 30 or 228.1)
-        part_pattern = re.compile(r'ч\.\s*(\d+)')  # Matches part (e.g., ч.1)
-        subpart_pattern = re.compile(r'п(?:п|\.)\.?\s*([а-я,]+)')  # Matches subparts (e.g., пп. е,ж,з or п.в)
-
-        article_match = article_pattern.search(article_text)
-        part_match = part_pattern.search(article_text)
-        subpart_match = subpart_pattern.search(article_text)
-
-        article = article_match.group(1) if article_match else None
-        part = part_match.group(1) if part_match else None
-        subpart = subpart_match.group(1) if subpart_match else None
-
-        if subpart:
-            subpart = re.sub(r'\s+', '', subpart)  # Remove spaces
-            subpart = subpart.lower()  # Convert to lowercase
-            subpart = subpart.split(',')  # Split into list
-
-        return article, part, subpart
+        return extract_article_info(article_text)
 
     def _split_articles(self, person_block):
         """
         Splits a person block into individual articles, handling commas, semicolons, and article ranges.
         """
-        articles = re.split(r'[;,]\s*(?=ст\.)', person_block)
-        expanded_articles = []
-        for article in articles:
-            if '-' in article:  # Handle article ranges
-                range_parts = article.split('-')
-                for part in range_parts:
-                    expanded_articles.append(part.strip())
-            else:
-                expanded_articles.append(article.strip())
-
-        return expanded_articles
+        return split_articles(person_block)
 
     def _extract_articles_for_person(self, person_block):
         """
         Extracts article information and code type for a single person block.
         """
-
-        court_types = {"CRIMINAL": ["УК", "Уголовного", "уголовного"],
-                       "ADMIN": ["КОАП", "об административных правонарушениях", "КоАП"],
-                       "MATERIAL": ["УПК"]}
-
-        articles = self._split_articles(person_block)
-
-        code_type_pattern = re.compile(r'(' + '|'.join([item for sublist in court_types.values() for item in sublist]) + ')')
-        code_type_match = code_type_pattern.search(person_block)
-        code_type = None
-        if code_type_match:
-            code_type = code_type_match.group(1)
-            for key, values in court_types.items():
-                if code_type in values:
-                    code_type = key
-                    break
-            else:
-                code_type = 'UNKNOWN'
-
-        articles_list = []
-        for article_text in articles:
-            article, part, subpart = self._extract_article_info(article_text)
-            if article:  # Only add if article is found
-                articles_list.append({
-                    'article': article,
-                    'part': part,
-                    'subpart': subpart
-                })
-
-        return articles_list, code_type
+        return extract_articles_for_person(person_block)
 
     def _remove_duplicate_articles(self, articles_list):
         """
         Removes duplicate article dictionaries from the list.
         """
-        unique_articles = []
-        seen = set()
-        for article in articles_list:
-            article_tuple = (
-                ('article', article['article']),
-                ('part', article['part']),
-                ('subpart', tuple(article['subpart']) if article['subpart'] else None)
-            )
-            if article_tuple not in seen:
-                seen.add(article_tuple)
-                unique_articles.append(article)
-        return unique_articles
-
-    def extract_info(self):
+        return remove_duplicate_articles(articles_list)
+
+    def extract_info(self, person_blocks=None):
         """
         Extracts legal information for all persons in the input string.
 
         Args:
-            remove_duplicates (bool): If True, removes duplicate article dictionaries for each person.
+            person_blocks (list): Person blocks to process. Defaults to self.person_blocks.
         """
-        result = []
-        for index, person_block in enumerate(self.person_blocks, start=1):
-            articles_list, code_type = self._extract_articles_for_person(person_block)
-
-            if self.remove_duplicates:
-                articles_list = self._remove_duplicate_articles(articles_list)
-
-            person_dict = {
-                'person': f'Person {index}',
-                'articles': articles_list,
-                'code_type': code_type
-            }
+        if person_blocks is None:
+            person_blocks = self.person_blocks
+        return extract_info(person_blocks, self.remove_duplicates, self.cache)
 
-            result.append(person_dict)
-
-        return result
-    
 
 if __name__ == '__main__':
     # Example 1: Single string processing
@@ -168,7 +530,7 @@ if __name__ == '__main__':
 
     # Example 2: DataFrame processing with parallel execution
     import pandas as pd
-    
+
     # Create sample DataFrame
     data = {
         'text_column': [
@@ -178,9 +540,14 @@ if __name__ == '__main__':
         ]
     }
     df = pd.DataFrame(data)
-    
+
     results = extractor.process_dataframe(df, 'text_column', parallel=True, n_workers=2)
     print("\nDataFrame processing results:")
     for i, result in enumerate(results):
         print(f"\nRow {i+1}:")
         print(result)
+
+    # Example 3: Bulk processing in a process pool
+    results = extractor.process_many(df['text_column'], mode="process", n_workers=2, chunksize=1)
+    print("\nProcess pool results:")
+    print(results)
@@ -1,52 +1,488 @@
+from __future__ import annotations
+
 import os
-import pandas as pd
+import re
+import glob
+import pickle
+import bisect
+from functools import lru_cache
+from src.incremental import file_digest, fingerprint, mark_rows, row_hashes, stale_rows, update_column
+from src.metrics import NULL_METRICS
+from src.models import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+DICT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'interim')
+DICT_FILE_PATTERN = re.compile(r'mun_court_dict_v(\d{8})\.csv$')
+DICT_COLUMNS = ['municipality', 'region', 'oktmo', 'court_name', 'court_code', 'comment']
+RESULT_COLUMNS = ['region', 'municipality', 'oktmo']
+SNAPSHOT_FORMAT_VERSION = 1  # increase when the snapshot layout changes
+DATE_CACHE_SIZE = 100000  # distinct dates whose dictionary version is memoized by get_municipality
+
+# Normalization of court names for fuzzy matching: Latin look-alike letters, ё and common abbreviations
+NAME_TRANSLATION = str.maketrans('ёaceopxykmtbh', 'еасеорхукмтвн')
+NAME_ABBREVIATIONS = [
+    (re.compile(r'\bмежр-нн?ый\b'), 'межрайонный'),
+    (re.compile(r'\bр-нн?ый\b'), 'районный'),
+    (re.compile(r'\bгор\.'), 'городской '),
+    (re.compile(r'\bобл\.'), 'области '),
+    (re.compile(r'\bресп\.'), 'республики '),
+    (re.compile(r'\bг\.|\bгорода\b'), 'г '),
+]
+NAME_SEPARATORS_PATTERN = re.compile(r'[\W_]+')
+
+# How to resolve courts that serve several municipalities (several dictionary rows per court):
+# - "first": take the first row of the dictionary
+# - "join": join the distinct values of each column with "; "
+# - "none": keep a value only if it is the same for all rows, otherwise return None
+MULTI_MUNICIPALITY_POLICIES = ('first', 'join', 'none')
+
+
+def find_dictionary_versions(dict_dir: str = DICT_DIR) -> list:
+    """Returns paths of all versions of the court dictionary in dict_dir, ordered by version date."""
+    paths = [path for path in glob.glob(os.path.join(dict_dir, 'mun_court_dict_v*.csv'))
+             if DICT_FILE_PATTERN.search(os.path.basename(path))]
+    return sorted(paths, key=dictionary_version_date)
+
+
+def dictionary_version_date(path: str) -> pd.Timestamp:
+    """
+    Returns the date from which a dictionary version is valid (the vYYYYMMDD suffix of the file name).
+    Files without a date are considered valid from the beginning.
+    """
+    match = DICT_FILE_PATTERN.search(os.path.basename(path))
+    return pd.Timestamp(match.group(1)) if match else pd.Timestamp.min
+
+
+def naive_timestamp(date) -> pd.Timestamp:
+    """
+    Converts a date (string, date, datetime, Timestamp...) to a Timestamp without time zone, keeping
+    the local wall time of time zone aware dates. Returns NaT for missing or unparseable dates.
+    """
+    date = pd.to_datetime(date, errors='coerce')
+    if not pd.isna(date) and date.tzinfo is not None:
+        date = date.tz_localize(None)
+    return date
+
+
+def read_court_dict(path: str) -> pd.DataFrame:
+    """Reads a version of the court dictionary."""
+    return pd.read_csv(path,
+                       sep=';',
+                       header=0,
+                       names=DICT_COLUMNS,
+                       dtype='string',
+                       encoding='utf-8-sig')
+
+
+def normalize_court_name(name: str) -> str:
+    """Normalizes a court name: case, ё/е, Latin look-alike letters, abbreviations, punctuation and spacing."""
+    name = name.lower().translate(NAME_TRANSLATION)
+    for pattern, replacement in NAME_ABBREVIATIONS:
+        name = pattern.sub(replacement, name)
+    return NAME_SEPARATORS_PATTERN.sub(' ', name).strip()
+
+
+def court_name_trigrams(name: str) -> set:
+    """Returns the set of character trigrams of a normalized name padded with spaces."""
+    padded = f' {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CourtNameResolver:
+    """
+    Fuzzy resolver of court names backed by a character trigram inverted index.
+
+    The score of a candidate is the Dice coefficient of the trigram sets of the normalized query
+    and the normalized dictionary name (1.0 for identical normalized names). Results for
+    normalized queries are cached.
+    """
+
+    def __init__(self, names, cache_size: int = 100000):
+        self.names = []  # first original name for each normalized name
+        self._normalized_ids = {}
+        for name in names:
+            if isinstance(name, str):
+                normalized = normalize_court_name(name)
+                if normalized not in self._normalized_ids:
+                    self._normalized_ids[normalized] = len(self.names)
+                    self.names.append(name)
+
+        postings = {}
+        sizes = np.zeros(len(self.names), dtype=np.float64)
+        for normalized, name_id in self._normalized_ids.items():
+            trigrams = court_name_trigrams(normalized)
+            sizes[name_id] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(name_id)
+        self._postings = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in postings.items()}
+        self._sizes = sizes
+        self._search = lru_cache(maxsize=cache_size)(self._search_normalized)
+
+    def _search_normalized(self, normalized: str) -> tuple:
+        name_id = self._normalized_ids.get(normalized)
+        if name_id is not None:
+            return self.names[name_id], 1.0
+
+        trigrams = court_name_trigrams(normalized)
+        matched_postings = [self._postings[trigram] for trigram in trigrams if trigram in self._postings]
+        if not matched_postings:
+            return None, 0.0
+        shared = np.bincount(np.concatenate(matched_postings), minlength=len(self.names))
+        scores = 2 * shared / (len(trigrams) + self._sizes)
+        best = int(np.argmax(scores))
+        return self.names[best], float(scores[best])
+
+    def resolve(self, name: str) -> tuple:
+        """Returns (dictionary name, score) of the best match, or (None, 0.0) if nothing matches."""
+        if not isinstance(name, str):
+            return None, 0.0
+        return self._search(normalize_court_name(name))
+
+    def resolve_many(self, names) -> list:
+        """Resolves an iterable of names, searching each distinct name only once."""
+        resolved = {}
+        results = []
+        for name in names:
+            if name not in resolved:
+                resolved[name] = self.resolve(name)
+            results.append(resolved[name])
+        return results
+
+    def cache_info(self):
+        """Returns the statistics of the normalized query cache."""
+        return self._search.cache_info()
+
 
 class MunicipalityExtractor:
     """
-    Based on the curated dictionary of territorial jurisdiction for each district court, determine 
+    Based on the curated dictionary of territorial jurisdiction for each district court, determine
     the region and municipality in which the court operates.
 
     The extractor accounts for:
-    - Courts serving multiple municipalities
+    - Courts serving multiple municipalities (see multi_municipality)
     - Large municipalities having several district courts
+    - Changes of jurisdiction over time: all versions of the dictionary are loaded, and each
+      version is valid from its date until the date of the next one
 
     Returns:
         For each court code, returns a tuple of (region, municipality, oktmo)
     """
 
-    def __init__(self, use_name: bool = False, dict_path: str = None):
+    def __init__(self, use_name: bool = False, dict_path=None, multi_municipality: str = 'first',
+                 snapshot_path: str = None, fallback: bool = True, fuzzy: bool = False,
+                 min_score: float = 0.8, metrics=None):
+        """
+        Args:
+            use_name (bool): Use court names instead of court codes as identifiers.
+            dict_path (str or list): Path or list of paths of dictionary versions. Defaults to all
+                mun_court_dict_vYYYYMMDD.csv files in data/interim.
+            multi_municipality (str): Policy for courts serving several municipalities.
+            snapshot_path (str): Optional path of a compiled binary snapshot. It is loaded if it was
+                built from the same dictionary files and settings, otherwise it is (re)written.
+            fallback (bool): If a court is missing in the version valid at the given date, use the
+                latest version that contains it.
+            fuzzy (bool): With use_name, resolve court names missing in the dictionary to the most
+                similar dictionary name (see CourtNameResolver).
+            min_score (float): Minimal similarity score for a fuzzy match.
+            metrics (Metrics): Records the "districts.lookup" and "districts.fuzzy_match" stages
+                (see src.metrics).
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
         self.use_name = use_name
         self.court_identifier = 'court_name' if self.use_name else 'court_code'
-        
+        self.fallback = fallback
+
+        if multi_municipality not in MULTI_MUNICIPALITY_POLICIES:
+            raise ValueError(f"Unknown multi_municipality policy: {multi_municipality}. "
+                             f"Use one of {MULTI_MUNICIPALITY_POLICIES}")
+        self.multi_municipality = multi_municipality
+
         if dict_path is None:
-            # Default path relative to the project root
-            dict_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'interim', 'mun_court_dict_v20250424.csv')
-            
-        if not os.path.exists(dict_path):
-            raise FileNotFoundError(f"Dictionary file not found at: {dict_path}")
-            
-        self.court_dict = pd.read_csv(dict_path,
-                            sep=';', 
-                            names=['municipality', 'region', 'oktmo', 'court_name', 'court_code', 'comment'],
-                            dtype='string')
-        
-    def get_municipality(self, court_id: str) -> tuple:
-        
-        match = self.court_dict[self.court_dict[self.court_identifier] == court_id]
-        
-        if len(match) == 0:
-            print("Check if is court code is correct")
-            return None, None, None
-            
-        row = match.iloc[0]
-        return row['region'], row['municipality'], row['oktmo']
-
-    def process_dataframe(self, df: pd.DataFrame, code_column: str) -> pd.DataFrame:
-        df[['region', 'municipality', 'oktmo']] = df[code_column].apply(
-            lambda x: pd.Series(self.get_municipality(x))
-        )
+            dict_paths = find_dictionary_versions()
+        elif isinstance(dict_path, (str, os.PathLike)):
+            dict_paths = [dict_path]
+        else:
+            dict_paths = sorted(dict_path, key=dictionary_version_date)
+
+        if not dict_paths:
+            raise FileNotFoundError(f"No dictionary files found in: {DICT_DIR}")
+        for path in dict_paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Dictionary file not found at: {path}")
+        self.dict_paths = [str(path) for path in dict_paths]
+
+        snapshot = self._load_snapshot(snapshot_path) if snapshot_path else None
+        if snapshot is None:
+            snapshot = self._compile()
+            if snapshot_path:
+                self.save_snapshot(snapshot_path, snapshot)
+        self._apply_snapshot(snapshot)
+
+        self.min_score = min_score
+        self.name_resolver = CourtNameResolver(self.fallback_table.index) if (fuzzy and use_name) else None
+
+        self.misses = set()
+        self.miss_count = 0
+        self._version = None
+
+    def version(self) -> str:
+        """
+        Fingerprint of the content and dates of the dictionary versions and of the lookup settings,
+        for incremental processing.
+        """
+        if self._version is None:
+            dictionaries = [(os.path.basename(path), file_digest(path)) for path in self.dict_paths]
+            self._version = fingerprint(dictionaries, self.court_identifier, self.multi_municipality, self.fallback,
+                                        self.name_resolver is not None, self.min_score)
+        return self._version
+
+    def _sources(self) -> list:
+        """Fingerprint of the dictionary files and settings the structure is built from."""
+        sources = [(os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)) for path in self.dict_paths]
+        return [sources, self.court_identifier, self.multi_municipality]
+
+    def _compile(self) -> dict:
+        """Reads all dictionary versions and builds the lookup structure."""
+        court_dicts = [read_court_dict(path) for path in self.dict_paths]
+        court_tables = [self._build_court_table(court_dict) for court_dict in court_dicts]
+
+        # For each court the latest version containing it, used as a fallback
+        fallback_table = pd.concat(court_tables[::-1])
+        fallback_table = fallback_table[~fallback_table.index.duplicated(keep='first')]
+
+        return {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'sources': self._sources(),
+            'version_dates': [dictionary_version_date(path) for path in self.dict_paths],
+            'court_dict': court_dicts[-1],
+            'court_tables': court_tables,
+            'fallback_table': fallback_table,
+            'court_indexes': [self._build_court_index(table) for table in court_tables],
+            'fallback_index': self._build_court_index(fallback_table),
+        }
+
+    def _apply_snapshot(self, snapshot: dict):
+        self.version_dates = snapshot['version_dates']
+        self.court_tables = snapshot['court_tables']
+        self.fallback_table = snapshot['fallback_table']
+        # Latest version, as used by lookups without a date
+        self.court_dict = snapshot['court_dict']
+        self.court_table = self.court_tables[-1]
+
+        self._version_starts = np.array([date.value for date in self.version_dates], dtype=np.int64)
+        self._version_start_values = self._version_starts.tolist()
+        self._date_versions = {}
+        self.court_indexes = snapshot['court_indexes']
+        self.court_index = self.court_indexes[-1]
+        self.fallback_index = snapshot['fallback_index']
+
+    def _load_snapshot(self, snapshot_path: str):
+        """Loads a compiled snapshot, or returns None if it is missing, unreadable or outdated."""
+        if not os.path.exists(snapshot_path):
+            return None
+        try:
+            with open(snapshot_path, 'rb') as file:
+                snapshot = pickle.load(file)
+        except Exception:
+            # Corrupt files, and snapshots pickled by other versions of pandas/numpy or of this module
+            # (ModuleNotFoundError, AttributeError, ImportError, TypeError...) are rebuilt
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('format_version') != SNAPSHOT_FORMAT_VERSION \
+                or snapshot.get('sources') != self._sources():
+            return None
+        return snapshot
+
+    def save_snapshot(self, snapshot_path: str, snapshot: dict = None):
+        """Writes the compiled lookup structure to a binary snapshot file."""
+        if snapshot is None:
+            snapshot = {
+                'format_version': SNAPSHOT_FORMAT_VERSION,
+                'sources': self._sources(),
+                'version_dates': self.version_dates,
+                'court_dict': self.court_dict,
+                'court_tables': self.court_tables,
+                'fallback_table': self.fallback_table,
+                'court_indexes': self.court_indexes,
+                'fallback_index': self.fallback_index,
+            }
+        tmp_path = f"{snapshot_path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+
+    def _build_court_table(self, court_dict: pd.DataFrame) -> pd.DataFrame:
+        """
+        Builds a table with one row per court identifier, resolving courts with several
+        municipalities according to the multi_municipality policy.
+        """
+        court_dict = court_dict.dropna(subset=[self.court_identifier])
+        grouped = court_dict.groupby(self.court_identifier, sort=False)[RESULT_COLUMNS]
+
+        if self.multi_municipality == 'first':
+            return grouped.first()
+        if self.multi_municipality == 'join':
+            return grouped.agg(lambda values: '; '.join(values.dropna().unique()) or pd.NA).astype('string')
+        return grouped.agg(lambda values: values.iloc[0] if values.nunique(dropna=False) == 1 else pd.NA).astype('string')
+
+    @staticmethod
+    def _build_court_index(court_table: pd.DataFrame) -> dict:
+        return {
+            court_id: tuple(None if pd.isna(value) else value for value in values)
+            for court_id, *values in court_table.itertuples(name=None)
+        }
+
+    def _version_for(self, date) -> int:
+        """
+        Returns the index of the dictionary version valid at the given date (latest if date is missing).
+        Versions of dates already seen are looked up in a dict, without converting the date again.
+        """
+        try:
+            return self._date_versions[date]
+        except (KeyError, TypeError):
+            pass
+        timestamp = naive_timestamp(date)
+        if pd.isna(timestamp):
+            return len(self.version_dates) - 1
+        version = max(bisect.bisect_right(self._version_start_values, timestamp.as_unit('ns').value) - 1, 0)
+        try:
+            if len(self._date_versions) >= DATE_CACHE_SIZE:
+                self._date_versions.clear()
+            self._date_versions[date] = version
+        except TypeError:
+            pass
+        return version
+
+    def get_municipality(self, court_id: str, date=None) -> tuple:
+        """
+        Returns (region, municipality, oktmo) for the given court identifier,
+        or (None, None, None) if the court is not in the dictionary.
+
+        Args:
+            date: Decision date. The dictionary version valid at this date is used
+                (the latest one if no date is given).
+        """
+        with self.metrics.stage("districts.lookup"):
+            index = self.court_index if date is None else self.court_indexes[self._version_for(date)]
+            if self.name_resolver is not None and court_id not in self.fallback_index:
+                court_id = self.resolve_name(court_id)
+            result = index.get(court_id)
+            if result is None and self.fallback:
+                result = self.fallback_index.get(court_id)
+                self.metrics.count("districts.lookup", "fallback", int(result is not None))
+        if result is None:
+            self.metrics.skip("districts.lookup", "unknown_court" if isinstance(court_id, str) else "missing_code")
+        return result if result is not None else (None, None, None)
+
+    def resolve_name(self, court_name: str):
+        """
+        Returns the dictionary court name most similar to the given one, or the given name
+        if there is no match with a score of at least min_score.
+        """
+        with self.metrics.stage("districts.fuzzy_match"):
+            matched, score = self.name_resolver.resolve(court_name)
+        self.metrics.count("districts.fuzzy_match", "matched" if score >= self.min_score else "unmatched")
+        return matched if score >= self.min_score else court_name
+
+    def process_dataframe(self, df: pd.DataFrame, code_column: str, date_column: str = None,
+                          return_misses: bool = False, incremental: bool = False):
+        """
+        Adds columns 'region', 'municipality', 'oktmo' to the given dataframe with a hash join
+        against the dictionary version valid at the decision date of each row.
+
+        Identifiers not found in the dictionary are stored in self.misses (set of identifiers)
+        and self.miss_count (number of rows).
+
+        Args:
+            date_column (str): Column with decision dates. If not given, or for missing dates,
+                the latest version of the dictionary is used.
+            return_misses (bool): If True, returns a tuple (df, misses).
+            incremental (bool): Store the content hash of the code and date columns and the version
+                of the extractor (see version) in the 'municipality_input_hash' and
+                'municipality_version' columns, and only look up the rows whose input or version
+                differs from the stored ones. Misses are then counted for these rows only.
+        """
+        if incremental:
+            input_columns = [code_column] + ([date_column] if date_column else [])
+            hashes = row_hashes(df, input_columns)
+            version = self.version()
+            rows = stale_rows(df, 'municipality', hashes, version)
+            self.metrics.count("districts.lookup", "reused", len(df) - len(rows))
+            stale = df[input_columns].iloc[rows].reset_index(drop=True)
+            self.process_dataframe(stale, code_column, date_column)
+            for column in RESULT_COLUMNS:
+                update_column(df, column, rows, stale[column].tolist(), 'string')
+            mark_rows(df, 'municipality', rows, hashes, version)
+            return (df, self.misses) if return_misses else df
+
+        with self.metrics.stage("districts.lookup", rows=len(df)):
+            fallback_count = self._join(df, code_column, date_column)
+        if self.metrics.enabled:
+            self.metrics.count("districts.lookup", "fallback", fallback_count)
+            self.metrics.skip("districts.lookup", "unknown_court", self.miss_count)
+            self.metrics.skip("districts.lookup", "missing_code", int(df[code_column].isna().sum()))
+
+        if return_misses:
+            return df, self.misses
         return df
 
+    def _join(self, df: pd.DataFrame, code_column: str, date_column: str = None) -> int:
+        """Adds the result columns to df and returns the number of rows found only in the fallback."""
+        original_ids = court_ids = df[code_column]
+        if self.name_resolver is not None:
+            unknown = court_ids.notna() & ~court_ids.isin(self.fallback_table.index)
+            if unknown.any():
+                mapping = {name: self.resolve_name(name) for name in court_ids[unknown].unique()}
+                court_ids = court_ids.mask(unknown, court_ids[unknown].map(mapping))
+        versions = self._versions_for_column(df[date_column]) if date_column else \
+            np.full(len(df), len(self.court_tables) - 1)
+
+        result = pd.DataFrame(index=range(len(df)), columns=RESULT_COLUMNS, dtype='string')
+        found = np.zeros(len(df), dtype=bool)
+        for version in np.unique(versions):
+            rows = np.flatnonzero(versions == version)
+            table = self.court_tables[version]
+            ids = court_ids.iloc[rows]
+            matched = table.reindex(ids.to_numpy())
+            result.iloc[rows] = matched.to_numpy()
+            found[rows] = ids.isin(table.index).to_numpy()
+
+        fallback_count = 0
+        if self.fallback and not found.all():
+            rows = np.flatnonzero(~found)
+            ids = court_ids.iloc[rows]
+            result.iloc[rows] = self.fallback_table.reindex(ids.to_numpy()).to_numpy()
+            found[rows] = ids.isin(self.fallback_table.index).to_numpy()
+            fallback_count = int(found[rows].sum())
+
+        for column in RESULT_COLUMNS:
+            df[column] = result[column].array
+
+        not_found = court_ids.notna().to_numpy() & ~found
+        self.misses = set(original_ids[not_found])
+        self.miss_count = int(not_found.sum())
+        return fallback_count
+
+    def _versions_for_column(self, dates: pd.Series) -> np.ndarray:
+        """
+        Returns the index of the valid dictionary version for each date of the column. Time zone aware
+        dates are compared by their local wall time.
+        """
+        try:
+            dates = pd.to_datetime(dates, errors='coerce')
+        except ValueError:
+            # Dates in different time zones
+            dates = pd.Series([naive_timestamp(date) for date in dates], index=dates.index, dtype='datetime64[ns]')
+        if isinstance(dates.dtype, pd.DatetimeTZDtype):
+            dates = dates.dt.tz_localize(None)
+        values = dates.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        versions = np.searchsorted(self._version_starts, values, side='right') - 1
+        versions = np.clip(versions, 0, None)
+        versions[dates.isna().to_numpy()] = len(self.court_tables) - 1
+        return versions
+
 if __name__ == '__main__':
     extractor = MunicipalityExtractor()
     print(extractor.get_municipality("61RS0006"))
+    print(extractor.get_municipality("22RS0040", date="2025-03-01"))
@@ -1,23 +1,239 @@
-from natasha import Segmenter, Doc, NamesExtractor, MorphVocab, PER, NewsMorphTagger, NewsSyntaxParser, NewsEmbedding, NewsNERTagger
-from russiannames.parser import NamesParser
-import pymorphy2
-from pytrovich.detector import PetrovichGenderDetector
 from collections import defaultdict
+import bisect
 import difflib
+import json
+import os
 import re
+import numpy as np
+from src.incremental import fingerprint
+from src.metrics import NULL_METRICS
+from src.models import LazyModule, get_model, registry
+
+natasha = LazyModule('natasha')
+
+FUZZY_NAME_THRESHOLD = 0.88
+NAME_HISTOGRAM_SIZE = 64  # Cyrillic А-я occupy 64 consecutive code points, so they get separate bins
+
+
+def name_histogram(name):
+    """Character histogram of a name, used to bound SequenceMatcher ratios from above."""
+    return np.bincount([ord(char) % NAME_HISTOGRAM_SIZE for char in name], minlength=NAME_HISTOGRAM_SIZE)
+
+
+# Anchors of the places where names of defendants and judges are found, with the number of
+# characters taken before and after each match
+FOCUS_ANCHORS = [
+    (re.compile(r'признать\s+виновн', re.IGNORECASE), 200, 300),  # "Иванова И.И. признать виновным..."
+    (re.compile(r'\s[-–—]\s*ст\.\s*\d'), 120, 40),  # charge lines "ФИО - ст.159 ч.2 УК РФ"
+]
+JUDGE_ANCHOR = (re.compile(r'судь(?:я|и|е|ей|ю)\b', re.IGNORECASE), 40, 120)  # "председательствующего судьи Иванова И.И."
+JUDGE_HEADER_LENGTH = 3000  # the judge is searched in the header of the decision only
+WHITESPACE_PATTERN = re.compile(r'\s')
+
+
+def candidate_windows(text):
+    """
+    Returns the parts of the text around the focus anchors (merged and in text order),
+    or an empty list if no anchor is found.
+    """
+    spans = []
+    for pattern, before, after in FOCUS_ANCHORS:
+        for match in pattern.finditer(text):
+            spans.append((max(match.start() - before, 0), match.end() + after))
+    pattern, before, after = JUDGE_ANCHOR
+    for match in pattern.finditer(text, 0, JUDGE_HEADER_LENGTH):
+        spans.append((max(match.start() - before, 0), match.end() + after))
+
+    windows = []
+    for start, end in sorted(spans):
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+
+    parts = []
+    for start, end in windows:
+        # Do not cut words at the window boundaries
+        while start > 0 and not WHITESPACE_PATTERN.match(text[start - 1]):
+            start -= 1
+        while end < len(text) and not WHITESPACE_PATTERN.match(text[end]):
+            end += 1
+        parts.append(text[start:end])
+    return parts
+
+
+class GenderTable:
+    """
+    Lookup table from normalized (first name, patronymic, surname) to the final gender
+    (M/F/U/C) determined by the detectors of GenderExtractor.
+
+    The table works as a memoizing cache in front of pytrovich/russiannames: the detectors only
+    run for combinations that are not in the table yet. It can be precomputed from a list of
+    names and saved to a JSON file, so that the warm table survives restarts.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, surname_suffix_length=0):
+        """
+        Args:
+            surname_suffix_length (int): Number of trailing letters of the surname used in the key
+                (0 for the whole surname). pytrovich decides by surname exceptions and by endings of
+                up to several letters, so keys of short endings can return the gender of another
+                surname with the same ending ("Бова" after "Иванова"): the table then no longer
+                gives the same results as the detectors.
+        """
+        self.surname_suffix_length = surname_suffix_length
+        self.genders = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(word):
+        return word.strip().lower().replace('ё', 'е')
+
+    def key(self, first_name, last_name, middle_name, russian_names_db=False):
+        """Returns the table key for a name (the detector set is a part of the key)."""
+        last_name = self._normalize(last_name)
+        if self.surname_suffix_length:
+            last_name = last_name[-self.surname_suffix_length:]
+        return '|'.join(['rn' if russian_names_db else 'ph', self._normalize(first_name),
+                         self._normalize(middle_name), last_name])
+
+    def get(self, key):
+        gender = self.genders.get(key)
+        if gender is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return gender
+
+    def set(self, key, gender):
+        self.genders[key] = gender
+
+    def stats(self):
+        """Returns hit/miss statistics of the table."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.genders),
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def save(self, path):
+        """Saves the table to a JSON file."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': self.FORMAT_VERSION,
+                       'surname_suffix_length': self.surname_suffix_length,
+                       'genders': self.genders}, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a table saved with save()."""
+        with open(path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        if data.get('version') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported gender table version: {data.get('version')}")
+        table = cls(surname_suffix_length=data['surname_suffix_length'])
+        table.genders = data['genders']
+        return table
+
 
 class GenderExtractor:
-    def __init__(self, russian_names_db = False):
-        self.segmenter = Segmenter()
-        self.names_extractor = NamesExtractor(morph=MorphVocab())
-        self.morph_analyzer = pymorphy2.MorphAnalyzer()
-        self.russian_names_db = NamesParser()
-        self.emb = NewsEmbedding()
-        self.syntax_parser = NewsSyntaxParser(self.emb)
-        self.ner_tagger = NewsNERTagger(self.emb)
-        self.morph_vocab = MorphVocab()
-        self.morph_tagger = NewsMorphTagger(self.emb)
+    """
+    Extract people names from a text and determine their gender.
+
+    Heavy resources (Natasha models, pymorphy2, pytrovich, russiannames) are taken from the
+    process-wide registry in src.models: each of them is loaded once, on first use, and shared
+    by all extractor instances.
+    """
+
+    # Registry resources used by the extractor
+    MODEL_NAMES = ['natasha_segmenter', 'natasha_names_extractor', 'natasha_morph_vocab', 'natasha_embedding',
+                   'natasha_morph_tagger', 'natasha_syntax_parser', 'natasha_ner_tagger', 'pytrovich_detector']
+
+    def __init__(self, russian_names_db = False, gender_table=None, focus=False, focus_fallback=True, metrics=None):
+        """
+        Args:
+            russian_names_db (bool): Use russiannames (requires MongoDB) in addition to pytrovich.
+            gender_table (GenderTable or str): Table of already detected genders, or path of a saved
+                table (a new one is created if the file does not exist). Defaults to an empty table.
+            focus (bool): Run NER only on the windows of the text around the "признать виновным"
+                sentences, the "ФИО - ст." charge lines and the judge line of the header
+                (see candidate_windows) instead of the whole text.
+            focus_fallback (bool): In focus mode, tag the whole text if no names are found in the windows.
+            metrics (Metrics): Records the "gender.ner", "gender.canonical" and "gender.detect" stages
+                (see src.metrics).
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
         self.russian_names_db = russian_names_db
+        self.focus = focus
+        self.focus_fallback = focus_fallback
+        self.gender_table_path = None
+        if isinstance(gender_table, (str, os.PathLike)):
+            self.gender_table_path = gender_table
+            gender_table = GenderTable.load(gender_table) if os.path.exists(gender_table) else None
+        self.gender_table = gender_table if gender_table is not None else GenderTable()
+
+    def __getstate__(self):
+        # Worker pools of the *_many methods stay in this process
+        state = dict(self.__dict__)
+        state.pop('_pools', None)
+        return state
+
+    def version(self):
+        """Fingerprint of the models and settings of the extractor, for incremental processing."""
+        return fingerprint(self.MODEL_NAMES, self.russian_names_db, self.focus, self.focus_fallback)
+
+    def close_workers(self):
+        """Stops the worker processes kept by the *_many methods called with n_workers."""
+        from src.parallel import close_pools
+        close_pools(self)
+
+    @staticmethod
+    def warm_up():
+        """Loads all resources used by the extractor and returns their load statistics."""
+        names = GenderExtractor.MODEL_NAMES
+        return {name: stats for name, stats in registry.warm_up(names).items() if name in names}
+
+    @property
+    def segmenter(self):
+        return get_model('natasha_segmenter')
+
+    @property
+    def names_extractor(self):
+        return get_model('natasha_names_extractor')
+
+    @property
+    def morph_analyzer(self):
+        return get_model('pymorphy2_analyzer')
+
+    @property
+    def emb(self):
+        return get_model('natasha_embedding')
+
+    @property
+    def syntax_parser(self):
+        return get_model('natasha_syntax_parser')
+
+    @property
+    def ner_tagger(self):
+        return get_model('natasha_ner_tagger')
+
+    @property
+    def morph_vocab(self):
+        return get_model('natasha_morph_vocab')
+
+    @property
+    def morph_tagger(self):
+        return get_model('natasha_morph_tagger')
+
+    @property
+    def names_parser(self):
+        return get_model('russiannames_parser')
 
     @staticmethod
     def get_full_name(info):
@@ -33,60 +249,232 @@ class GenderExtractor:
             self.get_initials_from_full(name1) == self.get_initials_from_full(name2)
         )
 
+    def initials_key(self, info):
+        """Blocking key of the initials-based match: surname and initials."""
+        return info.get('last'), self.get_initials_from_full(info)
+
     def extract_canonical(self, names_dict):
-        canonical_map = {}  # full name → component dict
+        """
+        Groups name variants (e.g. different grammatical cases) under canonical full names.
+
+        A name joins the first canonical name, in order of appearance, that has 1) the same full
+        name, 2) the same surname and initials or 3) a SequenceMatcher ratio above 0.88 with it.
+        Rules 1 and 2 are looked up in hash buckets. For rule 3, canonical names are pruned with
+        an upper bound of the ratio computed from character histograms, so SequenceMatcher only
+        runs for a few candidates. The result is the same as comparing with every canonical name.
+        """
+        with self.metrics.stage("gender.canonical", rows=len(names_dict)):
+            return self._extract_canonical(names_dict)
+
+    def _extract_canonical(self, names_dict):
+        canonical_map = {}  # full name → index of the canonical name
+        canon_names = []
+        initials_buckets = defaultdict(list)  # (surname, initials) → ascending canonical indices
+        canon_keys = []
+        histograms = np.zeros((len(names_dict), NAME_HISTOGRAM_SIZE), dtype=np.int64)
+        lengths = np.zeros(len(names_dict), dtype=np.int64)
         reverse_map = defaultdict(list)  # full name → [original name variants]
 
         for raw_name, components in names_dict.items():
             full = self.get_full_name(components)
-            matched = None
-
-            for canon_name, canon_comp in canonical_map.items():
-                # 1. Exact full name match
-                if full == canon_name:
-                    matched = canon_name
-                    break
-                # 2. Initials-based match
-                elif self.match_by_initials(canon_comp, components):
-                    matched = canon_name
-                    break
-                # 3. Fuzzy full name match
-                elif difflib.SequenceMatcher(None, self.get_full_name(canon_comp), full).ratio() > 0.88:
-                    matched = canon_name
-                    break
+            key = self.initials_key(components)
+
+            # Earliest canonical name matched by rules 1 or 2
+            first_match = len(canon_names)
+            if full in canonical_map:
+                first_match = canonical_map[full]
+            bucket = initials_buckets.get(key)
+            if bucket and bucket[0] < first_match:
+                first_match = bucket[0]
+
+            # Rule 3 can only change the result for earlier canonical names
+            histogram = name_histogram(full)
+            if first_match:
+                shared = np.minimum(histograms[:first_match], histogram).sum(axis=1)
+                upper_bounds = 2.0 * shared / np.maximum(lengths[:first_match] + len(full), 1)
+                for index in np.flatnonzero(upper_bounds > FUZZY_NAME_THRESHOLD - 1e-9):
+                    if difflib.SequenceMatcher(None, canon_names[index], full).ratio() > FUZZY_NAME_THRESHOLD:
+                        first_match = int(index)
+                        break
 
+            matched = canon_names[first_match] if first_match < len(canon_names) else None
             if matched:
                 reverse_map[matched].append(raw_name)
+                continue
+
+            if full in canonical_map:
+                # Only the empty name can get here: its components are replaced
+                index = canonical_map[full]
+                initials_buckets[canon_keys[index]].remove(index)
+                bisect.insort(initials_buckets[key], index)
+                canon_keys[index] = key
             else:
-                canonical_map[full] = components
-                reverse_map[full].append(raw_name)
+                index = len(canon_names)
+                canonical_map[full] = index
+                canon_names.append(full)
+                canon_keys.append(key)
+                initials_buckets[key].append(index)
+                histograms[index] = histogram
+                lengths[index] = len(full)
+            reverse_map[full].append(raw_name)
 
         return reverse_map
 
-    def extract_names(self, text, canonical=False):
-        """Extract names from the input text using Natasha."""
+    def _tag_names(self, text, morph=True, syntax=True):
+        """
+        Returns normalized PER spans with their name facts, tagging either the whole text
+        or, in focus mode, only the candidate windows.
+        """
+        return self._tag_names_many([text], morph, syntax)[0]
+
+    def _tag_names_many(self, texts, morph=True, syntax=True):
+        """
+        Batch version of _tag_names: returns the normalized PER spans with their name facts of each
+        text, in input order.
+        """
+        with self.metrics.stage("gender.ner", rows=len(texts)):
+            if not self.focus:
+                return self._tag_texts(texts, morph, syntax)
+
+            windows = [candidate_windows(text) for text in texts]
+            names = [{} for _ in texts]
+            focused = [position for position, text_windows in enumerate(windows) if text_windows]
+            tagged = self._tag_texts(['\n'.join(windows[position]) for position in focused], morph, syntax)
+            for position, text_names in zip(focused, tagged):
+                names[position] = text_names
+            if self.focus_fallback:
+                missing = [position for position, text_names in enumerate(names) if not text_names]
+                self.metrics.count("gender.ner", "focus_fallback", len(missing))
+                for position, text_names in zip(missing, self._tag_texts([texts[_] for _ in missing], morph, syntax)):
+                    names[position] = text_names
+            return names
+
+    def _tag_text(self, text, morph=True, syntax=True):
+        """
+        Runs the selected stages of the Natasha pipeline over a single text and returns
+        normalized PER spans with their name facts (see _tag_texts).
+        """
+        return self._tag_texts([text], morph, syntax)[0]
+
+    def _tag_texts(self, texts, morph=True, syntax=True):
+        """
+        Runs the selected stages of the Natasha pipeline over a batch of texts and returns
+        normalized PER spans with their name facts for each of them.
+
+        Segmentation and NER always run. Without morph tagging, spans are not normalized
+        (their text is used as is), without syntax parsing the dependency parse is skipped.
+
+        The sentences of all texts go through the morph tagger and the syntax parser in one
+        .map call, and the texts through the NER tagger in another, so the models fill their
+        batches across documents; the results are then split back per document. This is what
+        Doc.tag_morph, Doc.parse_syntax and Doc.tag_ner do for one document, and the results
+        are the same.
+        """
+        docs = [natasha.Doc(text) for text in texts]
+        for doc in docs:
+            doc.segment(self.segmenter)
+        sents = [sent for doc in docs for sent in doc.sents]
+
+        if morph:
+            markups = self.morph_tagger.map([natasha.doc.sent_words(sent) for sent in sents])
+            for sent, markup in zip(sents, markups):
+                natasha.doc.inject_morph(sent.tokens, markup.tokens)
+        if syntax:
+            markups = self.syntax_parser.map([natasha.doc.sent_words(sent) for sent in sents])
+            for doc in docs:
+                for sent_id, (sent, markup) in enumerate(zip(doc.sents, markups), 1):
+                    natasha.doc.inject_syntax(sent.tokens, markup.tokens)
+                    natasha.doc.offset_syntax(sent_id, sent.tokens)
 
-        doc_pr = Doc(text)
-        doc_pr.segment(self.segmenter)
+        for doc in docs:
+            doc.spans = []
+        tagged = [doc for doc in docs if doc.text.strip()]
+        for doc, markup in zip(tagged, self.ner_tagger.map([doc.text for doc in tagged])):
+            doc.spans = list(natasha.doc.adapt_spans(doc, markup.spans))
+        for doc in docs:
+            doc.envelop_span_tokens()
+            doc.envelop_sent_spans()
 
-        doc_pr.tag_morph(self.morph_tagger)
-        doc_pr.parse_syntax(self.syntax_parser)
-        doc_pr.tag_ner(self.ner_tagger)
-        
-        for span in doc_pr.spans:
-            if span.type == PER:
-                span.normalize(self.morph_vocab)
-                span.extract_fact(self.names_extractor)
+        results = []
+        for doc in docs:
+            for span in doc.spans:
+                if span.type == natasha.PER:
+                    if morph:
+                        span.normalize(self.morph_vocab)
+                    else:
+                        span.normal = span.text
+                    span.extract_fact(self.names_extractor)
+            results.append({_.normal: _.fact.as_dict for _ in doc.spans if _.fact})
+        return results
 
+    def extract_names(self, text, canonical=False, morph=True, syntax=True):
+        """
+        Extract names from the input text using Natasha.
+
+        Args:
+            morph (bool): Run morphological tagging (needed to normalize names to the nominative case).
+            syntax (bool): Run syntax parsing. It is the most expensive stage of the pipeline.
+        """
+        names = self._tag_names(text, morph=morph, syntax=syntax)
         if canonical:
-            return self.extract_canonical({_.normal: _.fact.as_dict for _ in doc_pr.spans if _.fact})
+            return self.extract_canonical(names)
         else:
-            return {_.normal: _.fact.as_dict for _ in doc_pr.spans if _.fact}
+            return names
+
+    def iter_names(self, texts, canonical=False, morph=True, syntax=True, batch_size=256):
+        """
+        Streams documents through the Natasha pipeline and yields the result of extract_names
+        for each of them, in input order.
+
+        Texts are read in batches of batch_size and each batch is tagged in one pass (see _tag_texts);
+        identical texts within a batch are tagged once. Non-string values give empty results.
+        """
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                yield from self._extract_names_batch(batch, canonical, morph, syntax)
+                batch = []
+        if batch:
+            yield from self._extract_names_batch(batch, canonical, morph, syntax)
+
+    def _extract_names_batch(self, texts, canonical, morph, syntax):
+        unique = list(dict.fromkeys(text for text in texts if isinstance(text, str)))
+        self.metrics.skip("gender.ner", "not_text", len(texts) - sum(isinstance(text, str) for text in texts))
+        tagged = dict(zip(unique, self._tag_names_many(unique, morph=morph, syntax=syntax))) if unique else {}
+
+        for text in texts:
+            if not isinstance(text, str):
+                yield {}
+                continue
+            names = tagged[text]
+            yield self.extract_canonical(names) if canonical else dict(names)
+
+    def extract_names_many(self, texts, canonical=False, morph=True, syntax=True, batch_size=256, n_workers=None):
+        """
+        Extract names from many texts (a list, pandas Series or any iterable).
+
+        Stages that are not needed can be switched off, e.g. syntax=False skips dependency
+        parsing, which PER extraction does not use and which dominates the tagging time.
+
+        Args:
+            n_workers (int): Tag the texts in this many worker processes. The pool is started on the
+                first call and reused by later calls (see src.parallel.run_in_pool and close_workers).
+
+        Returns:
+            list: Per-document results of extract_names, in input order.
+        """
+        if n_workers and n_workers > 1:
+            from src.parallel import run_in_pool
+            return run_in_pool(self, 'extract_names_many', texts, n_workers, batch_size, self.MODEL_NAMES,
+                               canonical=canonical, morph=morph, syntax=syntax, batch_size=batch_size)
+        return list(self.iter_names(texts, canonical=canonical, morph=morph, syntax=syntax,
+                                    batch_size=batch_size))
     
     def detect_gender_with_pytrovich(self, f_name, l_name, m_name):
         """Detect gender using pytrovich library."""
 
-        detector = PetrovichGenderDetector()
+        detector = get_model('pytrovich_detector')
         try:
             result = detector.detect(firstname=f_name, lastname=l_name, middlename=m_name)
             return result.name[:1]
@@ -96,7 +484,7 @@ class GenderExtractor:
     def detect_gender_with_russiannames(self, person_name):
         """Detect gender using russiannames."""
 
-        name_info = self.russian_names_db.parse(person_name)
+        name_info = self.names_parser.parse(person_name)
         if name_info:
             if "gender" in name_info.keys():
                  return name_info["gender"].upper()
@@ -105,6 +493,57 @@ class GenderExtractor:
         else:
             return "U"
 
+    def detect_gender(self, first_name, last_name, middle_name):
+        """
+        Detect gender of a person, looking it up in the gender table first. The detectors only run
+        on a miss, and their combined result is stored in the table.
+        """
+        key = self.gender_table.key(first_name, last_name, middle_name, self.russian_names_db)
+        gender = self.gender_table.get(key)
+        if gender is not None:
+            self.metrics.count("gender.detect", "table_hit")
+            return gender
+
+        merged_name = " ".join(word for word in [last_name, first_name, middle_name] if word)
+
+        with self.metrics.stage("gender.detect"):
+            if self.russian_names_db:
+                gender_rn = self.detect_gender_with_russiannames(merged_name)
+            else:
+                gender_rn = "U"
+            gender_ph = self.detect_gender_with_pytrovich(first_name, last_name, middle_name)
+
+        if gender_ph == gender_rn:
+            if gender_ph != "U":
+                gender = gender_ph
+            else:
+                gender = "U"
+        elif gender_ph == "U":
+            gender = gender_rn
+        elif (gender_rn == "U") or (gender_rn == "-"):
+            gender = gender_ph
+        else:
+            gender = "C"
+
+        self.gender_table.set(key, gender)
+        return gender
+
+    def precompute_genders(self, names):
+        """
+        Fills the gender table for an iterable of name dicts (with 'first', 'last', 'middle' keys,
+        as returned by extract_names) and returns the table statistics.
+        """
+        for details in names:
+            self.detect_gender(details.get("first", ""), details.get("last", ""), details.get("middle", ""))
+        return self.gender_table.stats()
+
+    def save_gender_table(self, path=None):
+        """Saves the gender table (by default to the path it was loaded from)."""
+        path = path or self.gender_table_path
+        if path is None:
+            raise ValueError("No path provided for the gender table.")
+        self.gender_table.save(path)
+
     def extract_genders(self, text):
         """Extract names and detect genders for each person in the text."""
         names = self.extract_names(text)
@@ -118,25 +557,29 @@ class GenderExtractor:
 
             merged_name = " ".join(word for word in [last_name, first_name, middle_name] if word)    
 
-            if self.russian_names_db:
-                gender_rn = self.detect_gender_with_russiannames(merged_name)
-            else:
-                gender_rn = "U"
-            gender_ph = self.detect_gender_with_pytrovich(first_name, last_name, middle_name)
-
-            if gender_ph == gender_rn:
-                if gender_ph != "U":
-                    genders.append((merged_name, gender_ph))
-                else:
-                    genders.append((merged_name, "U"))
-            elif gender_ph == "U":
-                genders.append((merged_name, gender_rn))
-            elif (gender_rn == "U") or (gender_rn == "-"):
-                genders.append((merged_name, gender_ph))
-            else:
-                genders.append((merged_name, "C"))
+            genders.append((merged_name, self.detect_gender(first_name, last_name, middle_name)))
             
         return genders
+
+    def extract_genders_many(self, texts, batch_size=256, n_workers=None):
+        """
+        extract_genders for many texts. Non-string values give empty lists.
+
+        Args:
+            n_workers (int): Process the texts in this many worker processes, in batches of batch_size.
+                The pool is started on the first call and reused by later calls (see
+                src.parallel.run_in_pool and close_workers). Genders detected by the workers are not
+                added to the gender table of this extractor.
+
+        Returns:
+            list: Per-document results of extract_genders, in input order.
+        """
+        if n_workers and n_workers > 1:
+            from src.parallel import run_in_pool
+            return run_in_pool(self, 'extract_genders_many', texts, n_workers, batch_size, self.MODEL_NAMES)
+        texts = list(texts)
+        self.metrics.skip("gender.ner", "not_text", sum(not isinstance(text, str) for text in texts))
+        return [self.extract_genders(text) if isinstance(text, str) else [] for text in texts]
     
 if __name__ == "__main__":
     text = "Волостных Владислав Витальевич - ст.291 ч.3; ст.222 ч.1; ст.290 ч.5 п.в; ст.290 ч.5 п.в; ст.290 ч.5 п.в УК РФ"
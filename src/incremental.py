@@ -0,0 +1,66 @@
+import hashlib
+import json
+
+from src.models import LazyModule
+
+pd = LazyModule('pandas')
+
+HASH_COLUMN = "{}_input_hash"
+VERSION_COLUMN = "{}_version"
+
+
+def fingerprint(*parts):
+    """Short stable hash of JSON-serializable parts, e.g. the rules and settings of an extractor."""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+def file_digest(path):
+    """SHA-256 hash of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def row_hashes(df, columns):
+    """
+    Content hash of the input columns of each row of a DataFrame. Missing values (None, NaN, NA)
+    hash alike, other values by their string representation.
+    """
+    values = []
+    for column in columns:
+        series = df[column]
+        values.append([None if missing else str(value)
+                       for value, missing in zip(series.tolist(), series.isna().tolist())])
+    return [hashlib.sha256(json.dumps(row, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+            for row in zip(*values)]
+
+
+def stale_rows(df, prefix, hashes, version):
+    """
+    Returns the positions of the rows to (re)compute: rows without a stored input hash and version
+    in the '<prefix>_input_hash' and '<prefix>_version' columns, or with different ones.
+    """
+    hash_column, version_column = HASH_COLUMN.format(prefix), VERSION_COLUMN.format(prefix)
+    if hash_column not in df.columns or version_column not in df.columns:
+        return list(range(len(df)))
+    return [position for position, (stored_hash, stored_version, current_hash)
+            in enumerate(zip(df[hash_column].tolist(), df[version_column].tolist(), hashes))
+            if not (isinstance(stored_hash, str) and stored_hash == current_hash
+                    and isinstance(stored_version, str) and stored_version == version)]
+
+
+def update_column(df, column, positions, values, dtype=object):
+    """Sets the values of a column at the given row positions (the column is created if missing)."""
+    data = df[column].tolist() if column in df.columns else [None] * len(df)
+    for position, value in zip(positions, values):
+        data[position] = value
+    df[column] = pd.Series(data, index=df.index, dtype=dtype)
+
+
+def mark_rows(df, prefix, positions, hashes, version):
+    """Stores the input hash and the extractor version of the (re)computed rows."""
+    update_column(df, HASH_COLUMN.format(prefix), positions, [hashes[position] for position in positions], 'string')
+    update_column(df, VERSION_COLUMN.format(prefix), positions, [version] * len(positions), 'string')
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def estimate_tokens(text):
+    """Rough token count of a text for rate limiting (about 3 characters per token for Russian)."""
+    return len(text) // 3 + 1
+
+
+def pack_batches(costs, token_budget, max_items=None):
+    """
+    Packs items into batches in input order, so that the sum of the costs of a batch does not exceed
+    the token budget. An item exceeding the budget on its own gets a batch of its own.
+
+    Args:
+        costs (list): Cost (tokens) of each item.
+        token_budget (int): Maximal total cost of a batch.
+        max_items (int): Maximal number of items in a batch (None for no limit).
+
+    Returns:
+        list: Batches as lists of item indices.
+    """
+    batches, batch, total = [], [], 0
+    for index, cost in enumerate(costs):
+        if batch and (total + cost > token_budget or (max_items and len(batch) >= max_items)):
+            batches.append(batch)
+            batch, total = [], 0
+        batch.append(index)
+        total += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class TokenBucket:
+    """
+    Asynchronous token bucket: holds up to `capacity` tokens and refills at `capacity` tokens
+    per `period` seconds. Requests larger than the capacity wait for a full bucket.
+
+    A bucket can be kept over several event loops (e.g. one asyncio.run per chunk), so that the rate
+    budget is not reset between them.
+    """
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(float(amount), self.capacity)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # An asyncio lock is bound to the event loop it is first used in
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """Limits requests per minute and (estimated) input tokens per minute. None disables a limit."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens=0):
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+
+
+class ResponseCache:
+    """
+    Persistent content-addressed cache of parsed LLM responses in SQLite.
+
+    Keys are hashes of the request content (see make_key), values are JSON-serializable results.
+    Entries older than max_age seconds are treated as missing and removed by evict(); if
+    max_entries is set, the least recently used entries above it are removed by evict(). evict()
+    runs when the cache is opened and after every evict_interval stored values, so the cache
+    holds at most max_entries + evict_interval - 1 entries.
+
+    Args:
+        path (str): Database file.
+        read_only (bool): Only read the cache: nothing is written or evicted.
+        max_entries (int): Maximal number of entries kept (None for no limit).
+        max_age (float): Maximal age of entries in seconds (None for no limit).
+        evict_interval (int): Number of stored values between two evictions.
+    """
+
+    def __init__(self, path, read_only=False, max_entries=None, max_age=None, evict_interval=1000):
+        self.path = path
+        self.read_only = read_only
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self._inserts = 0
+        self._lock = threading.Lock()
+        if read_only:
+            self._connection = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True,
+                                               check_same_thread=False)
+        else:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+            self.evict()
+
+    @staticmethod
+    def make_key(*parts):
+        """Returns the SHA-256 hash of the JSON representation of the key parts."""
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        """Returns the cached value, or default if it is missing or expired."""
+        with self._lock:
+            row = self._connection.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age is not None and time.time() - row[1] > self.max_age):
+                self.misses += 1
+                return default
+            self.hits += 1
+            if not self.read_only:
+                with self._connection:
+                    self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._connection.execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and (self.max_age is None or time.time() - row[0] <= self.max_age)
+
+    def set(self, key, value):
+        """Stores a JSON-serializable value (ignored in read-only mode)."""
+        if self.read_only:
+            return
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                     (key, json.dumps(value, ensure_ascii=False), now, now))
+            self._inserts += 1
+            evict = self._inserts % self.evict_interval == 0
+        if evict and (self.max_entries is not None or self.max_age is not None):
+            self.evict()
+
+    def evict(self):
+        """Removes expired entries and the least recently used entries above max_entries."""
+        if self.read_only:
+            return
+        with self._lock, self._connection:
+            if self.max_age is not None:
+                self._connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        """Returns hit/miss statistics of the cache."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self),
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        self._connection.close()
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Exponential backoff with jitter for the given attempt (starting from 0)."""
+    return min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+async def generate_async(model, prompt):
+    """
+    Calls the model asynchronously. Models with generate_content_async (google.generativeai,
+    HTTPModel, FakeModel) are awaited, other models run generate_content in a thread.
+    """
+    if hasattr(model, "generate_content_async"):
+        return await model.generate_content_async(prompt)
+    return await asyncio.to_thread(model.generate_content, prompt)
+
+
+class ModelResponse:
+    """Minimal response object with the `text` attribute used by PunishmentExtractor."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    In-process stand-in for the Gemini model, for testing throughput without spending quota.
+
+    Args:
+        response (str or callable): Response text, or a function of the prompt returning it.
+        latency (float): Seconds to wait before responding.
+        error_rate (float): Share of calls raising RuntimeError.
+        malformed_rate (float): Share of calls returning text without a JSON code block.
+    """
+
+    def __init__(self, response='```json\n{}\n```', latency=0.0, error_rate=0.0, malformed_rate=0.0, seed=None):
+        self.response = response
+        self.latency = latency
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _respond(self, prompt):
+        self.calls += 1
+        draw = self._random.random()
+        if draw < self.error_rate:
+            raise RuntimeError("Fake model error")
+        if draw < self.error_rate + self.malformed_rate:
+            return ModelResponse("Sorry, I cannot answer that.")
+        return ModelResponse(self.response(prompt) if callable(self.response) else self.response)
+
+    def generate_content(self, prompt):
+        time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+
+class _FakeModelHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        prompt = json.loads(self.rfile.read(length) or b'{}').get('prompt', '')
+        try:
+            text = self.server.model.generate_content(prompt).text
+            body, status = json.dumps({'text': text}).encode('utf-8'), 200
+        except RuntimeError as e:
+            body, status = json.dumps({'error': str(e)}).encode('utf-8'), 500
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeModelServer:
+    """
+    Local HTTP server answering POST {"prompt": ...} with {"text": ...} produced by a FakeModel.
+    Use it with HTTPModel to validate throughput, rate limits and retries end to end.
+
+        with FakeModelServer(FakeModel(latency=0.2)) as server:
+            extractor = PunishmentExtractor(model=HTTPModel(server.url))
+    """
+
+    def __init__(self, model=None, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), _FakeModelHandler)
+        self._server.model = model or FakeModel()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class HTTPModel:
+    """Model client for an HTTP endpoint with the FakeModelServer protocol."""
+
+    def __init__(self, url, timeout=60.0, model_name="http"):
+        self.url = url
+        self.timeout = timeout
+        self.model_name = model_name
+
+    def generate_content(self, prompt):
+        request = urllib.request.Request(self.url, data=json.dumps({'prompt': prompt}).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return ModelResponse(json.loads(response.read())['text'])
+
+    async def generate_content_async(self, prompt):
+        return await asyncio.to_thread(self.generate_content, prompt)
@@ -0,0 +1,303 @@
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the wall-time histogram buckets; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Stage:
+    """Context manager timing one call of a stage. Set `rows` inside the block if it is known only there."""
+
+    __slots__ = ('metrics', 'name', 'rows', 'start', 'profile')
+
+    def __init__(self, metrics, name, rows, profile):
+        self.metrics = metrics
+        self.name = name
+        self.rows = rows
+        self.profile = profile
+
+    def __enter__(self):
+        if self.profile is not None:
+            self.profile.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.__exit__(exc_type, exc, traceback)
+        self.metrics.observe(self.name, seconds, self.rows)
+        if exc_type is not None:
+            self.metrics.error(self.name, exc_type.__name__)
+        return False
+
+
+class _NullStage:
+    __slots__ = ('rows',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Metrics:
+    """
+    Per-stage metrics of the extractors: number of calls and rows, a wall-time histogram, named
+    event counters and skip/error reasons of each named stage ("districts.lookup", "gender.ner",
+    "punishments.llm_call"...). Thread-safe.
+
+        metrics = Metrics()
+        extractor = MunicipalityExtractor(metrics=metrics)
+        with metrics.stage("my.stage", rows=len(batch)):
+            ...
+        metrics.skip("my.stage", "empty_text")
+        metrics.to_prometheus()
+
+    Extractors use NULL_METRICS (which records nothing) unless a Metrics instance is given.
+    Copies sent to worker processes start empty and their metrics are not merged back.
+
+    Args:
+        buckets (tuple): Upper bounds (seconds) of the histogram buckets.
+        profiler (callable): Profiler hook: called with the stage name for sampled stage calls, it
+            returns a context manager wrapped around the call (see CProfileHook).
+        sample_rate (float): Share of stage calls run under the profiler.
+        profile_stages (list): Stages to profile (all by default).
+        seed (int): Seed of the sampling.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, profiler=None, sample_rate=0.01, profile_stages=None, seed=None):
+        self.buckets = tuple(sorted(buckets))
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.profile_stages = set(profile_stages) if profile_stages is not None else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __reduce__(self):
+        return self.__class__, (self.buckets,)
+
+    def reset(self):
+        """Removes all recorded values."""
+        with self._lock:
+            self._stages = {}
+
+    def _get(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = {
+                'calls': 0, 'rows': 0, 'seconds': 0.0, 'histogram': [0] * (len(self.buckets) + 1),
+                'counters': {}, 'skips': {}, 'errors': {},
+            }
+        return stage
+
+    def stage(self, name, rows=1):
+        """
+        Returns a context manager recording the wall time of a stage call processing `rows` rows.
+        An exception raised in the block is recorded as an error with the exception class name.
+        """
+        profile = None
+        if self.profiler is not None and (self.profile_stages is None or name in self.profile_stages) \
+                and self._random.random() < self.sample_rate:
+            profile = self.profiler(name)
+        return _Stage(self, name, rows, profile)
+
+    def observe(self, name, seconds, rows=1):
+        """Records a stage call of the given duration."""
+        with self._lock:
+            stage = self._get(name)
+            stage['calls'] += 1
+            stage['rows'] += rows
+            stage['seconds'] += seconds
+            stage['histogram'][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def _add(self, name, kind, key, value):
+        if not value:
+            return
+        with self._lock:
+            values = self._get(name)[kind]
+            values[key] = values.get(key, 0) + value
+
+    def count(self, name, event, value=1):
+        """Increments an event counter of a stage (e.g. "cache_hit")."""
+        self._add(name, 'counters', event, value)
+
+    def skip(self, name, reason, value=1):
+        """Records rows skipped by a stage, with the reason (e.g. "not_text")."""
+        self._add(name, 'skips', reason, value)
+
+    def error(self, name, reason, value=1):
+        """Records rows failed in a stage, with the reason (e.g. the exception class name)."""
+        self._add(name, 'errors', reason, value)
+
+    def quantile(self, name, share):
+        """Estimates a quantile of the wall time of a stage call: the upper bound of its histogram bucket."""
+        with self._lock:
+            histogram = list(self._stages[name]['histogram'])
+        return _quantile(self.buckets, histogram, share)
+
+    def snapshot(self):
+        """Returns the recorded values as a JSON-serializable dict keyed by stage."""
+        with self._lock:
+            stages = {name: {key: (dict(value) if isinstance(value, dict) else
+                                   list(value) if isinstance(value, list) else value)
+                             for key, value in stage.items()}
+                      for name, stage in self._stages.items()}
+        result = {}
+        for name, stage in sorted(stages.items()):
+            histogram = stage.pop('histogram')
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets + (float('inf'),), histogram):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else repr(bound)] = cumulative
+            stage['mean_seconds'] = stage['seconds'] / stage['calls'] if stage['calls'] else None
+            stage['p50_seconds'] = _quantile(self.buckets, histogram, 0.5)
+            stage['p99_seconds'] = _quantile(self.buckets, histogram, 0.99)
+            stage['buckets'] = buckets
+            result[name] = stage
+        return result
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent, default=str)
+
+    def to_prometheus(self, namespace='court_extractor'):
+        """Returns the recorded values in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {namespace}_stage_seconds Wall time of extraction stage calls.",
+                 f"# TYPE {namespace}_stage_seconds histogram"]
+        for name, stage in snapshot.items():
+            label = _label('stage', name)
+            for bound, count in stage['buckets'].items():
+                lines.append(f"{namespace}_stage_seconds_bucket{{{label},le=\"{bound}\"}} {count}")
+            lines.append(f"{namespace}_stage_seconds_sum{{{label}}} {stage['seconds']!r}")
+            lines.append(f"{namespace}_stage_seconds_count{{{label}}} {stage['calls']}")
+
+        lines += [f"# HELP {namespace}_stage_rows_total Rows processed by extraction stages.",
+                  f"# TYPE {namespace}_stage_rows_total counter"]
+        lines += [f"{namespace}_stage_rows_total{{{_label('stage', name)}}} {stage['rows']}"
+                  for name, stage in snapshot.items()]
+
+        for kind, key, help_text in (('counters', 'event', 'Events of extraction stages.'),
+                                     ('skips', 'reason', 'Rows skipped by extraction stages.'),
+                                     ('errors', 'reason', 'Rows failed in extraction stages.')):
+            metric = f"{namespace}_stage_{'events' if kind == 'counters' else kind}_total"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for name, stage in snapshot.items():
+                for value_key, value in sorted(stage[kind].items()):
+                    lines.append(f"{metric}{{{_label('stage', name)},{_label(key, value_key)}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        """Writes the metrics to a file: Prometheus text for .prom and .txt files, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+def _quantile(buckets, histogram, share):
+    rank, total = share * sum(histogram), 0
+    for bound, count in zip(buckets + (float('inf'),), histogram):
+        total += count
+        if total and total >= rank:
+            return bound
+    return None
+
+
+def _label(name, value):
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{name}="{value}"'
+
+
+class NullMetrics(Metrics):
+    """Metrics that record nothing: the default of the extractors, with near-zero overhead."""
+
+    enabled = False
+
+    def __init__(self):
+        super().__init__(profiler=None, sample_rate=0.0)
+
+    def __reduce__(self):
+        return 'NULL_METRICS'
+
+    def stage(self, name, rows=1):
+        return _NULL_STAGE
+
+    def observe(self, name, seconds, rows=1):
+        pass
+
+    def _add(self, name, kind, key, value):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class CProfileHook:
+    """
+    Profiler hook of Metrics collecting cProfile statistics of sampled stage calls, per stage.
+    Only one call is profiled at a time: calls of nested stages are profiled as part of the outer
+    sampled call, and calls sampled in other threads meanwhile are not profiled.
+
+        hook = CProfileHook()
+        metrics = Metrics(profiler=hook, sample_rate=0.01)
+        ...
+        hook.stats("gender.ner").sort_stats("cumulative").print_stats(20)
+    """
+
+    def __init__(self):
+        self.profiles = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def __call__(self, stage):
+        import cProfile
+
+        if not self._lock.acquire(blocking=False):
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.profiles.setdefault(stage, []).append(profile)
+            self._lock.release()
+
+    def stats(self, stage):
+        """Returns pstats.Stats of all profiled calls of a stage."""
+        import pstats
+
+        profiles = self.profiles[stage]
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def dump(self, directory):
+        """Writes the statistics of each stage to <directory>/<stage>.prof (readable with snakeviz or pstats)."""
+        os.makedirs(directory, exist_ok=True)
+        for stage in self.profiles:
+            self.stats(stage).dump_stats(os.path.join(directory, f"{stage}.prof"))
+
+
+if __name__ == '__main__':
+    metrics = Metrics()
+    for rows in (10, 20, 30):
+        with metrics.stage("example.sleep", rows=rows):
+            time.sleep(0.001 * rows)
+    metrics.skip("example.sleep", "not_text", 2)
+    print(metrics.to_prometheus())
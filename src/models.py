@@ -0,0 +1,213 @@
+import importlib
+import os
+import threading
+import time
+
+
+def current_rss():
+    """Returns the resident set size of the current process in bytes, or None if it is not available."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        # Peak RSS: kilobytes on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so that importing the package
+    does not pay for heavy dependencies (pandas, numpy, natasha, google.generativeai...) until they
+    are used:
+
+        pd = LazyModule('pandas')
+        pd.DataFrame(...)  # pandas is imported here
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of heavy NLP resources (Natasha models, pymorphy2, pytrovich, spaCy...).
+
+    Each resource is loaded once, on first use, and shared by all extractor instances.
+    Loading is thread-safe: concurrent requests for the same resource wait for a single load.
+    Load time and the change of the process RSS during the load are recorded for each resource
+    (the memory figure is approximate when several resources are loaded concurrently).
+
+    Loaders are registered by name. A loader registered as "prefix:" receives the part of the
+    requested name after the colon, e.g. "spacy:ru_core_news_sm".
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._warm_up_names = []
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warm_up=True):
+        """
+        Registers a loader (a callable without arguments, or with one argument for "prefix:" names).
+
+        Args:
+            warm_up (bool): Load the resource in warm_up() called without names.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            if warm_up and not name.endswith(':') and name not in self._warm_up_names:
+                self._warm_up_names.append(name)
+
+    def _loader_for(self, name):
+        if name in self._loaders:
+            return self._loaders[name]
+        prefix, separator, argument = name.partition(':')
+        if separator and f'{prefix}:' in self._loaders:
+            loader = self._loaders[f'{prefix}:']
+            return lambda: loader(argument)
+        raise KeyError(f"No loader registered for model: {name}")
+
+    def get(self, name):
+        """Returns the resource with the given name, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.RLock())
+        with lock:
+            model = self._models.get(name)
+            if model is None:
+                loader = self._loader_for(name)
+                rss_before = current_rss()
+                start = time.perf_counter()
+                model = loader()
+                seconds = time.perf_counter() - start
+                rss_after = current_rss()
+                self._stats[name] = {
+                    'seconds': seconds,
+                    'rss_delta_bytes': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                }
+                self._models[name] = model
+        return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warm_up(self, names=None):
+        """Loads the given resources (all resources registered with warm_up=True by default)."""
+        if names is None:
+            names = list(self._warm_up_names)
+        for name in names:
+            self.get(name)
+        return self.stats()
+
+    def stats(self):
+        """Returns load time (seconds) and RSS change (bytes) for each loaded resource."""
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def clear(self, name=None):
+        """Drops a loaded resource (all resources by default), so that it is reloaded on next use."""
+        with self._lock:
+            names = [name] if name is not None else list(self._models)
+            for model_name in names:
+                self._models.pop(model_name, None)
+                self._stats.pop(model_name, None)
+
+
+def _natasha_embedding():
+    from natasha import NewsEmbedding
+    return NewsEmbedding()
+
+
+def _natasha_segmenter():
+    from natasha import Segmenter
+    return Segmenter()
+
+
+def _natasha_morph_vocab():
+    from natasha import MorphVocab
+    return MorphVocab()
+
+
+def _natasha_names_extractor():
+    from natasha import NamesExtractor
+    return NamesExtractor(morph=registry.get('natasha_morph_vocab'))
+
+
+def _natasha_morph_tagger():
+    from natasha import NewsMorphTagger
+    return NewsMorphTagger(registry.get('natasha_embedding'))
+
+
+def _natasha_syntax_parser():
+    from natasha import NewsSyntaxParser
+    return NewsSyntaxParser(registry.get('natasha_embedding'))
+
+
+def _natasha_ner_tagger():
+    from natasha import NewsNERTagger
+    return NewsNERTagger(registry.get('natasha_embedding'))
+
+
+def _pymorphy2_analyzer():
+    import pymorphy2
+    return pymorphy2.MorphAnalyzer()
+
+
+def _pytrovich_detector():
+    from pytrovich.detector import PetrovichGenderDetector
+    return PetrovichGenderDetector()
+
+
+def _russiannames_parser():
+    from russiannames.parser import NamesParser
+    return NamesParser()
+
+
+def _spacy_model(model_name):
+    import spacy
+    return spacy.load(model_name)
+
+
+registry = ModelRegistry()
+registry.register('natasha_embedding', _natasha_embedding)
+registry.register('natasha_segmenter', _natasha_segmenter)
+registry.register('natasha_morph_vocab', _natasha_morph_vocab)
+registry.register('natasha_names_extractor', _natasha_names_extractor)
+registry.register('natasha_morph_tagger', _natasha_morph_tagger)
+registry.register('natasha_syntax_parser', _natasha_syntax_parser)
+registry.register('natasha_ner_tagger', _natasha_ner_tagger)
+registry.register('pymorphy2_analyzer', _pymorphy2_analyzer)
+registry.register('pytrovich_detector', _pytrovich_detector)
+registry.register('russiannames_parser', _russiannames_parser, warm_up=False)  # requires MongoDB
+registry.register('spacy:', _spacy_model)
+
+
+def get_model(name):
+    """Returns a shared resource from the process-wide registry."""
+    return registry.get(name)
+
+
+if __name__ == '__main__':
+    print(registry.warm_up(['natasha_ner_tagger', 'pytrovich_detector', 'spacy:ru_core_news_sm']))
@@ -0,0 +1,151 @@
+import gc
+import multiprocessing
+import os
+from itertools import repeat
+
+from src.models import current_rss, registry
+
+_worker_extractor = None
+
+
+def _initialize_worker(extractor, preload):
+    """Worker initializer: loads the models (already loaded if the worker was forked) and keeps the extractor."""
+    global _worker_extractor
+    registry.warm_up(list(preload))
+    _worker_extractor = extractor
+
+
+def _run_batch(method, batch, kwargs):
+    results = list(getattr(_worker_extractor, method)(batch, **kwargs))
+    return os.getpid(), current_rss(), results
+
+
+def _iter_batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+class ProcessPoolRunner:
+    """
+    Runs a batch method of an extractor (a method taking a list and returning a list of results,
+    e.g. GenderExtractor.extract_genders_many) in a pool of worker processes.
+
+    Models are loaded once per worker: with the "fork" start method (the default where available)
+    they are loaded in the parent before the workers start, and the workers share their memory
+    pages copy-on-write (gc.freeze() keeps the garbage collector from touching them). With other
+    start methods, each worker loads them in its initializer. Items are sent in batches and results
+    come back in input order. The RSS of each worker is recorded after each batch (worker_rss).
+
+        with ProcessPoolRunner(GenderExtractor(), "extract_genders_many", n_workers=32,
+                               preload=GenderExtractor.MODEL_NAMES) as runner:
+            genders = runner.map(texts)
+
+    Args:
+        extractor: Extractor instance, copied to each worker (pickled unless the worker is forked).
+        method (str): Name of the batch method.
+        n_workers (int): Number of worker processes (number of CPUs by default).
+        batch_size (int): Number of items per task.
+        preload (list): Names of registry models to load before the workers run.
+        start_method (str): Multiprocessing start method ("fork" where available by default).
+    """
+
+    def __init__(self, extractor, method, n_workers=None, batch_size=256, preload=(), start_method=None):
+        if start_method is None:
+            start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self.extractor = extractor
+        self.method = method
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.preload = list(preload)
+        self.start_method = start_method
+        self.worker_rss = {}
+        self._executor = None
+
+    def start(self):
+        """Loads the models (for forked workers) and starts the workers."""
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self._executor is not None:
+            return self
+        forked = self.start_method == "fork"
+        if forked:
+            registry.warm_up(self.preload)
+            gc.freeze()
+        try:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.n_workers, mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_initialize_worker, initargs=(self.extractor, self.preload)
+            )
+            # Forked workers are all started on the first task, while the models are frozen
+            self._executor.submit(os.getpid).result()
+        finally:
+            if forked:
+                gc.unfreeze()
+        return self
+
+    def map(self, items, method=None, **kwargs):
+        """
+        Runs the method over the items in batches.
+
+        Args:
+            method (str): Batch method to run instead of the one given to the runner.
+            kwargs: Keyword arguments of the method.
+
+        Returns:
+            list: Results in input order.
+        """
+        self.start()
+        results = []
+        batches = _iter_batches(list(items), self.batch_size)
+        for pid, rss, batch_results in self._executor.map(_run_batch, repeat(method or self.method), batches,
+                                                          repeat(kwargs)):
+            self.worker_rss[pid] = rss
+            results.extend(batch_results)
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_in_pool(extractor, method, items, n_workers, batch_size, preload, /, **kwargs):
+    """
+    Runs a batch method of an extractor in a ProcessPoolRunner kept on the extractor, so that the
+    workers are forked and the models loaded once, not on every call. Calls with the same number
+    of workers and the same preloaded models share a pool, whatever the method.
+
+    The workers hold a copy of the extractor made when the pool was started: later changes of its
+    settings or state (e.g. its gender table) are not seen by them. Call close_pools(extractor)
+    (or the close_workers method of the extractor) to stop the workers; they are also stopped at exit.
+
+    Returns:
+        list: Results of the method in input order.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+
+    pools = extractor.__dict__.setdefault('_pools', {})
+    key = (n_workers, tuple(preload))
+    runner = pools.get(key)
+    if runner is None:
+        runner = pools[key] = ProcessPoolRunner(extractor, method, n_workers, batch_size, preload)
+    runner.batch_size = batch_size
+    try:
+        return runner.map(items, method=method, **kwargs)
+    except BrokenProcessPool:
+        # A worker died: the next call starts a new pool
+        runner.close()
+        pools.pop(key, None)
+        raise
+
+
+def close_pools(extractor):
+    """Stops the worker pools started by run_in_pool for an extractor."""
+    for runner in extractor.__dict__.pop('_pools', {}).values():
+        runner.close()
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import time
+
+from src.incremental import mark_rows, row_hashes, stale_rows, update_column
+from src.metrics import NULL_METRICS
+from src.models import LazyModule
+
+pd = LazyModule('pandas')
+
+INPUT_FORMATS = ("csv", "parquet")
+PART_FILE_PATTERN = "part-{:05d}.parquet"
+CHECKPOINT_FILE = "_checkpoint.json"
+
+
+def detect_format(path):
+    """Returns the input format ("csv" or "parquet") from the file extension."""
+    name = path.lower()
+    if name.endswith((".parquet", ".pq")):
+        return "parquet"
+    if name.endswith((".csv", ".csv.gz", ".csv.bz2", ".csv.zip", ".csv.xz")):
+        return "csv"
+    raise ValueError(f"Cannot detect the format of {path}. Use one of {INPUT_FORMATS}")
+
+
+def iter_chunks(path, chunk_size, input_format=None, columns=None):
+    """
+    Reads a CSV or Parquet file in DataFrames of at most chunk_size rows. CSV columns are read as
+    strings, so that court codes keep leading zeros and every chunk has the same column types.
+    """
+    input_format = input_format or detect_format(path)
+    if input_format not in INPUT_FORMATS:
+        raise ValueError(f"Unknown input format: {input_format}. Use one of {INPUT_FORMATS}")
+    if input_format == "csv":
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, usecols=columns)
+        return
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required to read Parquet. Install it with `pip install pyarrow`.")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def check_parquet_engine():
+    """Raises ImportError if no Parquet engine (pyarrow or fastparquet) is installed."""
+    if not any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")):
+        raise ImportError("The pipeline writes Parquet files and needs pyarrow. Install it with `pip install pyarrow`.")
+
+
+def _to_json(value):
+    return None if value is None else json.dumps(value, ensure_ascii=False)
+
+
+def _dump_json(data, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+
+
+def _write_atomic(path, write):
+    """Writes a file through a temporary file, so that a crash never leaves a partial file."""
+    temporary_path = f"{path}.tmp"
+    write(temporary_path)
+    os.replace(temporary_path, path)
+
+
+class Pipeline:
+    """
+    Chunked end-to-end extraction: reads decisions from CSV or Parquet in chunks of fixed size,
+    runs the Municipality, Articles, Gender and (optionally) Punishment Extractors on each chunk
+    and writes each processed chunk to a Parquet file of the output directory (part-00000.parquet,
+    part-00001.parquet... readable together with pd.read_parquet(output_dir)).
+
+    Memory use is bounded by the chunk size. After each chunk, a checkpoint file in the output
+    directory records the number of completed chunks, so that an interrupted run resumes after
+    the last completed chunk.
+
+    Added columns: 'region', 'municipality', 'oktmo', 'articles' and 'genders' (JSON), and, with a
+    PunishmentExtractor, 'punishments' (JSON), 'punishments_error', 'punishments_source' and
+    'punishments_status'. A stage is skipped if its column is None.
+
+    Args:
+        court_column (str): Column with court codes (or names) for the MunicipalityExtractor.
+        date_column (str): Column with decision dates to select the court dictionary version.
+        articles_column (str): Column with the charges string for the ArticlesExtractor.
+        gender_column (str): Column with the text to extract names and genders from.
+        text_column (str): Column with decision texts for the PunishmentExtractor.
+        punishment_extractor (PunishmentExtractor): Runs the punishment stage if given.
+        punishment_options (dict): Keyword arguments of find_punishments_async (concurrency, rate
+            limits, batch_token_budget...). The rate limits hold over the whole run: one RateLimiter
+            is kept for all chunks.
+        municipality_extractor, articles_extractor, gender_extractor: Extractors to use instead of
+            the default ones.
+        n_workers (int): Run the Gender Extractor in this many worker processes with preloaded
+            models (see src.parallel.ProcessPoolRunner); the pool is kept for the whole run.
+        metrics (Metrics): Records the "pipeline.chunk" and "pipeline.write" stages and is given to
+            the default extractors (see src.metrics). Stages run in worker processes are not recorded.
+        incremental (bool): Each stage stores the content hash of its input columns and the version
+            of its extractor in the '<stage>_input_hash' and '<stage>_version' columns ('municipality',
+            'articles', 'genders', 'punishments') and only processes the rows whose input or
+            extractor version differs from the stored ones. Run it on a previous output with new or
+            re-scraped rows appended: unchanged rows keep their results.
+    """
+
+    def __init__(self, court_column="court_code", date_column=None, articles_column="accused",
+                 gender_column="accused", text_column="result_text", punishment_extractor=None,
+                 punishment_options=None, municipality_extractor=None, articles_extractor=None,
+                 gender_extractor=None, n_workers=None, metrics=None, incremental=False):
+        self.court_column = court_column
+        self.date_column = date_column
+        self.articles_column = articles_column
+        self.gender_column = gender_column
+        self.text_column = text_column
+        self.punishment_extractor = punishment_extractor
+        self.punishment_options = dict(punishment_options or {})
+        if punishment_extractor is not None and self.punishment_options.get("limiter") is None:
+            from src.llm import RateLimiter
+            self.punishment_options["limiter"] = RateLimiter(self.punishment_options.pop("requests_per_minute", None),
+                                                             self.punishment_options.pop("tokens_per_minute", None))
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+
+        if court_column and municipality_extractor is None:
+            from src.districts import MunicipalityExtractor
+            municipality_extractor = MunicipalityExtractor(metrics=metrics)
+        if articles_column and articles_extractor is None:
+            from src.articles import ArticlesExtractor
+            articles_extractor = ArticlesExtractor(metrics=metrics)
+        if gender_column and gender_extractor is None:
+            from src.gender import GenderExtractor
+            gender_extractor = GenderExtractor(metrics=metrics)
+        self.municipality_extractor = municipality_extractor
+        self.articles_extractor = articles_extractor
+        self.gender_extractor = gender_extractor
+        self.n_workers = n_workers
+        self.incremental = incremental
+        self.miss_count = 0
+        self._gender_runner = None
+
+    def fingerprint(self):
+        """
+        Hash of the settings and extractor versions that change the output; a checkpoint is only
+        resumed with the same settings and versions.
+        """
+        stages = [(self.court_column, self.municipality_extractor), (self.articles_column, self.articles_extractor),
+                  (self.gender_column, self.gender_extractor),
+                  (self.text_column if self.punishment_extractor is not None else None, self.punishment_extractor)]
+        settings = [self.date_column, self.incremental] + [
+            (column, extractor.version()) if column else None for column, extractor in stages
+        ]
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+    def _stale(self, chunk, prefix, column, extractor):
+        """
+        Returns the positions of the chunk rows to process by a stage (all rows unless incremental),
+        and a function marking the given positions as processed.
+        """
+        if not self.incremental:
+            return list(range(len(chunk))), lambda rows: None
+        hashes = row_hashes(chunk, [column])
+        version = extractor.version()
+        rows = stale_rows(chunk, prefix, hashes, version)
+        self.metrics.count("pipeline.chunk", f"{prefix}_reused", len(chunk) - len(rows))
+        return rows, lambda positions: mark_rows(chunk, prefix, positions, hashes, version)
+
+    def process_chunk(self, chunk):
+        """Runs the extraction stages on a DataFrame chunk and returns it with the added columns."""
+        chunk = chunk.reset_index(drop=True)
+
+        if self.court_column:
+            self.municipality_extractor.process_dataframe(chunk, self.court_column, date_column=self.date_column,
+                                                          incremental=self.incremental)
+            self.miss_count += self.municipality_extractor.miss_count
+
+        if self.articles_column:
+            rows, mark = self._stale(chunk, "articles", self.articles_column, self.articles_extractor)
+            articles = self.articles_extractor.process_many(chunk[self.articles_column].iloc[rows])
+            update_column(chunk, "articles", rows, [_to_json(result) for result in articles], "string")
+            mark(rows)
+
+        if self.gender_column:
+            rows, mark = self._stale(chunk, "genders", self.gender_column, self.gender_extractor)
+            texts = chunk[self.gender_column].iloc[rows].tolist()
+            if self._gender_runner is not None:
+                genders = self._gender_runner.map(texts)
+            else:
+                genders = self.gender_extractor.extract_genders_many(texts)
+            update_column(chunk, "genders", rows,
+                          [_to_json(result) if isinstance(text, str) else None for text, result in zip(texts, genders)],
+                          "string")
+            mark(rows)
+
+        if self.punishment_extractor is not None and self.text_column:
+            rows, mark = self._stale(chunk, "punishments", self.text_column, self.punishment_extractor)
+            results = asyncio.run(self.punishment_extractor.find_punishments_async(
+                chunk[self.text_column].iloc[rows].tolist(), **self.punishment_options
+            ))
+            update_column(chunk, "punishments", rows,
+                          [_to_json(row['result'][1]) if row['result'] is not None else None for row in results],
+                          "string")
+            for column in ("error", "source", "status"):
+                update_column(chunk, f"punishments_{column}", rows, [row[column] for row in results], "string")
+            # Failed rows are not marked, so that the next incremental run retries them
+            mark([position for position, row in zip(rows, results) if row['error'] is None])
+
+        # Text columns are written as strings even if a chunk has only missing values
+        for column in chunk.columns[chunk.dtypes == object]:
+            chunk[column] = chunk[column].astype("string")
+        return chunk
+
+    def _load_checkpoint(self, checkpoint_path, state):
+        if not os.path.exists(checkpoint_path):
+            return 0, 0
+        with open(checkpoint_path, encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        if any(checkpoint.get(key) != value for key, value in state.items()):
+            raise ValueError(f"Checkpoint {checkpoint_path} was written for another input or other settings. "
+                             f"Remove it or run with resume=False.")
+        return checkpoint["completed_chunks"], checkpoint["rows"]
+
+    def run(self, input_path, output_dir, chunk_size=10000, input_format=None, resume=True, columns=None):
+        """
+        Processes an input file chunk by chunk into the output directory.
+
+        Args:
+            chunk_size (int): Number of rows per chunk (and per output file).
+            input_format (str): "csv" or "parquet" (detected from the file extension by default).
+            resume (bool): Continue after the last completed chunk of a previous run. If False,
+                the output directory is cleared of previous results.
+            columns (list): Input columns to read (all by default).
+
+        Returns:
+            dict: Numbers of processed and skipped chunks and rows, misses of the court dictionary
+                and the duration in seconds.
+        """
+        # Fail before the output directory and the checkpoint are touched
+        check_parquet_engine()
+        os.makedirs(output_dir, exist_ok=True)
+        checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+        state = {
+            "input": os.path.abspath(input_path),
+            "chunk_size": chunk_size,
+            "fingerprint": self.fingerprint(),
+        }
+        if resume:
+            completed_chunks, rows = self._load_checkpoint(checkpoint_path, state)
+        else:
+            for path in glob.glob(os.path.join(output_dir, "part-*.parquet")) + [checkpoint_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+            completed_chunks, rows = 0, 0
+
+        start = time.perf_counter()
+        skipped_chunks, processed_chunks, processed_rows = completed_chunks, 0, 0
+        self.miss_count = 0
+        if self.gender_column and self.n_workers and self.n_workers > 1:
+            from src.parallel import ProcessPoolRunner
+            self._gender_runner = ProcessPoolRunner(self.gender_extractor, "extract_genders_many", self.n_workers,
+                                                    preload=self.gender_extractor.MODEL_NAMES)
+        try:
+            for index, chunk in enumerate(iter_chunks(input_path, chunk_size, input_format, columns)):
+                if index < completed_chunks:
+                    continue
+                with self.metrics.stage("pipeline.chunk", rows=len(chunk)):
+                    result = self.process_chunk(chunk)
+                with self.metrics.stage("pipeline.write", rows=len(result)):
+                    _write_atomic(os.path.join(output_dir, PART_FILE_PATTERN.format(index)),
+                                  lambda path: result.to_parquet(path, index=False))
+                processed_chunks += 1
+                processed_rows += len(result)
+                checkpoint = dict(state, completed_chunks=index + 1, rows=rows + processed_rows)
+                _write_atomic(checkpoint_path, lambda path: _dump_json(checkpoint, path))
+        finally:
+            if self._gender_runner is not None:
+                self._gender_runner.close()
+                self._gender_runner = None
+
+        return {
+            "processed_chunks": processed_chunks,
+            "processed_rows": processed_rows,
+            "skipped_chunks": skipped_chunks,
+            "skipped_rows": rows,
+            "court_misses": self.miss_count,
+            "seconds": time.perf_counter() - start,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract municipalities, articles, genders and punishments "
+                                                 "from a CSV or Parquet file of court decisions in chunks.")
+    parser.add_argument("input", help="CSV or Parquet file")
+    parser.add_argument("output", help="Output directory of Parquet files")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--format", choices=INPUT_FORMATS, help="input format (by extension by default)")
+    parser.add_argument("--no-resume", action="store_true", help="start over instead of resuming a checkpoint")
+    parser.add_argument("--court-column", default="court_code", help="empty to skip the stage")
+    parser.add_argument("--date-column", default=None)
+    parser.add_argument("--articles-column", default="accused", help="empty to skip the stage")
+    parser.add_argument("--gender-column", default="accused", help="empty to skip the stage")
+    parser.add_argument("--text-column", default="result_text")
+    parser.add_argument("--punishments", action="store_true", help="run the Punishment Extractor")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"),
+                        help="Gemini API key (GEMINI_API_KEY by default)")
+    parser.add_argument("--cache", help="SQLite file of the LLM response cache")
+    parser.add_argument("--fast-path", action="store_true", help="extract simple punishments with rules")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests-per-minute", type=int, default=None)
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="limit of estimated input tokens")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process rows whose input or extractor version changed (input: a previous output "
+                             "with new rows)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes of the Gender Extractor and the punishment fast path")
+    parser.add_argument("--metrics", help="write per-stage metrics to this file (Prometheus text for .prom, "
+                                          "JSON otherwise)")
+    parser.add_argument("--profile", help="profile sampled stage calls with cProfile into this directory")
+    parser.add_argument("--profile-rate", type=float, default=0.01, help="share of stage calls to profile")
+    args = parser.parse_args(argv)
+
+    metrics, profiler = None, None
+    if args.metrics or args.profile:
+        from src.metrics import CProfileHook, Metrics
+        profiler = CProfileHook() if args.profile else None
+        metrics = Metrics(profiler=profiler, sample_rate=args.profile_rate)
+
+    punishment_extractor = None
+    if args.punishments:
+        from src.punishments import PunishmentExtractor
+        punishment_extractor = PunishmentExtractor(api_key=args.api_key, cache=args.cache, fast_path=args.fast_path,
+                                                   metrics=metrics)
+
+    pipeline = Pipeline(
+        court_column=args.court_column or None,
+        date_column=args.date_column,
+        articles_column=args.articles_column or None,
+        gender_column=args.gender_column or None,
+        text_column=args.text_column,
+        punishment_extractor=punishment_extractor,
+        punishment_options={"concurrency": args.concurrency, "requests_per_minute": args.requests_per_minute,
+                            "tokens_per_minute": args.tokens_per_minute, "n_workers": args.workers},
+        n_workers=args.workers,
+        metrics=metrics,
+        incremental=args.incremental,
+    )
+    stats = pipeline.run(args.input, args.output, chunk_size=args.chunk_size, input_format=args.format,
+                         resume=not args.no_resume)
+    if args.metrics:
+        metrics.save(args.metrics)
+    if args.profile:
+        profiler.dump(args.profile)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,457 @@
 import re
 import os
-import google.generativeai as genai
+import asyncio
+import hashlib
 import json
 
-import pandas as pd
-import spacy
 import yaml
 from src.gender import GenderExtractor
+from src.incremental import fingerprint, mark_rows, row_hashes, stale_rows, update_column
+from src.llm import RateLimiter, ResponseCache, backoff_delay, estimate_tokens, generate_async, pack_batches
+from src.metrics import NULL_METRICS
+from src.models import LazyModule, get_model
 
-# Load the spaCy model for lemmatization
-spacy_model = "ru_core_news_sm"
-nlp = spacy.load(spacy_model)
+genai = LazyModule('google.generativeai')
+
+# Increase when the prompt templates in build_prompt or build_batch_prompt change, so that cached
+# responses are not reused
+PROMPT_VERSION = 2
+# Increase when the rule-based parser (rule_based_punishment) changes, so that incremental runs with
+# the fast path reprocess the rows
+RULES_VERSION = 2
+# Estimated tokens of the header of a decision in a batch prompt (ID and names)
+BATCH_ITEM_OVERHEAD_TOKENS = 30
+_MISSING = object()
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# spaCy components not needed for lemmatization
+UNUSED_SPACY_COMPONENTS = ("parser", "ner", "senter")
+
+SEVERITY_FIELDS = ("years", "months", "rubles", "days", "hours")
+# Severity units of punishments.yaml -> severity fields of the result
+SEVERITY_UNITS = {"год": "years", "месяц": "months", "рубль": "rubles", "срок в часах": "hours", "не определяется": None}
+# Transformations of punishments.yaml applied by the rule-based parser ("20 тысяч рублей" -> 20000 rubles)
+RULE_TRANSFORMATIONS = {"тысячи в рубли"}
+
+NUMBER_WORDS = {
+    "один": 1, "одного": 1, "одна": 1, "одну": 1, "два": 2, "две": 2, "двух": 2, "три": 3, "трех": 3, "трёх": 3,
+    "четыре": 4, "четырех": 4, "четырёх": 4, "пять": 5, "пяти": 5, "шесть": 6, "шести": 6, "семь": 7, "семи": 7,
+    "восемь": 8, "восьми": 8, "девять": 9, "девяти": 9, "десять": 10, "десяти": 10,
+    "одиннадцать": 11, "одиннадцати": 11, "двенадцать": 12, "двенадцати": 12, "тринадцать": 13, "тринадцати": 13,
+    "четырнадцать": 14, "четырнадцати": 14, "пятнадцать": 15, "пятнадцати": 15, "шестнадцать": 16,
+    "шестнадцати": 16, "семнадцать": 17, "семнадцати": 17, "восемнадцать": 18, "восемнадцати": 18,
+    "девятнадцать": 19, "девятнадцати": 19, "двадцать": 20, "двадцати": 20, "тридцать": 30, "тридцати": 30,
+    "сорок": 40, "сорока": 40, "пятьдесят": 50, "пятидесяти": 50, "шестьдесят": 60, "шестидесяти": 60,
+    "семьдесят": 70, "семидесяти": 70, "восемьдесят": 80, "восьмидесяти": 80, "девяносто": 90, "девяноста": 90,
+    "сто": 100, "ста": 100, "двести": 200, "двухсот": 200, "триста": 300, "трехсот": 300, "четыреста": 400,
+    "четырехсот": 400, "пятьсот": 500, "пятисот": 500, "шестьсот": 600, "шестисот": 600, "семьсот": 700,
+    "семисот": 700, "восемьсот": 800, "восьмисот": 800, "девятьсот": 900, "девятисот": 900,
+}
+_NUMBER_WORD = "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + "|тысяч[аиу]?"
+# "4 (четыре) года", "20 000 рублей", "20 тысяч рублей", "15 000 руб.", "20 тыс. руб.", "три года", "двести часов"
+QUANTITY_PATTERN = re.compile(
+    rf"[\s,]*(?:и\s+)?(?P<number>\d{{1,3}}(?:[ \u00a0]\d{{3}})+(?!\d)|\d+|(?:{_NUMBER_WORD})\b(?:\s+(?:{_NUMBER_WORD})\b)*)"
+    r"\s*(?:\([^)]*\)\s*)?(?P<thousands>(?:тысяч[аиу]?\b|тыс\.)\s*)?"
+    r"(?P<unit>(?:года?|лет|месяц(?:а|ев)?|день|дн(?:я|ей)|суток|час(?:а|ов)?|рубл(?:ь|я|ей))\b|руб\b\.?)",
+    re.IGNORECASE
+)
+SEVERITY_ANCHOR_PATTERN = re.compile(r"\b(?:на\s+срок|сроком(?:\s+на)?|в\s+размере)\b", re.IGNORECASE)
+REGIME_PATTERN = re.compile(r"колони\w*\s+(\w+)\s+режима", re.IGNORECASE)
+# Sentences the rule-based path does not handle: aggregation of punishments, suspended sentences,
+# additional punishments (not "без назначения дополнительного наказания"), deferment, release,
+# termination, acquittal and medical measures. The articles 64, 69, 70, 73, 74 and 82 are those of
+# the Criminal Code, not of the Code of Criminal Procedure ("ст. 82 УПК РФ" on material evidence).
+# Lookbehinds have a fixed width: the texts are matched with normalized spaces (see remove_double_spaces).
+AMBIGUOUS_PATTERN = re.compile(
+    r"совокупност|\bст(?:ать(?:[иья]|ей)|\.)?\s*(?:64|69|70|73|74|82)\b(?![.,]?\s*(?:УПК|Уголовно-процессуальн))"
+    r"|условн|испытательн"
+    r"|(?<!без назначения )дополнительн|отсрочк|освобо[дж]|прекрат|оправда|принудительн\w*\s+мер|лишени\w*\s+права?\b",
+    re.IGNORECASE
+)
+
+
+def parse_number(text):
+    """Parses a number written in digits ("20 000") or in words ("двадцать пять тысяч")."""
+    digits = re.sub(r"[\s\u00a0]", "", text)
+    if digits.isdigit():
+        return int(digits)
+    total, current = 0, 0
+    for word in text.lower().split():
+        if word.startswith("тысяч"):
+            total += (current or 1) * 1000
+            current = 0
+        else:
+            current += NUMBER_WORDS[word]
+    return total + current
+
+
+def _severity_field(unit):
+    unit = unit.lower()
+    if unit.startswith("год") or unit == "лет":
+        return "years"
+    if unit.startswith("месяц"):
+        return "months"
+    if unit.startswith("руб"):
+        return "rubles"
+    if unit.startswith("час"):
+        return "hours"
+    return "days"
+
+
+def parse_severities(text):
+    """
+    Finds the severities stated after "на срок", "сроком" and "в размере" in a text.
+
+    Returns:
+        list: Severity dicts ("years", "months", "rubles", "days", "hours"), in order of occurrence.
+    """
+    severities = []
+    for anchor in SEVERITY_ANCHOR_PATTERN.finditer(text):
+        severity = dict.fromkeys(SEVERITY_FIELDS, 0)
+        position = anchor.end()
+        match = QUANTITY_PATTERN.match(text, position)
+        while match:
+            value = parse_number(match.group("number"))
+            if match.group("thousands"):
+                value *= 1000
+            severity[_severity_field(match.group("unit"))] += value
+            position = match.end()
+            match = QUANTITY_PATTERN.match(text, position)
+        if position != anchor.end():
+            severities.append(severity)
+    return severities
+
+
+class ResolutiveLocator:
+    """
+    Finds the start of the resolutive part of a decision ("ПРИГОВОРИЛ:", "постановил", "признать"...).
+
+    The patterns of punishments.yaml are compiled once, and the document is scanned once for each
+    of them. Case-insensitive matching is slow, so lowercase patterns are searched case-sensitively
+    in the document lowercased once (offsets are the same unless lowercasing changes the length of
+    the text, which falls back to case-insensitive matching). The resolutive part is returned as
+    an offset into the document, so its tail is not copied; whitespace is normalized only in the
+    located part, by the caller.
+
+    Statuses:
+        "ok": the anchor was found.
+        "not_text": the document is not a string.
+        "sensitive": the text was not published (sensitive_pattern matched).
+        "too_short": the document is shorter than min_length characters.
+        "no_anchor": decision_pattern was not found.
+
+    Args:
+        decision_pattern (str): Regex of the anchor of the resolutive part.
+        sensitive_pattern (str): Regex of the notes of unpublished texts (None to skip the check).
+        anchor (str): "first" (the earliest anchor) or "last" (the latest anchor) occurrence.
+        min_length (int): Minimal length of a document.
+    """
+
+    ANCHOR_POLICIES = ("first", "last")
+
+    def __init__(self, decision_pattern, sensitive_pattern=None, anchor="first", min_length=500):
+        if anchor not in self.ANCHOR_POLICIES:
+            raise ValueError(f"Unknown anchor policy: {anchor}. Expected one of {self.ANCHOR_POLICIES}")
+        self.anchor = anchor
+        self.min_length = min_length
+        self.decision_pattern = re.compile(decision_pattern, re.IGNORECASE)
+        self._lowercase_decision = self._compile_lowercase(decision_pattern)
+        self.sensitive_pattern = re.compile(sensitive_pattern, re.IGNORECASE) if sensitive_pattern else None
+        self._lowercase_sensitive = self._compile_lowercase(sensitive_pattern) if sensitive_pattern else None
+
+    @staticmethod
+    def _compile_lowercase(pattern):
+        """Compiles a lowercase pattern for case-sensitive matching of lowercased texts (None for other patterns)."""
+        return re.compile(pattern) if pattern == pattern.lower() else None
+
+    @staticmethod
+    def _lowercase(text):
+        """Returns the lowercased text, or None if lowercasing changes its length (and so the offsets)."""
+        lowered = text.lower()
+        return lowered if len(lowered) == len(text) else None
+
+    def _search(self, pattern, lowercase_pattern, text, lowered, last=False):
+        if lowercase_pattern is not None and lowered is not None:
+            pattern, text = lowercase_pattern, lowered
+        if not last:
+            return pattern.search(text)
+        match = None
+        for match in pattern.finditer(text):
+            pass
+        return match
+
+    def is_sensitive(self, text, lowered=None):
+        if self.sensitive_pattern is None:
+            return False
+        if lowered is None and self._lowercase_sensitive is not None:
+            lowered = self._lowercase(text)
+        return self._search(self.sensitive_pattern, self._lowercase_sensitive, text, lowered) is not None
+
+    def locate(self, text):
+        """
+        Returns:
+            tuple: (status, start offset of the resolutive part in text, or None unless status is "ok").
+        """
+        if not isinstance(text, str):
+            return "not_text", None
+        lowered = self._lowercase(text)
+        if self.is_sensitive(text, lowered):
+            return "sensitive", None
+        if len(text) < self.min_length:
+            return "too_short", None
+        match = self._search(self.decision_pattern, self._lowercase_decision, text, lowered, self.anchor == "last")
+        if match is None:
+            return "no_anchor", None
+        return "ok", match.start()
+
+    def extract(self, text):
+        """Returns the resolutive part or None."""
+        status, start = self.locate(text)
+        return text[start:] if status == "ok" else None
 
 
 class PunishmentExtractor:
-    def __init__(self, yaml_path=None, spacy_model="ru_core_news_sm", api_key=None):
-        """Initialize with YAML configuration and spaCy model."""
-        self.nlp = spacy.load(spacy_model)
+    def __init__(self, yaml_path=None, spacy_model="ru_core_news_sm", api_key=None, model=None,
+                 model_name="gemini-2.0-flash-001", cache=None, fast_path=False, anchor="first", metrics=None):
+        """
+        Initialize with YAML configuration and spaCy model.
+
+        Args:
+            api_key (str): Gemini API key. Not needed if model is given.
+            model: Object with generate_content(prompt) (and optionally generate_content_async)
+                returning a response with a `text` attribute, e.g. src.llm.HTTPModel or FakeModel.
+            model_name (str): Gemini model used when model is not given.
+            cache (ResponseCache or str): Persistent cache of model responses (or path of its
+                SQLite file). Responses are keyed by the normalized resolutive text, the model
+                name, the prompt version, the content of the YAML configuration and the prompt mode
+                (one or several decisions per request, see cache_key).
+            fast_path (bool): Extract punishments of simple sentences (one person, one punishment
+                with one severity) with rules built from the YAML keywords (see rule_based_punishment)
+                and send only the remaining sentences to the model.
+            anchor (str): Which occurrence of decision_pattern starts the resolutive part, "first"
+                or "last" (see ResolutiveLocator).
+            metrics (Metrics): Records the "punishments.*" stages (resolutive_part, lemmatize, rules,
+                cache, llm_call, parse_response) and the stages of the Gender Extractor (see src.metrics).
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.spacy_model = spacy_model
+        self.model_name = model_name
+        self.fast_path = fast_path
+        self.gender_extractor = GenderExtractor(russian_names_db=False, metrics=self.metrics)
         if yaml_path is None:
             # Get the directory where this module is located
             module_dir = os.path.dirname(os.path.abspath(__file__))
             yaml_path = os.path.join(module_dir, "punishments.yaml")
+        with open(yaml_path, "rb") as file:
+            self.config_hash = hashlib.sha256(file.read()).hexdigest()
         with open(yaml_path, "r", encoding="utf-8") as file:
             self.config = yaml.safe_load(file)
             self.punishments_data = self.config["punishments"]
             self.pattern = self.config.get("decision_pattern")
             self.sensitive_pattern = self.config.get("sensitive_pattern")
+        self.locator = ResolutiveLocator(self.pattern, self.sensitive_pattern, anchor=anchor)
+        self.catalog = self.compact_catalog()
+        # Keywords are lemmatized; mentions negated by "без" ("без ограничения свободы") are skipped
+        self.keyword_patterns = {
+            punishment: re.compile(
+                r"(?<!без )\b(?:" + "|".join(re.escape(keyword.lower())
+                                             for keyword in sorted(data["keywords"], key=len, reverse=True)) + r")\b"
+            )
+            for punishment, data in self.punishments_data.items()
+        }
 
-        if not api_key:
+        if model is not None:
+            self.model = model
+        elif not api_key:
             raise ValueError("No API key provided. Please provide an API key.")
         else:
             genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel("gemini-2.0-flash-001")
+            self.model = genai.GenerativeModel(model_name)
+
+        self.cache = ResponseCache(cache) if isinstance(cache, (str, os.PathLike)) else cache
+
+    def __getstate__(self):
+        # Copies sent to worker processes only run the local stages: the model client and the
+        # cache connection are not picklable and are not copied
+        state = dict(self.__dict__)
+        state["model"] = None
+        state["cache"] = None
+        state.pop("_pools", None)
+        return state
+
+    def version(self):
+        """
+        Fingerprint of the YAML configuration, the prompt version, the model and the settings that
+        change the results, for incremental processing.
+        """
+        model_name = getattr(self.model, "model_name", self.model_name)
+        return fingerprint(self.config_hash, PROMPT_VERSION, model_name, self.locator.anchor, self.locator.min_length,
+                           self.fast_path, self.spacy_model if self.fast_path else None,
+                           RULES_VERSION if self.fast_path else None)
+
+    @property
+    def nlp(self):
+        """spaCy model shared through the model registry, loaded on first use."""
+        return get_model(f"spacy:{self.spacy_model}")
+
+    def _run_in_processes(self, method, texts, n_workers, batch_size, models, **kwargs):
+        from src.parallel import run_in_pool
+        return run_in_pool(self, method, texts, n_workers, batch_size, models, batch_size=batch_size, **kwargs)
+
+    def close_workers(self):
+        """Stops the worker processes kept by the methods called with n_workers (see src.parallel.run_in_pool)."""
+        from src.parallel import close_pools
+        close_pools(self)
+        self.gender_extractor.close_workers()
 
     # Step 1: Extract the resolutive part.
+    def locate_resolutive_part(self, text):
+        """
+        Locates the resolutive part of the sentence based on sensitive phrases and the regex pattern.
+
+        Returns:
+            tuple: (status, start offset of the resolutive part), see ResolutiveLocator.locate.
+        """
+        with self.metrics.stage("punishments.resolutive_part"):
+            status, start = self.locator.locate(text)
+        if status != "ok":
+            self.metrics.skip("punishments.resolutive_part", status)
+        return status, start
+
     def extract_resolutive_part(self, text):
         """
-        Extract the resolutive part of the sentence based on sensitive phrases and the regex pattern.
+        Extract the resolutive part of the sentence, or None if it is not found.
+        Use locate_resolutive_part to get the reason.
         """
-        if isinstance(text, str):
-            if re.search(self.sensitive_pattern, text, re.IGNORECASE):
-                print("Text was not published")
-                return None
-            if len(text) < 500:
-                print("Something went wrong. Text is too short.")
-                return None
-            match = re.search(f"{self.pattern}.*", text, re.DOTALL | re.IGNORECASE)
-            if match:
-                return match.group(0)
-        return None
+        status, start = self.locate_resolutive_part(text)
+        return text[start:] if status == "ok" else None
 
     # Step 2: Lemmatize text.
     def lemmatize_text(self, text):
         """Lemmatizes text using spaCy."""
         if isinstance(text, str):
-            doc = self.nlp(text)
-            return " ".join([token.lemma_ for token in doc])
+            return self.lemmatize_many([text])[0]
         return ""
 
+    def lemmatize_many(self, texts, batch_size=64, n_workers=None):
+        """
+        Lemmatizes many texts with nlp.pipe, with the components not needed for lemmas disabled.
+        Non-string values give empty strings.
+
+        Args:
+            n_workers (int): Lemmatize in this many worker processes, in batches of batch_size texts.
+                The pool is started on the first call and reused by later calls (see close_workers).
+        """
+        if n_workers and n_workers > 1:
+            return self._run_in_processes("lemmatize_many", texts, n_workers, batch_size,
+                                          [f"spacy:{self.spacy_model}"])
+        texts = [text if isinstance(text, str) else "" for text in texts]
+        with self.metrics.stage("punishments.lemmatize", rows=len(texts)):
+            disable = [name for name in UNUSED_SPACY_COMPONENTS if name in self.nlp.pipe_names]
+            return [" ".join(token.lemma_ for token in doc)
+                    for doc in self.nlp.pipe(texts, batch_size=batch_size, disable=disable)]
+
     # Step 3: Remove extra spaces.
     def remove_double_spaces(self, text):
         """Replaces multiple spaces with a single space."""
-        return re.sub(r"\s+", " ", text).strip()
+        return WHITESPACE_PATTERN.sub(" ", text).strip()
     
+    # Fast path: rule-based extraction of simple sentences.
+    def match_punishments(self, lemmatized):
+        """
+        Returns the punishments whose keywords occur in a lemmatized text. A keyword occurrence
+        inside a longer keyword of another punishment ("лишение свобода" in "пожизненный
+        лишение свобода") is not counted.
+        """
+        spans = [(match.start(), match.end(), punishment)
+                 for punishment, pattern in self.keyword_patterns.items()
+                 for match in pattern.finditer(lemmatized.lower())]
+        return {
+            punishment for start, end, punishment in spans
+            if not any(other_start <= start and end <= other_end and other_end - other_start > end - start
+                       for other_start, other_end, other in spans if other != punishment)
+        }
+
+    def rule_based_punishment(self, input_string, lemmatized=None, names=None):
+        """
+        Extracts the punishment of a simple resolutive part without the model: one person, one
+        punishment from the YAML configuration and one severity in the units of that punishment
+        ("штраф в размере 20 000 рублей", "лишение свободы на срок 2 года 6 месяцев ... колонии
+        общего режима"). Aggregated, suspended, deferred and additional punishments are ambiguous.
+
+        Args:
+            input_string (str): Resolutive part with normalized spaces.
+            lemmatized (str): Lemmatized input_string (computed if not given).
+            names (dict): Canonical names of input_string (computed if not given).
+
+        Returns:
+            tuple: (result in the format of the model response, confident). If confident is False,
+                result is None and the text should be sent to the model.
+        """
+        if names is None:
+            names = self.gender_extractor.extract_names(input_string, canonical=True)
+        if len(names) != 1 or AMBIGUOUS_PATTERN.search(input_string):
+            return None, False
+        if lemmatized is None:
+            lemmatized = self.lemmatize_text(input_string)
+        punishments = self.match_punishments(lemmatized)
+        if len(punishments) != 1:
+            return None, False
+        punishment = punishments.pop()
+        data = self.punishments_data[punishment]
+
+        units = data.get("severity") or []
+        units = [units] if isinstance(units, str) else units
+        if any(unit not in SEVERITY_UNITS for unit in units) or \
+                not set(data.get("transformation") or []) <= RULE_TRANSFORMATIONS:
+            return None, False
+        fields = {SEVERITY_UNITS[unit] for unit in units} - {None}
+        severities = {tuple(severity.items()) for severity in parse_severities(input_string)}
+        if len(severities) != (1 if fields else 0):
+            return None, False
+        severity = dict(severities.pop()) if fields else dict.fromkeys(SEVERITY_FIELDS, 0)
+        if any(value and field not in fields for field, value in severity.items()):
+            return None, False
+
+        punishment_type = ""
+        if data.get("type"):
+            # Types are "колония <regime> режима"; regimes are compared by their first letters
+            regimes = {match.group(1).lower()[:4] for match in REGIME_PATTERN.finditer(input_string)}
+            types = [name for name in data["type"] if name.split()[1][:4] in regimes]
+            if len(regimes) != 1 or len(types) != 1:
+                return None, False
+            punishment_type = types[0]
+
+        name = next(iter(names))
+        return {name: {"1": {"punishment": punishment, "type": punishment_type, "severity": severity}}}, True
+
+    def rule_based_punishments(self, texts, batch_size=64, n_workers=None):
+        """
+        Batched rule_based_punishment: lemmatization and name extraction run over all texts at once.
+
+        Args:
+            n_workers (int): Run in this many worker processes, in batches of batch_size texts.
+                The pool is started on the first call and reused by later calls (see close_workers).
+
+        Returns:
+            list: (result, confident) for each text, in input order.
+        """
+        if n_workers and n_workers > 1:
+            return self._run_in_processes("rule_based_punishments", texts, n_workers, batch_size,
+                                          [f"spacy:{self.spacy_model}"] + GenderExtractor.MODEL_NAMES)
+        texts = list(texts)
+        with self.metrics.stage("punishments.rules", rows=len(texts)):
+            lemmatized = self.lemmatize_many(texts, batch_size=batch_size)
+            names = self.gender_extractor.extract_names_many(texts, canonical=True, syntax=False,
+                                                             batch_size=batch_size)
+            results = [self.rule_based_punishment(text, lemmas, text_names)
+                       for text, lemmas, text_names in zip(texts, lemmatized, names)]
+        confident = sum(confident for _, confident in results)
+        self.metrics.count("punishments.rules", "confident", confident)
+        self.metrics.skip("punishments.rules", "ambiguous", len(results) - confident)
+        return results
+
     @staticmethod
     def extract_json_from_code_block(text):
         # Find the start marker
@@ -86,12 +475,17 @@ class PunishmentExtractor:
         return json_string
 
     # Step 4: Find punishments.
-    def find_punishment(self, input_string):
+    def build_prompt(self, input_string, names_accused=None):
+        """
+        Builds the LLM prompt for a resolutive part.
 
-        gender_extractor = GenderExtractor(russian_names_db=False)
-        names_accused = gender_extractor.extract_names(input_string, canonical=True)
-        
-        prompt = f"""
+        Args:
+            names_accused (dict): Canonical names of the part (extracted from it if not given).
+        """
+        if names_accused is None:
+            names_accused = self.gender_extractor.extract_names(input_string, canonical=True)
+
+        return f"""
         Analyze the following text and extract the final punishments for each person mentioned:
 
         Text: {input_string}
@@ -137,22 +531,434 @@ class PunishmentExtractor:
         Return the result as a JSON object.
         """
 
-        response = self.model.generate_content(prompt)
-
+    def parse_response(self, response):
+        """
+        Parses the JSON code block of a model response. Returns None for an empty response,
+        raises ValueError if the response has no JSON code block or it is not valid JSON.
+        """
         if response and hasattr(response, "text") and response.text:
-                return input_string, json.loads(self.extract_json_from_code_block(response.text).replace('\n', ' ').replace('    ', ' ').replace('  ', ' '))
-        else:
-                return input_string, None
-        
+            with self.metrics.stage("punishments.parse_response"):
+                json_string = self.extract_json_from_code_block(response.text)
+                if json_string is None:
+                    raise ValueError("No JSON code block in the model response")
+                return json.loads(json_string.replace('\n', ' ').replace('    ', ' ').replace('  ', ' '))
+        self.metrics.skip("punishments.parse_response", "empty_response")
+        return None
+
+    def compact_catalog(self):
+        """Describes the punishments of the YAML configuration in one line each, for batch prompts."""
+        lines = []
+        for name, data in self.punishments_data.items():
+            severity = data.get("severity") or []
+            line = f"- {name}; severity: {severity if isinstance(severity, str) else ', '.join(severity)}"
+            if data.get("type"):
+                line += f"; type: {' | '.join(data['type'])}"
+            if data.get("transformation"):
+                line += f"; transform: {', '.join(data['transformation'])}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    @staticmethod
+    def document_id(input_string):
+        """Stable ID of a resolutive part in batch prompts."""
+        return hashlib.sha256(input_string.encode("utf-8")).hexdigest()[:10]
+
+    def build_batch_prompt(self, documents):
+        """
+        Builds one LLM prompt for several resolutive parts. The punishment catalog is included once.
+
+        Args:
+            documents (list): (document ID, resolutive part, canonical names) tuples.
+        """
+        decisions = "\n\n".join(f"[{document_id}] Names: {', '.join(names) or '-'}\n{text}"
+                                 for document_id, text, names in documents)
+        return f"""Analyze the court decisions below and extract the final punishments for each person mentioned in each decision.
+
+Punishments:
+{self.catalog}
+
+Requirements:
+1. For each decision and each unique person in it:
+   - Extract their final/aggregated punishments
+   - If multiple punishments of the same type exist, only return the final aggregated punishment
+   - If different types of punishments exist, return all of them
+   - Verify names against the names listed for the decision and use nominative case
+2. "punishment" is a name from the punishments list, "type" is one of its types or "".
+3. Severity: years and months for imprisonment, rubles for fines, days/hours for other time-based punishments,
+   0 for unspecified values, apply the transformations of the punishment, only final values.
+4. Use null for a decision without punishment information.
+
+Return a JSON object keyed by the decision ID, without the square brackets:
+{{"<ID>": {{"Person Name": {{"1": {{"punishment": "...", "type": "...", "severity": {{"years": 0, "months": 0, "rubles": 0, "days": 0, "hours": 0}}}}, "2": {{...}}}}}}}}
+
+Decisions:
+
+{decisions}
+"""
+
+    def validate_result(self, result):
+        """Checks that a result has the output schema: person -> number -> punishment of the catalog."""
+        if result is None:
+            return True
+        if not isinstance(result, dict):
+            return False
+        for punishments in result.values():
+            if not isinstance(punishments, dict):
+                return False
+            for punishment in punishments.values():
+                if not isinstance(punishment, dict) or punishment.get("punishment") not in self.punishments_data:
+                    return False
+                severity = punishment.get("severity", {})
+                if not isinstance(severity, dict) or any(
+                        not isinstance(value, (int, float)) for value in severity.values() if value is not None):
+                    return False
+        return True
+
+    def parse_batch_response(self, response, document_ids):
+        """
+        Splits a batch response into per-document results. Keys are matched to the document IDs
+        without surrounding square brackets and whitespace.
+
+        Returns:
+            tuple: ({document ID: result} of valid results, {document ID: error} of missing or invalid
+                results). Raises ValueError if the response is not a JSON object.
+        """
+        data = self.parse_response(response)
+        if not isinstance(data, dict):
+            raise ValueError("The batch response is not a JSON object")
+        # Models sometimes copy the brackets of the prompt ("[3f2a...]") or pad the ID
+        data = {str(key).strip().strip("[]").strip(): value for key, value in data.items()}
+        results, failures = {}, {}
+        for document_id in document_ids:
+            if document_id not in data:
+                failures[document_id] = "ValueError: Missing in the batch response"
+                self.metrics.error("punishments.parse_response", "missing_document")
+            elif not self.validate_result(data[document_id]):
+                failures[document_id] = "ValueError: Invalid result in the batch response"
+                self.metrics.error("punishments.parse_response", "invalid_result")
+            else:
+                results[document_id] = data[document_id]
+        return results, failures
+
+    def cache_key(self, input_string, batch=False):
+        """
+        Key of the response cache for a resolutive part. Results of batch prompts (see
+        build_batch_prompt) come from other instructions than single prompts and are stored
+        under other keys.
+        """
+        model_name = getattr(self.model, "model_name", self.model_name)
+        parts = [self.remove_double_spaces(input_string), model_name, PROMPT_VERSION, self.config_hash]
+        return ResponseCache.make_key(*parts, "batch") if batch else ResponseCache.make_key(*parts)
+
+    def _cached(self, input_string, batch=False):
+        """Returns (True, result) for a cached resolutive part, (False, None) otherwise."""
+        if self.cache is None:
+            return False, None
+        result = self.cache.get(self.cache_key(input_string, batch), _MISSING)
+        if result is _MISSING:
+            self.metrics.count("punishments.cache", "miss")
+            return False, None
+        self.metrics.count("punishments.cache", "hit")
+        return True, result
+
+    def find_punishment(self, input_string):
+        cached, result = self._cached(input_string)
+        if cached:
+            return input_string, result
+        prompt = self.build_prompt(input_string)
+        with self.metrics.stage("punishments.llm_call"):
+            response = self.model.generate_content(prompt)
+        result = self.parse_response(response)
+        if self.cache is not None:
+            self.cache.set(self.cache_key(input_string), result)
+        return input_string, result
+
+    async def find_punishment_async(self, input_string, limiter=None, max_retries=3, base_delay=1.0,
+                                    max_delay=60.0, names=None):
+        """
+        Asynchronous find_punishment with rate limiting and retries with jittered exponential backoff.
+        Model errors and malformed responses are retried.
+
+        Args:
+            names (dict): Canonical names of the part for the prompt. If not given, they are extracted
+                in a worker thread, so that the name extraction does not block the event loop.
+
+        Returns:
+            dict: 'result' ((input_string, result) tuple as returned by find_punishment, or None),
+                'error' (message of the last error, or None), 'attempts' and 'source' ("cache",
+                "model" or None).
+        """
+        cached, result = self._cached(input_string)
+        if cached:
+            return {'result': (input_string, result), 'error': None, 'attempts': 0, 'source': 'cache'}
+
+        if names is None:
+            names = await asyncio.to_thread(self.gender_extractor.extract_names, input_string, canonical=True)
+        prompt = self.build_prompt(input_string, names)
+        error = None
+        for attempt in range(max_retries + 1):
+            if attempt:
+                self.metrics.count("punishments.llm_call", "retry")
+                await asyncio.sleep(backoff_delay(attempt - 1, base_delay, max_delay))
+            if limiter is not None:
+                await limiter.acquire(estimate_tokens(prompt))
+            try:
+                with self.metrics.stage("punishments.llm_call"):
+                    response = await generate_async(self.model, prompt)
+                result = self.parse_response(response)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            if self.cache is not None:
+                self.cache.set(self.cache_key(input_string), result)
+            return {'result': (input_string, result), 'error': None, 'attempts': attempt + 1, 'source': 'model'}
+        return {'result': None, 'error': error, 'attempts': max_retries + 1, 'source': None}
+
+    async def find_punishments_batched_async(self, input_strings, limiter=None, concurrency=8, token_budget=8000,
+                                             max_batch_size=20, max_retries=3, base_delay=1.0, max_delay=60.0):
+        """
+        Finds punishments of many resolutive parts with several parts per request. Parts are packed
+        into prompts of at most token_budget estimated tokens under stable document IDs; the keyed
+        response is split back into per-document results. Only the documents whose results are
+        missing or invalid (or whose request failed) are retried, packed into new batches.
+
+        Returns:
+            list: Dicts as returned by find_punishment_async, in input order. 'attempts' is the number
+                of requests that included the document.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        document_ids = [self.document_id(input_string) for input_string in input_strings]
+        rows, documents = {}, {}
+        for document_id, input_string in zip(document_ids, input_strings):
+            if document_id in rows or document_id in documents:
+                continue
+            cached, result = self._cached(input_string, batch=True)
+            if cached:
+                rows[document_id] = {'result': (input_string, result), 'error': None, 'attempts': 0, 'source': 'cache'}
+            else:
+                documents[document_id] = input_string
+
+        names = dict(zip(documents, await asyncio.to_thread(self.gender_extractor.extract_names_many,
+                                                            list(documents.values()), canonical=True)))
+        overhead = estimate_tokens(self.build_batch_prompt([]))
+        attempts = dict.fromkeys(documents, 0)
+        errors = {}
+
+        async def send(batch):
+            prompt = self.build_batch_prompt([(document_id, documents[document_id], list(names[document_id]))
+                                              for document_id in batch])
+            for document_id in batch:
+                attempts[document_id] += 1
+            try:
+                async with semaphore:
+                    if limiter is not None:
+                        await limiter.acquire(estimate_tokens(prompt))
+                    with self.metrics.stage("punishments.llm_call", rows=len(batch)):
+                        response = await generate_async(self.model, prompt)
+                return self.parse_batch_response(response, batch)
+            except Exception as e:
+                return {}, dict.fromkeys(batch, f"{type(e).__name__}: {e}")
+
+        pending = list(documents)
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                self.metrics.count("punishments.llm_call", "retry", len(pending))
+                await asyncio.sleep(backoff_delay(attempt - 1, base_delay, max_delay))
+            costs = [estimate_tokens(documents[document_id]) + BATCH_ITEM_OVERHEAD_TOKENS for document_id in pending]
+            batches = [[pending[index] for index in batch]
+                       for batch in pack_batches(costs, token_budget - overhead, max_batch_size)]
+            pending = []
+            for results, failures in await asyncio.gather(*(send(batch) for batch in batches)):
+                for document_id, result in results.items():
+                    rows[document_id] = {'result': (documents[document_id], result), 'error': None,
+                                         'attempts': attempts[document_id], 'source': 'model'}
+                    if self.cache is not None:
+                        self.cache.set(self.cache_key(documents[document_id], batch=True), result)
+                errors.update(failures)
+                pending.extend(failures)
+
+        for document_id in pending:
+            rows[document_id] = {'result': None, 'error': errors[document_id], 'attempts': attempts[document_id],
+                                 'source': None}
+        return [dict(rows[document_id]) for document_id in document_ids]
+
+    async def find_punishments_async(self, texts, concurrency=8, requests_per_minute=None, tokens_per_minute=None,
+                                     max_retries=3, base_delay=1.0, max_delay=60.0, batch_token_budget=None,
+                                     max_batch_size=20, n_workers=None, limiter=None):
+        """
+        Runs find_punishemtns over many decision texts concurrently.
+
+        Args:
+            concurrency (int): Maximal number of requests in flight.
+            requests_per_minute (int): Request rate limit (None for no limit).
+            tokens_per_minute (int): Limit of estimated input tokens per minute (None for no limit).
+            limiter (RateLimiter): Rate limiter to use instead of requests_per_minute and tokens_per_minute.
+                Give the same limiter to successive calls (e.g. one per chunk), so that the limits hold
+                over all of them instead of starting with a full budget at each call.
+            max_retries (int): Number of retries of a failed or malformed request.
+            batch_token_budget (int): Send several decisions per request, up to this number of estimated
+                prompt tokens (see find_punishments_batched_async). None sends one decision per request.
+            max_batch_size (int): Maximal number of decisions per request in batch mode.
+            n_workers (int): Worker processes of the rule-based fast path (see rule_based_punishments).
+
+        Returns:
+            list: For each text, a dict with 'result' (as returned by find_punishemtns), 'error',
+                'attempts', 'source' ("rules", "cache", "model" or None) and 'status' of the resolutive
+                part (see ResolutiveLocator, None if locating failed), in input order. Errors of single
+                rows are captured per row and never raised: if the rule-based fast path fails for a batch,
+                it is retried text by text and the failing texts are sent to the model; if batch mode
+                fails, the texts are sent one per request.
+        """
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        resolutive_parts, statuses, errors = [], [], []
+        for text in texts:
+            try:
+                status, start = self.locate_resolutive_part(text)
+                resolutive_parts.append(self.remove_double_spaces(text[start:]) if status == "ok" else None)
+                statuses.append(status)
+                errors.append(None)
+            except Exception as e:
+                resolutive_parts.append(None)
+                statuses.append(None)
+                errors.append(f"{type(e).__name__}: {e}")
+
+        rule_results = {}
+        if self.fast_path:
+            indices = [index for index, part in enumerate(resolutive_parts) if part is not None]
+            try:
+                rules = self.rule_based_punishments([resolutive_parts[index] for index in indices], n_workers=n_workers)
+            except Exception:
+                # Retry text by text: a text whose rule parse fails is sent to the model like an ambiguous one
+                rules = []
+                for index in indices:
+                    try:
+                        rules.extend(self.rule_based_punishments([resolutive_parts[index]]))
+                    except Exception:
+                        rules.append((None, False))
+            rule_results = {index: result for index, (result, confident) in zip(indices, rules) if confident}
+
+        batch_results = {}
+        if batch_token_budget is not None:
+            indices = [index for index, part in enumerate(resolutive_parts)
+                       if part is not None and index not in rule_results]
+            try:
+                rows = await self.find_punishments_batched_async(
+                    [resolutive_parts[index] for index in indices], limiter, concurrency, batch_token_budget,
+                    max_batch_size, max_retries, base_delay, max_delay
+                )
+                batch_results = dict(zip(indices, rows))
+            except Exception as e:
+                # The texts are sent one per request by process_row
+                self.metrics.error("punishments.llm_call", type(e).__name__)
+                self.metrics.count("punishments.llm_call", "batch_fallback", len(indices))
+
+        # Names of the texts sent one per request are extracted in one batch, off the event loop
+        indices = [index for index, part in enumerate(resolutive_parts)
+                   if part is not None and index not in rule_results and index not in batch_results
+                   and not (self.cache is not None and self.cache_key(part) in self.cache)]
+        names = {}
+        if indices:
+            try:
+                names = dict(zip(indices, await asyncio.to_thread(
+                    self.gender_extractor.extract_names_many, [resolutive_parts[index] for index in indices],
+                    canonical=True
+                )))
+            except Exception:
+                pass  # find_punishment_async extracts them text by text
+
+        async def process(index):
+            row = await process_row(index)
+            row['status'] = statuses[index]
+            return row
+
+        async def process_row(index):
+            resolutive_part = resolutive_parts[index]
+            if resolutive_part is None:
+                return {'result': None, 'error': errors[index], 'attempts': 0, 'source': None}
+            if index in rule_results:
+                return {'result': (resolutive_part, rule_results[index]), 'error': None, 'attempts': 0,
+                        'source': 'rules'}
+            if index in batch_results:
+                return batch_results[index]
+            try:
+                async with semaphore:
+                    return await self.find_punishment_async(resolutive_part, limiter, max_retries, base_delay,
+                                                            max_delay, names.get(index))
+            except Exception as e:
+                return {'result': None, 'error': f"{type(e).__name__}: {e}", 'attempts': 0, 'source': None}
+
+        return await asyncio.gather(*(process(index) for index in range(len(resolutive_parts))))
+
     def find_punishemtns(self, input_string):
         resolutive_part = self.extract_resolutive_part(input_string)
         if resolutive_part is None:
             return None
         removed_double_spaces = self.remove_double_spaces(resolutive_part)
+        if self.fast_path:
+            result, confident = self.rule_based_punishment(removed_double_spaces)
+            if confident:
+                return removed_double_spaces, result
         return self.find_punishment(removed_double_spaces)
 
-    def process_dataframe(self, df, text_column="result_text"):
-        df["punishments"] = df.apply(lambda row: self.find_punishemtns(row[text_column]), axis=1)
+    def _stale_rows(self, df, text_column):
+        """Returns the input hashes of the rows, the extractor version and the positions of the rows to process."""
+        hashes = row_hashes(df, [text_column])
+        version = self.version()
+        rows = stale_rows(df, "punishments", hashes, version)
+        self.metrics.count("punishments.resolutive_part", "reused", len(df) - len(rows))
+        return hashes, version, rows
+
+    def process_dataframe(self, df, text_column="result_text", incremental=False):
+        """
+        Adds the "punishments" column.
+
+        Args:
+            incremental (bool): Store the content hash of the text and the version of the extractor
+                (see version) in the 'punishments_input_hash' and 'punishments_version' columns, and
+                only process the rows whose text or version differs from the stored ones.
+        """
+        if not incremental:
+            df["punishments"] = df.apply(lambda row: self.find_punishemtns(row[text_column]), axis=1)
+            return df
+        hashes, version, rows = self._stale_rows(df, text_column)
+        texts = df[text_column].tolist()
+        update_column(df, "punishments", rows, [self.find_punishemtns(texts[row]) for row in rows])
+        mark_rows(df, "punishments", rows, hashes, version)
+        return df
+
+    async def process_dataframe_async(self, df, text_column="result_text", incremental=False, **kwargs):
+        """
+        Concurrent process_dataframe (see find_punishments_async for the keyword arguments).
+        Adds the "punishments" column, the "punishments_error" column with per-row errors, the
+        "punishments_source" column ("rules", "cache", "model" or None) and the "punishments_status"
+        column with the status of the resolutive part ("ok", "sensitive", "too_short"...).
+
+        Args:
+            incremental (bool): Only process the rows whose text or extractor version changed (see
+                process_dataframe). Rows that failed are not marked as processed and are retried
+                by the next incremental run.
+        """
+        if not incremental:
+            results = await self.find_punishments_async(df[text_column].tolist(), **kwargs)
+            df["punishments"] = [row['result'] for row in results]
+            df["punishments_error"] = [row['error'] for row in results]
+            df["punishments_source"] = [row['source'] for row in results]
+            df["punishments_status"] = [row['status'] for row in results]
+            return df
+
+        hashes, version, rows = self._stale_rows(df, text_column)
+        texts = df[text_column].tolist()
+        results = await self.find_punishments_async([texts[row] for row in rows], **kwargs)
+        update_column(df, "punishments", rows, [row['result'] for row in results])
+        for column in ("error", "source", "status"):
+            update_column(df, f"punishments_{column}", rows, [row[column] for row in results])
+        mark_rows(df, "punishments", [row for row, result in zip(rows, results) if result['error'] is None],
+                  hashes, version)
         return df
 
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the package modules as src.<module>, like the modules themselves
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,130 @@
+import pandas as pd
+import pytest
+
+from src.articles import (CODE_TYPE_CATEGORIES, LONG_TABLE_COLUMNS, ArticlesExtractor, ChargeCache, build_long_table,
+                          charge_key, parse_charges, to_arrow)
+
+CHARGES = [
+    "Губаев Борис Магомедович - ст.159 ч.2 УК РФ",
+    "ст. 20.1 КоАП; ст. 19.3 ч.1 КоАП",
+    "ст. 105 ч.1 п.а УК; ст. 111 ч.2 УК",
+]
+LONG_CHARGES = pd.Series(["ст. 105 ч.1 п.а,б УК; ст. 111 УК", None, "Иванов - без статьи", "ст. 20.1 КоАП",
+                          "Петров П.П. - ст.159 ч.2 УК РФ; Сидоров С.С. - ст.158 ч.3 УК РФ"], index=[10, 11, 12, 13, 14])
+
+
+def test_process_mode_reuses_its_workers():
+    extractor = ArticlesExtractor()
+    strings = CHARGES * 4
+    try:
+        first = extractor.process_many(strings, mode="process", n_workers=2, chunksize=3, deduplicate=False)
+        runner = next(iter(extractor._pools.values()))
+        second = extractor.process_many(strings, mode="process", n_workers=2, chunksize=3, deduplicate=False)
+        assert first == second == extractor.process_many(strings, deduplicate=False)
+        # Both calls ran in the same workers (a worker may get no batch of a call)
+        assert list(extractor._pools.values()) == [runner] and len(runner.worker_rss) <= 2
+    finally:
+        extractor.close_workers()
+    assert not hasattr(extractor, "_pools")
+
+
+@pytest.mark.parametrize("block, key", [
+    ("Губаев Борис Магомедович - ст.159 ч.2 УК РФ", "ст.159 ч.2 УК РФ"),
+    ("Иванов-Петров И.И. - ст.158 УК РФ", "Петров И.И. - ст.158 УК РФ"),
+    # No dash: there is no name prefix to drop
+    ("ст.159 ч.2 УК РФ", "ст.159 ч.2 УК РФ"),
+    # The part before the dash holds an article or a code, so it is part of the charges
+    ("ст.30 ч.3 - ст.158 ч.1 УК РФ", "ст.30 ч.3 - ст.158 ч.1 УК РФ"),
+    ("Иванов (УК РФ) - ст. 105 ч.1", "Иванов (УК РФ) - ст. 105 ч.1"),
+])
+def test_charge_key(block, key):
+    assert charge_key(block) == key
+
+
+def test_charge_cache_hits_and_misses():
+    cache = ChargeCache(maxsize=2)
+    blocks = ["Иванов И.И. - ст.159 ч.2 УК РФ", "Петров П.П. - ст.159 ч.2 УК РФ", "ст.30 ч.3 - ст.158 ч.1 УК РФ",
+              "ст. 105 ч.1 п.а УК"]
+    results = [cache.parse(block) for block in blocks]
+    assert cache.stats() == {"hits": 1, "misses": 3, "size": 2, "maxsize": 2, "hit_rate": 0.25}
+    # The first entry was evicted by the third and fourth ones
+    cache.parse(blocks[0])
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    uncached = ChargeCache(maxsize=0)
+    assert results == [uncached.parse(block) for block in blocks]
+    assert results[2][0] == [{"article": "30", "part": "3", "subpart": None},
+                             {"article": "158", "part": "1", "subpart": None}]
+
+    cache.clear()
+    assert cache.stats()["size"] == cache.hits == cache.misses == 0
+
+
+def test_charge_cache_results_are_not_shared():
+    cache = ChargeCache()
+    first, _ = cache.parse("ст. 105 ч.1 п.а УК")
+    first[0]["subpart"].append("б")
+    first.clear()
+    assert cache.parse("ст. 105 ч.1 п.а УК") == ([{"article": "105", "part": "1", "subpart": ["а"]}], "CRIMINAL")
+
+
+@pytest.mark.parametrize("remove_duplicates", [True, False])
+def test_cached_parse_matches_uncached_parse(remove_duplicates):
+    cache = ChargeCache(remove_duplicates=remove_duplicates)
+    strings = CHARGES + ["Иванов И.И. - ст.159 ч.2 УК РФ, ст.159 ч.2 УК РФ; Петров П.П. - ст.159 ч.2 УК РФ", None]
+    for string in strings * 2:
+        assert parse_charges(string, remove_duplicates, cache) == parse_charges(string, remove_duplicates)
+    assert cache.hits > 0
+
+
+def records_from_long_table(long_table, row_ids):
+    """Rebuilds the nested results from a long table."""
+    results = dict.fromkeys(row_ids)
+    for (row_id, person_idx), rows in long_table.groupby(["row_id", "person_idx"], sort=False, observed=True):
+        articles = {}
+        for article, part, subpart in zip(rows["article"], rows["part"], rows["subpart"]):
+            if pd.isna(article):
+                continue
+            entry = articles.setdefault(article, {"article": article, "part": None if pd.isna(part) else str(part),
+                                                  "subpart": None})
+            if not pd.isna(subpart):
+                entry["subpart"] = (entry["subpart"] or []) + [subpart]
+        code_type = rows["code_type"].iloc[0]
+        results[row_id] = (results[row_id] or []) + [{"person": f"Person {person_idx}",
+                                                      "articles": list(articles.values()),
+                                                      "code_type": None if pd.isna(code_type) else code_type}]
+    return list(results.values())
+
+
+def test_long_table_schema():
+    long_table = ArticlesExtractor().process_many(LONG_CHARGES, output="long")
+    assert list(long_table.columns) == LONG_TABLE_COLUMNS
+    assert long_table.dtypes.astype(str).to_dict() == {"row_id": "int64", "person_idx": "int32",
+                                                       "code_type": "category", "article": "category",
+                                                       "part": "Int32", "subpart": "category"}
+    assert list(long_table["code_type"].cat.categories) == CODE_TYPE_CATEGORIES
+    assert long_table["row_id"].tolist() == [10, 10, 10, 12, 13, 14, 14]
+    assert long_table["person_idx"].tolist() == [1, 1, 1, 1, 1, 1, 2]
+    assert long_table["part"].tolist() == [1, 1, pd.NA, pd.NA, pd.NA, 2, 3]
+    # A person without articles keeps one row with missing values, a missing input has no rows
+    assert long_table[long_table["row_id"] == 12].drop(columns=["row_id", "person_idx"]).isna().all(axis=None)
+
+
+def test_long_table_matches_records():
+    extractor = ArticlesExtractor()
+    records = extractor.process_many(LONG_CHARGES)
+    assert records_from_long_table(build_long_table(records, LONG_CHARGES.index), LONG_CHARGES.index) == records
+    # Without row identifiers the rows are numbered by position
+    assert build_long_table(records)["row_id"].unique().tolist() == [0, 2, 3, 4]
+    assert build_long_table([None, None]).empty
+
+
+def test_arrow_output():
+    pa = pytest.importorskip("pyarrow")
+    table = ArticlesExtractor().process_many(LONG_CHARGES, output="arrow")
+    assert table.column_names == LONG_TABLE_COLUMNS
+    for name in ["code_type", "article", "subpart"]:
+        assert pa.types.is_dictionary(table.schema.field(name).type)
+    assert table.schema.field("part").type == pa.int32()
+    assert table.column("part").null_count == 3
+    assert to_arrow(build_long_table([])).num_rows == 0
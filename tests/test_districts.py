@@ -0,0 +1,128 @@
+import pickle
+
+import pytest
+
+from src.districts import CourtNameResolver, MunicipalityExtractor
+
+COURT_DICT = """municipality;region;oktmo;court_name;court_code;comment
+Гиагинский муниципальный район;Адыгея;79605000;Гиагинский районный суд;01RS0001;
+Майкопский муниципальный район;Адыгея;79620000;Майкопский районный суд;01RS0003;
+Городской округ - Город Майкоп;Адыгея;79701000;Майкопский районный суд;01RS0003;
+Городской округ - Город Адыгейск;Адыгея;;Теучежский районный суд;01RS0007;
+Теучежский муниципальный район;Адыгея;;Теучежский районный суд;01RS0007;
+"""
+
+SNAPSHOTS = {
+    "truncated": lambda data: data[:len(data) // 2],
+    "garbage": lambda data: b"not a pickle",
+    "missing_module": lambda data: b"cnonexistent_court_module\nSnapshot\n(tR.",
+    "not_a_dict": lambda data: pickle.dumps(["court_tables"]),
+}
+
+
+@pytest.mark.parametrize("name", SNAPSHOTS)
+def test_unreadable_snapshot_is_rebuilt(tmp_path, name):
+    snapshot_path = str(tmp_path / "districts.pkl")
+    expected = MunicipalityExtractor(snapshot_path=snapshot_path)
+    with open(snapshot_path, "rb") as file:
+        data = file.read()
+    with open(snapshot_path, "wb") as file:
+        file.write(SNAPSHOTS[name](data))
+
+    extractor = MunicipalityExtractor(snapshot_path=snapshot_path)
+    code = expected.court_table.index[0]
+    assert extractor.get_municipality(code) == expected.get_municipality(code)
+    with open(snapshot_path, "rb") as file:
+        assert pickle.load(file)["sources"] == extractor._sources()
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return MunicipalityExtractor()
+
+
+def test_time_zone_aware_dates(extractor):
+    import datetime
+    import pandas as pd
+
+    moscow = datetime.timezone(datetime.timedelta(hours=3))
+    naive = ["2025-03-01", "2025-04-24", "2025-04-23", None]
+    aware = ["2025-03-01T12:00:00+03:00", pd.Timestamp("2025-04-24", tz="Europe/Moscow"),
+             datetime.datetime(2025, 4, 23, 23, 0, tzinfo=moscow), None]
+    assert [extractor._version_for(date) for date in aware] == [extractor._version_for(date) for date in naive] \
+        == [0, 1, 0, 1]
+
+    code = extractor.court_table.index[0]
+    expected = extractor.process_dataframe(pd.DataFrame({"code": [code] * 4, "date": naive}), "code", "date")
+    for dates in (aware, pd.to_datetime(aware[:3], format="mixed", utc=True).tz_convert("Europe/Moscow").tolist()):
+        df = extractor.process_dataframe(pd.DataFrame({"code": [code] * len(dates), "date": dates}), "code", "date")
+        assert extractor._versions_for_column(df["date"]).tolist() == [0, 1, 0, 1][:len(dates)]
+        assert df["oktmo"].tolist() == expected["oktmo"].tolist()[:len(dates)]
+
+
+def result_rows(df, columns=("region", "municipality", "oktmo")):
+    import pandas as pd
+
+    return [tuple(None if pd.isna(value) else value for value in row)
+            for row in df[list(columns)].itertuples(index=False)]
+
+
+@pytest.fixture
+def dict_path(tmp_path):
+    path = tmp_path / "mun_court_dict_v20250101.csv"
+    path.write_text(COURT_DICT, encoding="utf-8")
+    return str(path)
+
+
+def test_court_name_resolver():
+    resolver = CourtNameResolver(["Гиагинский районный суд", "Майкопский районный суд", None])
+    assert resolver.resolve("ГИАГИНСКИЙ р-нный суд") == ("Гиагинский районный суд", 1.0)
+    name, score = resolver.resolve("Гиагинскй районый суд")
+    assert name == "Гиагинский районный суд" and 0.8 <= score < 1.0
+    assert resolver.resolve("Краснодарский краевой суд")[1] < 0.8
+    assert resolver.resolve("ъъ") == (None, 0.0)
+    assert resolver.resolve(None) == (None, 0.0)
+    misses = resolver.cache_info().misses
+    assert resolver.resolve_many(["майкопский районный суд"] * 3) == [("Майкопский районный суд", 1.0)] * 3
+    assert resolver.resolve("Гиагинский  районный суд.") == ("Гиагинский районный суд", 1.0)
+    assert resolver.cache_info().misses == misses + 1
+
+
+@pytest.mark.parametrize("min_score, matched", [(0.8, True), (0.99, False)])
+def test_fuzzy_names(dict_path, min_score, matched):
+    import pandas as pd
+
+    extractor = MunicipalityExtractor(use_name=True, dict_path=dict_path, fuzzy=True, min_score=min_score)
+    names = ["Гиагинский районный суд", "Гиагинскй районый суд", "Краснодарский краевой суд", None]
+    df = extractor.process_dataframe(pd.DataFrame({"court": names}), "court")
+    expected = "79605000" if matched else None
+    assert result_rows(df, ["oktmo"]) == [("79605000",), (expected,), (None,), (None,)]
+    assert extractor.get_municipality(names[1])[2] == expected
+    assert extractor.misses == ({"Краснодарский краевой суд"} | (set() if matched else {names[1]}))
+
+    exact = MunicipalityExtractor(use_name=True, dict_path=dict_path)
+    assert exact.get_municipality(names[1]) == (None, None, None)
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("first", {"01RS0003": ("Адыгея", "Майкопский муниципальный район", "79620000"),
+               "01RS0007": ("Адыгея", "Городской округ - Город Адыгейск", None)}),
+    ("join", {"01RS0003": ("Адыгея", "Майкопский муниципальный район; Городской округ - Город Майкоп",
+                           "79620000; 79701000"),
+              "01RS0007": ("Адыгея", "Городской округ - Город Адыгейск; Теучежский муниципальный район", None)}),
+    ("none", {"01RS0003": ("Адыгея", None, None), "01RS0007": ("Адыгея", None, None)}),
+])
+def test_multi_municipality_policies(dict_path, policy, expected):
+    import pandas as pd
+
+    extractor = MunicipalityExtractor(dict_path=dict_path, multi_municipality=policy)
+    expected["01RS0001"] = ("Адыгея", "Гиагинский муниципальный район", "79605000")
+    assert {code: extractor.get_municipality(code) for code in expected} == expected
+
+    df = extractor.process_dataframe(pd.DataFrame({"code": list(expected)}), "code")
+    assert result_rows(df) == list(expected.values())
+
+
+def test_unknown_multi_municipality_policy(dict_path):
+    with pytest.raises(ValueError):
+        MunicipalityExtractor(dict_path=dict_path, multi_municipality="last")
@@ -0,0 +1,84 @@
+import pytest
+
+from src.gender import JUDGE_ANCHOR, GenderExtractor, GenderTable, candidate_windows
+
+# Pairs of names differing only in surnames that share their last letters but not their gender rule
+SUFFIX_COLLISIONS = [
+    ("Саша", "Иванова", ""),
+    ("Саша", "Бова", ""),
+    ("Саша", "Синицин", ""),
+    ("Саша", "Цин", ""),
+]
+
+
+def full_surname_detector(first_name, last_name, middle_name):
+    # Decides by the whole surname, like pytrovich surname exceptions
+    return {"Иванова": "F", "Бова": "A", "Синицин": "M", "Цин": "A"}[last_name]
+
+
+def test_table_keys_on_whole_surname():
+    table = GenderTable()
+    assert table.key("Саша", "Бова", "") != table.key("Саша", "Иванова", "")
+
+
+@pytest.mark.parametrize("first, last, middle", SUFFIX_COLLISIONS)
+def test_warm_table_matches_detector(monkeypatch, first, last, middle):
+    extractor = GenderExtractor()
+    monkeypatch.setattr(extractor, "detect_gender_with_pytrovich", full_surname_detector)
+    for name in SUFFIX_COLLISIONS:
+        extractor.detect_gender(*name)
+    assert extractor.detect_gender(first, last, middle) == full_surname_detector(first, last, middle)
+
+
+def test_warm_table_matches_pytrovich():
+    pytest.importorskip("pytrovich")
+    cold = GenderExtractor()
+    expected = {}
+    for name in SUFFIX_COLLISIONS:
+        cold.gender_table = GenderTable()
+        expected[name] = cold.detect_gender(*name)
+    warm = GenderExtractor()
+    for name in SUFFIX_COLLISIONS + SUFFIX_COLLISIONS[::-1]:
+        assert warm.detect_gender(*name) == expected[name]
+
+
+def test_batched_tagging_matches_single_documents():
+    natasha = pytest.importorskip("natasha")
+    extractor = GenderExtractor()
+    texts = [
+        "Признать Иванова Ивана Ивановича виновным в совершении преступления. Назначить наказание.",
+        "",
+        "Судья Петрова А.В. рассмотрела дело. Подсудимый Сидоров П. П. вину признал.",
+        "Приговор вступил в законную силу.",
+    ]
+
+    def tag_one(text):
+        doc = natasha.Doc(text)
+        doc.segment(extractor.segmenter)
+        doc.tag_morph(extractor.morph_tagger)
+        doc.tag_ner(extractor.ner_tagger)
+        for span in doc.spans:
+            if span.type == natasha.PER:
+                span.normalize(extractor.morph_vocab)
+                span.extract_fact(extractor.names_extractor)
+        return {_.normal: _.fact.as_dict for _ in doc.spans if _.fact}
+
+    expected = [tag_one(text) for text in texts]
+    assert any(expected)
+    assert extractor.extract_names_many(texts + [None], syntax=False, batch_size=3) == expected + [{}]
+
+
+@pytest.mark.parametrize("text", [
+    "Судья Петрова А.В.",
+    "председательствующего судьи Петровой А.В.",
+    "обратился к судье Петровой А.В.",
+    "под председательством судьей Петровой А.В.",
+    "замену судью Петрову А.В.",
+])
+def test_judge_anchor(text):
+    assert JUDGE_ANCHOR[0].search(text)
+    assert candidate_windows(text) == [text]
+
+
+def test_judge_anchor_needs_a_word_end():
+    assert not JUDGE_ANCHOR[0].search("судьями, судьба")
@@ -0,0 +1,152 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.articles import ArticlesExtractor
+from src.districts import MunicipalityExtractor
+from src.incremental import mark_rows, row_hashes, stale_rows, update_column
+from src.llm import FakeModel
+from src.metrics import Metrics
+from src.punishments import PunishmentExtractor
+
+CHARGES = ["Иванов И.И. - ст.159 ч.2 УК РФ", "ст. 20.1 КоАП", None, "ст. 105 ч.1 п.а УК"]
+HEADER = "Уголовное дело рассмотрено в открытом судебном заседании. " * 12 + "ПРИГОВОРИЛ: "
+
+
+def reused(metrics, stage):
+    return metrics.snapshot()[stage]["counters"].get("reused", 0)
+
+
+def test_row_hashes():
+    df = pd.DataFrame({"a": ["x", None, np.nan, "x", "1"], "b": [1, 2, 2, 1, 1]})
+    df["c"] = pd.array(["x", pd.NA, "y", "x", "1"], dtype="string")
+    hashes = row_hashes(df, ["a", "b"])
+    assert hashes[0] == hashes[3] and hashes[1] == hashes[2] and len(set(hashes)) == 3
+    # Missing values hash alike whatever their type, other values by their string representation
+    assert row_hashes(df, ["c"])[1] == row_hashes(df, ["a"])[1]
+    assert row_hashes(df, ["a"])[4] == row_hashes(df, ["b"])[4]
+    assert row_hashes(df, ["a", "b"]) != row_hashes(df, ["b", "a"])
+
+
+def test_stale_rows_and_marks():
+    df = pd.DataFrame({"text": ["a", "b", "c"]})
+    hashes = row_hashes(df, ["text"])
+    assert stale_rows(df, "stage", hashes, "v1") == [0, 1, 2]
+
+    update_column(df, "result", [0, 2], ["A", "C"])
+    mark_rows(df, "stage", [0, 2], hashes, "v1")
+    assert df["result"].tolist() == ["A", None, "C"]
+    assert df["stage_input_hash"].dtype == "string" and df["stage_version"].isna().tolist() == [False, True, False]
+    assert stale_rows(df, "stage", hashes, "v1") == [1]
+    assert stale_rows(df, "stage", hashes, "v2") == [0, 1, 2]
+
+    df.loc[2, "text"] = "changed"
+    assert stale_rows(df, "stage", row_hashes(df, ["text"]), "v1") == [1, 2]
+    # Other stages keep their own marks
+    assert stale_rows(df, "other", hashes, "v1") == [0, 1, 2]
+
+
+def test_articles_recompute_changed_rows_only(monkeypatch):
+    metrics = Metrics()
+    extractor = ArticlesExtractor(metrics=metrics)
+    parsed = []
+    process_many = extractor.process_many
+
+    def counting_process_many(strings, **kwargs):
+        parsed.append(list(strings))
+        return process_many(strings, **kwargs)
+
+    monkeypatch.setattr(extractor, "process_many", counting_process_many)
+    df = extractor.process_dataframe(pd.DataFrame({"accused": CHARGES}), "accused", incremental=True)
+    expected = extractor.process_many(CHARGES)
+    assert df["articles"].tolist() == expected
+
+    df.loc[1, "accused"] = "ст. 19.3 ч.1 КоАП"
+    df = pd.concat([df, pd.DataFrame({"accused": ["ст. 111 ч.2 УК"]})], ignore_index=True)
+    parsed.clear()
+    df = extractor.process_dataframe(df, "accused", incremental=True)
+    assert parsed == [["ст. 19.3 ч.1 КоАП", "ст. 111 ч.2 УК"]]
+    assert reused(metrics, "articles.parse") == len(CHARGES) - 1
+    assert df["articles"].tolist() == process_many(df["accused"].tolist())
+
+    parsed.clear()
+    extractor.process_dataframe(df, "accused", incremental=True)
+    assert parsed == [[]]
+
+
+def test_version_bump_invalidates_only_its_column(monkeypatch):
+    metrics = Metrics()
+    articles = ArticlesExtractor(metrics=metrics)
+    districts = MunicipalityExtractor(metrics=metrics)
+    codes = districts.court_table.index[:3].tolist() + [None]
+    df = pd.DataFrame({"accused": CHARGES, "court_code": codes})
+    articles.process_dataframe(df, "accused", incremental=True)
+    districts.process_dataframe(df, "court_code", incremental=True)
+    oktmo = df["oktmo"].tolist()
+
+    monkeypatch.setattr(articles, "version", lambda: "new rules")
+    metrics.reset()
+    articles.process_dataframe(df, "accused", incremental=True)
+    districts.process_dataframe(df, "court_code", incremental=True)
+    assert reused(metrics, "articles.parse") == 0
+    assert reused(metrics, "districts.lookup") == len(df)
+    assert metrics.snapshot()["districts.lookup"]["rows"] == 0
+    assert (df["articles_version"] == "new rules").all() and df["oktmo"].tolist() == oktmo
+
+
+def test_districts_recompute_changed_rows_only():
+    metrics = Metrics()
+    extractor = MunicipalityExtractor(metrics=metrics)
+    codes = extractor.court_table.index[:4].tolist()
+    df = pd.DataFrame({"court_code": codes, "date": ["2025-03-01", "2025-05-01", None, "2025-05-01"]})
+    extractor.process_dataframe(df, "court_code", date_column="date", incremental=True)
+
+    df.loc[0, "court_code"] = "unknown"
+    df.loc[1, "date"] = "2025-03-01"
+    metrics.reset()
+    extractor.process_dataframe(df, "court_code", date_column="date", incremental=True)
+    assert reused(metrics, "districts.lookup") == 2
+    assert metrics.snapshot()["districts.lookup"]["rows"] == 2
+    assert extractor.misses == {"unknown"}
+
+    expected = extractor.process_dataframe(df[["court_code", "date"]].copy(), "court_code", date_column="date")
+    for column in ("region", "municipality", "oktmo"):
+        assert df[column].tolist() == expected[column].tolist()
+
+
+@pytest.fixture
+def punishment_extractor(monkeypatch):
+    def respond(prompt):
+        if "ОШИБКА" in prompt:
+            raise RuntimeError("model error")
+        return '```json\n{"Петров П П": null}\n```'
+
+    extractor = PunishmentExtractor(model=FakeModel(response=respond), metrics=Metrics())
+    monkeypatch.setattr(extractor.gender_extractor, "extract_names_many",
+                        lambda texts, **kwargs: [{"Петров П П": []} for _ in texts])
+    monkeypatch.setattr(extractor.gender_extractor, "extract_names", lambda text, **kwargs: {"Петров П П": []})
+    return extractor
+
+
+def test_punishments_recompute_changed_and_failed_rows(punishment_extractor):
+    extractor = punishment_extractor
+    texts = [HEADER + f"Петрова П.П. признать виновным, дело {index}." for index in range(3)]
+    df = pd.DataFrame({"result_text": texts + [HEADER + "ОШИБКА"]})
+    run = lambda: asyncio.run(extractor.process_dataframe_async(df, incremental=True, max_retries=0))  # noqa: E731
+
+    run()
+    assert extractor.model.calls == 4
+    assert df["punishments_source"].tolist() == ["model"] * 3 + [None]
+
+    # The failed row was not marked: it is retried with the changed row
+    df.loc[0, "result_text"] = HEADER + "Петрова П.П. признать виновным, дело 10."
+    run()
+    assert extractor.model.calls == 6
+    assert reused(extractor.metrics, "punishments.resolutive_part") == 2
+
+    extractor.fast_path = True  # changes the version: every row is recomputed
+    extractor.rule_based_punishments = lambda texts, **kwargs: [(None, False)] * len(texts)
+    run()
+    assert extractor.model.calls == 10
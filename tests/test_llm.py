@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from src.llm import RateLimiter, ResponseCache, TokenBucket, backoff_delay
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "responses.sqlite")
+
+
+def test_response_cache_hits_and_misses(cache_path):
+    cache = ResponseCache(cache_path)
+    key = ResponseCache.make_key("text", "model", 1)
+    assert key == ResponseCache.make_key("text", "model", 1) != ResponseCache.make_key("text", "model", 2)
+    assert cache.get(key) is None and key not in cache
+    cache.set(key, {"Петров П П": None})
+    cache.set(ResponseCache.make_key("empty"), None)
+    assert cache.get(key) == {"Петров П П": None} and key in cache
+    assert cache.get(ResponseCache.make_key("empty"), "missing") is None
+    assert cache.stats() == {"hits": 2, "misses": 1, "size": 2, "hit_rate": 2 / 3}
+    cache.close()
+
+    read_only = ResponseCache(cache_path, read_only=True)
+    read_only.set(ResponseCache.make_key("other"), 1)
+    assert len(read_only) == 2 and read_only.get(key) == {"Петров П П": None}
+
+
+def test_response_cache_evicts_on_set(cache_path, monkeypatch):
+    clock = iter(range(1_000_000_000, 2_000_000_000))
+    monkeypatch.setattr(time, "time", lambda: next(clock))
+    cache = ResponseCache(cache_path, max_entries=3, evict_interval=2)
+    for index in range(4):
+        cache.set(str(index), index)
+        if index == 1:
+            cache.get("0")  # "1" becomes the least recently used entry
+    # Evicted after the second and the fourth value
+    assert [key for key in map(str, range(4)) if key in cache] == ["0", "2", "3"]
+    cache.set("4", 4)
+    assert len(cache) == 4
+    cache.set("5", 5)
+    assert [key for key in map(str, range(6)) if key in cache] == ["3", "4", "5"]
+
+    cache.set("6", 6)
+    assert len(ResponseCache(cache_path, max_entries=2)) == 2
+
+
+def test_response_cache_expires_entries(cache_path, monkeypatch):
+    cache = ResponseCache(cache_path, max_age=60, evict_interval=1)
+    cache.set("old", 1)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert "old" not in cache and cache.get("old") is None
+    assert len(cache) == 1
+    cache.set("new", 2)
+    assert len(cache) == 1 and cache.get("new") == 2
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(2, period=0.2)
+
+    async def acquire(amounts):
+        start = time.monotonic()
+        for amount in amounts:
+            await bucket.acquire(amount)
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire([1, 1])) < 0.05
+    # One token is refilled every 0.1 seconds; a request above the capacity waits for a full bucket
+    assert 0.08 <= asyncio.run(acquire([1])) < 0.2
+    assert 0.15 <= asyncio.run(acquire([5])) < 0.35
+
+
+def test_token_bucket_is_kept_over_event_loops():
+    bucket = TokenBucket(1, period=0.01)
+
+    async def acquire_concurrently():
+        await asyncio.gather(bucket.acquire(), bucket.acquire(), bucket.acquire())
+
+    # The second acquire sleeps holding the lock and the third one waits for it, in both loops
+    for _ in range(2):
+        asyncio.run(acquire_concurrently())
+    assert bucket.tokens < 1
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=1000)
+    asyncio.run(limiter.acquire(300))
+    asyncio.run(limiter.acquire())
+    assert limiter.requests.tokens == pytest.approx(8, abs=0.01)
+    assert limiter.tokens.tokens == pytest.approx(700, abs=1)
+
+    unlimited = RateLimiter()
+    assert unlimited.requests is None and unlimited.tokens is None
+    asyncio.run(unlimited.acquire(10 ** 9))
+
+
+@pytest.mark.parametrize("attempt, low, high", [(0, 0.5, 1.0), (1, 1.0, 2.0), (3, 4.0, 8.0), (10, 30.0, 60.0)])
+def test_backoff_delay(attempt, low, high):
+    delays = [backoff_delay(attempt) for _ in range(100)]
+    assert all(low <= delay <= high for delay in delays)
+    assert len(set(delays)) > 1
+    assert backoff_delay(attempt, base_delay=0.1, max_delay=0.2) <= 0.2
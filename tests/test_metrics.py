@@ -0,0 +1,136 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from src.metrics import NULL_METRICS, CProfileHook, Metrics, NullMetrics
+from src.parallel import close_pools, run_in_pool
+
+BUCKETS = (0.01, 0.1, 1.0)
+
+
+class Recorder:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def record_many(self, items):
+        for item in items:
+            with self.metrics.stage("worker.item"):
+                pass
+        return [(self.metrics is NULL_METRICS, type(self.metrics).__name__, len(self.metrics.snapshot()))
+                for _ in items]
+
+
+def recorded():
+    metrics = Metrics(buckets=BUCKETS)
+    metrics.observe("a.stage", 0.005, rows=10)
+    metrics.observe("a.stage", 0.05, rows=20)
+    metrics.observe("a.stage", 0.05)
+    metrics.observe("a.stage", 5.0, rows=0)
+    metrics.count("a.stage", "cache_hit", 3)
+    metrics.skip("a.stage", "not_text")
+    metrics.skip("a.stage", "not_text", 2)
+    metrics.skip("a.stage", "empty", 0)
+    return metrics
+
+
+def test_stage_counts_and_histogram():
+    metrics = recorded()
+    with pytest.raises(ValueError):
+        with metrics.stage("b.stage", rows=5) as stage:
+            stage.rows = 7
+            raise ValueError("bad row")
+
+    snapshot = metrics.snapshot()
+    assert list(snapshot) == ["a.stage", "b.stage"]
+    stage = snapshot["a.stage"]
+    assert (stage["calls"], stage["rows"]) == (4, 31)
+    assert stage["seconds"] == pytest.approx(5.105)
+    assert stage["mean_seconds"] == pytest.approx(5.105 / 4)
+    assert stage["buckets"] == {"0.01": 1, "0.1": 3, "1.0": 3, "+Inf": 4}
+    assert (stage["p50_seconds"], stage["p99_seconds"]) == (0.1, float("inf"))
+    assert (stage["counters"], stage["skips"], stage["errors"]) == ({"cache_hit": 3}, {"not_text": 3}, {})
+    assert snapshot["b.stage"]["rows"] == 7 and snapshot["b.stage"]["errors"] == {"ValueError": 1}
+    assert metrics.quantile("a.stage", 0.25) == 0.01
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
+
+
+def test_prometheus_text_format():
+    metrics = recorded()
+    metrics.error("a.stage", 'Key"Error')
+    text = metrics.to_prometheus(namespace="test")
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert lines[:8] == [
+        "# HELP test_stage_seconds Wall time of extraction stage calls.",
+        "# TYPE test_stage_seconds histogram",
+        'test_stage_seconds_bucket{stage="a.stage",le="0.01"} 1',
+        'test_stage_seconds_bucket{stage="a.stage",le="0.1"} 3',
+        'test_stage_seconds_bucket{stage="a.stage",le="1.0"} 3',
+        'test_stage_seconds_bucket{stage="a.stage",le="+Inf"} 4',
+        f'test_stage_seconds_sum{{stage="a.stage"}} {0.005 + 0.05 + 0.05 + 5.0!r}',
+        'test_stage_seconds_count{stage="a.stage"} 4',
+    ]
+    assert 'test_stage_rows_total{stage="a.stage"} 31' in lines
+    assert 'test_stage_events_total{stage="a.stage",event="cache_hit"} 3' in lines
+    assert 'test_stage_skips_total{stage="a.stage",reason="not_text"} 3' in lines
+    assert 'test_stage_errors_total{stage="a.stage",reason="Key\\"Error"} 1' in lines
+    for metric in ("stage_seconds", "stage_rows_total", "stage_events_total", "stage_skips_total",
+                   "stage_errors_total"):
+        assert f"# TYPE test_{metric} {'histogram' if metric == 'stage_seconds' else 'counter'}" in lines
+
+
+def test_save(tmp_path):
+    metrics = recorded()
+    metrics.save(str(tmp_path / "metrics.json"))
+    with open(tmp_path / "metrics.json", encoding="utf-8") as file:
+        assert json.load(file) == json.loads(json.dumps(metrics.snapshot(), default=str))
+    metrics.save(str(tmp_path / "metrics.prom"))
+    with open(tmp_path / "metrics.prom", encoding="utf-8") as file:
+        assert file.read() == metrics.to_prometheus()
+
+
+def test_null_metrics_record_nothing():
+    with NULL_METRICS.stage("a.stage", rows=10):
+        pass
+    NULL_METRICS.observe("a.stage", 1.0)
+    NULL_METRICS.count("a.stage", "cache_hit")
+    NULL_METRICS.skip("a.stage", "not_text")
+    assert NULL_METRICS.snapshot() == {} and not NULL_METRICS.enabled
+    assert NullMetrics().snapshot() == {}
+
+
+def test_metrics_pickle_without_their_values():
+    assert pickle.loads(pickle.dumps(NULL_METRICS)) is NULL_METRICS
+    copy = pickle.loads(pickle.dumps(recorded()))
+    assert type(copy) is Metrics and copy.buckets == BUCKETS and copy.snapshot() == {}
+
+
+@pytest.mark.parametrize("metrics", [NULL_METRICS, Metrics(buckets=BUCKETS)])
+def test_metrics_in_worker_processes(metrics):
+    extractor = Recorder(metrics)
+    try:
+        results = run_in_pool(extractor, "record_many", range(4), 2, 2, ())
+    finally:
+        close_pools(extractor)
+    # Workers record into their own copy, which starts empty; nothing is merged back
+    null = metrics is NULL_METRICS
+    assert results == [(null, type(metrics).__name__, 0 if null else 1)] * 4
+    assert metrics.snapshot() == {}
+
+
+def test_profiler_hook_samples_stage_calls(tmp_path):
+    hook = CProfileHook()
+    metrics = Metrics(profiler=hook, sample_rate=1.0, profile_stages=["profiled"], seed=0)
+    for _ in range(2):
+        with metrics.stage("profiled"):
+            sum(range(1000))
+        with metrics.stage("other"):
+            pass
+    assert list(hook.profiles) == ["profiled"] and len(hook.profiles["profiled"]) == 2
+    assert hook.stats("profiled").total_calls > 0
+    hook.dump(str(tmp_path))
+    assert os.listdir(tmp_path) == ["profiled.prof"]
@@ -0,0 +1,37 @@
+import os
+import pickle
+
+from src.parallel import close_pools, run_in_pool
+
+
+class Doubler:
+    def double_many(self, items, factor=2):
+        return [(os.getpid(), item * factor) for item in items]
+
+    def negate_many(self, items):
+        return [(os.getpid(), -item) for item in items]
+
+
+def test_pool_is_reused_across_calls_and_methods():
+    extractor = Doubler()
+    try:
+        first = run_in_pool(extractor, "double_many", range(6), 2, 2, ())
+        second = run_in_pool(extractor, "double_many", range(6), 2, 3, (), factor=3)
+        negated = run_in_pool(extractor, "negate_many", [1, 2], 2, 1, ())
+        assert [value for _, value in first] == [0, 2, 4, 6, 8, 10]
+        assert [value for _, value in second] == [0, 3, 6, 9, 12, 15]
+        assert [value for _, value in negated] == [-1, -2]
+        assert len(extractor._pools) == 1
+        workers = {pid for pid, _ in first + second + negated}
+        assert os.getpid() not in workers and len(workers) <= 2
+    finally:
+        close_pools(extractor)
+    assert not hasattr(extractor, "_pools")
+
+
+def test_extractor_pickles_without_its_pools():
+    from src.gender import GenderExtractor
+
+    extractor = GenderExtractor()
+    extractor._pools = {(2, ()): object()}
+    assert "_pools" not in pickle.loads(pickle.dumps(extractor)).__dict__
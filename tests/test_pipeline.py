@@ -0,0 +1,76 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from src.articles import ArticlesExtractor
+from src.pipeline import CHECKPOINT_FILE, Pipeline
+
+pytest.importorskip("pyarrow")
+
+CHARGES = ["Иванов И.И. - ст.159 ч.2 УК РФ", "ст. 20.1 КоАП", None, "ст. 105 ч.1 п.а УК", "ст. 111 ч.2 УК"]
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "decisions.csv"
+    pd.DataFrame({"id": range(len(CHARGES)), "accused": CHARGES}).to_csv(path, index=False)
+    return str(path)
+
+
+def make_pipeline(**kwargs):
+    return Pipeline(court_column=None, gender_column=None, articles_column="accused", **kwargs)
+
+
+def test_interrupted_run_resumes_after_the_last_completed_chunk(input_path, tmp_path, monkeypatch):
+    expected = make_pipeline().run(input_path, str(tmp_path / "expected"), chunk_size=2)
+    assert (expected["processed_chunks"], expected["processed_rows"]) == (3, 5)
+
+    output_dir = str(tmp_path / "output")
+    pipeline = make_pipeline()
+    process_chunk = pipeline.process_chunk
+    chunks = []
+
+    def failing_process_chunk(chunk):
+        chunks.append(len(chunk))
+        if len(chunks) == 2:
+            raise RuntimeError("interrupted")
+        return process_chunk(chunk)
+
+    monkeypatch.setattr(pipeline, "process_chunk", failing_process_chunk)
+    with pytest.raises(RuntimeError):
+        pipeline.run(input_path, output_dir, chunk_size=2)
+    with open(os.path.join(output_dir, CHECKPOINT_FILE), encoding="utf-8") as file:
+        assert json.load(file)["completed_chunks"] == 1
+
+    stats = make_pipeline().run(input_path, output_dir, chunk_size=2)
+    assert {key: stats[key] for key in ("processed_chunks", "processed_rows", "skipped_chunks", "skipped_rows")} \
+        == {"processed_chunks": 2, "processed_rows": 3, "skipped_chunks": 1, "skipped_rows": 2}
+    pd.testing.assert_frame_equal(pd.read_parquet(output_dir), pd.read_parquet(str(tmp_path / "expected")))
+
+    # A completed run is not processed again
+    assert make_pipeline().run(input_path, output_dir, chunk_size=2)["processed_chunks"] == 0
+
+
+@pytest.mark.parametrize("changed", [
+    {"incremental": True},
+    {"articles_extractor": ArticlesExtractor(remove_duplicates=False)},
+    {"chunk_size": 3},
+])
+def test_checkpoint_of_other_settings_is_not_resumed(input_path, tmp_path, changed):
+    output_dir = str(tmp_path / "output")
+    make_pipeline().run(input_path, output_dir, chunk_size=2)
+    chunk_size = changed.pop("chunk_size", 2)
+    with pytest.raises(ValueError, match="Checkpoint"):
+        make_pipeline(**changed).run(input_path, output_dir, chunk_size=chunk_size)
+    stats = make_pipeline(**changed).run(input_path, output_dir, chunk_size=chunk_size, resume=False)
+    assert stats["skipped_chunks"] == 0 and stats["processed_rows"] == len(CHARGES)
+
+
+def test_fingerprint_follows_the_extractor_versions(monkeypatch):
+    pipeline = make_pipeline()
+    fingerprint = pipeline.fingerprint()
+    assert make_pipeline().fingerprint() == fingerprint
+    monkeypatch.setattr(pipeline.articles_extractor, "version", lambda: "other rules")
+    assert pipeline.fingerprint() != fingerprint
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import re
+import threading
+
+import pytest
+
+from src.llm import FakeModel, ModelResponse, RateLimiter, ResponseCache
+from src.pipeline import Pipeline
+from src.punishments import AMBIGUOUS_PATTERN, PunishmentExtractor, ResolutiveLocator, parse_severities
+
+HEADER = "Уголовное дело рассмотрено в открытом судебном заседании. " * 12 + "ПРИГОВОРИЛ: "
+FINE = "Петрова П.П. признать виновным и назначить наказание в виде штрафа в размере 20 тысяч рублей."
+BROKEN = "Сидорова С.С. признать виновным и назначить наказание в виде штрафа в размере 30 тысяч рублей."
+MODEL_RESULT = {"Сидоров С С": {"1": {"punishment": "штраф", "type": "",
+                                      "severity": {"years": 0, "months": 0, "rubles": 30000, "days": 0, "hours": 0}}}}
+
+
+def respond(prompt):
+    # Batch prompts list the decisions as "[<ID>] Names: ..."
+    document_ids = re.findall(r"^\[(\w+)\] Names:", prompt, re.MULTILINE)
+    result = {document_id: MODEL_RESULT for document_id in document_ids} if document_ids else MODEL_RESULT
+    return f"```json\n{json.dumps(result, ensure_ascii=False)}\n```"
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    model = FakeModel(response=respond)
+    extractor = PunishmentExtractor(model=model, fast_path=True)
+    # No spaCy and Natasha models: the lemmas and names of the texts are given
+    monkeypatch.setattr(extractor, "lemmatize_many", lambda texts, **kwargs: [
+        "петров п.п. признать виновный и назначить наказание в вид штраф в размер 20 тысяча рубль ."
+        for _ in texts])
+    monkeypatch.setattr(extractor.gender_extractor, "extract_names_many",
+                        lambda texts, **kwargs: [{"Петров П П": []} for _ in texts])
+    monkeypatch.setattr(extractor.gender_extractor, "extract_names", lambda text, **kwargs: {"Сидоров С С": []})
+
+    rule_based_punishment = extractor.rule_based_punishment
+
+    def failing_rule_based_punishment(input_string, lemmatized=None, names=None):
+        if "Сидорова" in input_string:
+            raise ValueError("cannot parse")
+        return rule_based_punishment(input_string, lemmatized, names)
+
+    monkeypatch.setattr(extractor, "rule_based_punishment", failing_rule_based_punishment)
+    return extractor
+
+
+@pytest.mark.parametrize("batch_token_budget", [None, 8000])
+def test_failing_rule_parse_falls_back_to_model(extractor, batch_token_budget):
+    rows = asyncio.run(extractor.find_punishments_async([HEADER + FINE, HEADER + BROKEN],
+                                                        batch_token_budget=batch_token_budget))
+    assert [row["source"] for row in rows] == ["rules", "model"]
+    assert [row["error"] for row in rows] == [None, None]
+    assert rows[0]["result"][1] == {"Петров П П": {"1": {"punishment": "штраф", "type": "", "severity": {
+        "years": 0, "months": 0, "rubles": 20000, "days": 0, "hours": 0}}}}
+
+
+def test_failing_batch_mode_falls_back_to_single_requests(extractor, monkeypatch):
+    async def failing_batched(*args, **kwargs):
+        raise RuntimeError("batch prompt failed")
+
+    monkeypatch.setattr(extractor, "find_punishments_batched_async", failing_batched)
+    rows = asyncio.run(extractor.find_punishments_async([HEADER + BROKEN, "short", None], batch_token_budget=8000))
+    assert [(row["source"], row["status"]) for row in rows] == [("model", "ok"), (None, "too_short"),
+                                                                (None, "not_text")]
+    assert rows[0]["result"][1] == MODEL_RESULT
+
+
+@pytest.mark.parametrize("key", ["{}", "[{}]", " [{}] ", "[ {} ]"])
+def test_batch_response_keys_with_brackets(key):
+    extractor = PunishmentExtractor(model=FakeModel())
+    document_id = extractor.document_id(BROKEN)
+    response = ModelResponse(f"```json\n{json.dumps({key.format(document_id): MODEL_RESULT}, ensure_ascii=False)}\n```")
+    assert extractor.parse_batch_response(response, [document_id]) == ({document_id: MODEL_RESULT}, {})
+
+
+@pytest.mark.parametrize("text, ambiguous", [
+    ("назначить наказание в виде лишения свободы на срок 2 года без назначения дополнительного наказания", False),
+    ("назначить наказание в виде лишения свободы на срок 2 года БЕЗ НАЗНАЧЕНИЯ ДОПОЛНИТЕЛЬНОГО НАКАЗАНИЯ", False),
+    ("назначить наказание в виде лишения свободы на срок 2 года с дополнительным наказанием в виде штрафа", True),
+    ("назначить наказание в виде штрафа, дополнительное наказание в виде ограничения свободы", True),
+])
+def test_ambiguous_pattern_skips_negated_additional_punishment(text, ambiguous):
+    assert bool(AMBIGUOUS_PATTERN.search(text)) == ambiguous
+
+
+@pytest.mark.parametrize("text, ambiguous", [
+    ("Вещественные доказательства в соответствии со ст. 82 УПК РФ уничтожить.", False),
+    ("Вещественными доказательствами распорядиться в порядке ст. 82 Уголовно-процессуального кодекса РФ.", False),
+    ("На основании ч. 5 ст. 69 УК РФ окончательно назначить наказание", True),
+    ("В соответствии со статьей 73 УК РФ наказание считать условным", True),
+    ("Применить ст.64 Уголовного кодекса Российской Федерации", True),
+])
+def test_ambiguous_pattern_articles_of_the_criminal_code(text, ambiguous):
+    assert bool(AMBIGUOUS_PATTERN.search(text)) == ambiguous
+
+
+def severity(**values):
+    return {field: values.get(field, 0) for field in ("years", "months", "rubles", "days", "hours")}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("штраф в размере 15 000 руб. в доход государства", [severity(rubles=15000)]),
+    ("штраф в размере 20 тыс. руб.", [severity(rubles=20000)]),
+    ("штраф в размере двадцати пяти тысяч рублей", [severity(rubles=25000)]),
+    ("штраф в размере 15000 (пятнадцать тысяч) рублей 00 копеек", [severity(rubles=15000)]),
+    ("лишение свободы на срок 4 (четыре) года 6 (шесть) месяцев", [severity(years=4, months=6)]),
+    ("обязательные работы сроком на 200 часов", [severity(hours=200)]),
+    ("лишение свободы на срок 2 года, ограничение свободы на срок 1 год", [severity(years=2), severity(years=1)]),
+    ("штраф в размере, определенном судом", []),
+])
+def test_parse_severities(text, expected):
+    assert parse_severities(text) == expected
+
+
+NAMES = {"Петров П П": []}
+IMPRISONMENT = ("Петрова П.П. признать виновным и назначить наказание в виде лишения свободы на срок 2 года "
+                "6 месяцев с отбыванием наказания в исправительной колонии общего режима.")
+IMPRISONMENT_LEMMAS = ("петров п.п. признать виновный и назначить наказание в вид лишение свобода на срок 2 год "
+                       "6 месяц с отбывание наказание в исправительный колония общий режим .")
+FINE_LEMMAS = ("петров п.п. признать виновный и назначить наказание в вид штраф в размер 15 000 рубль в доход "
+               "государство .")
+
+
+@pytest.mark.parametrize("text, lemmatized, names, expected", [
+    ("Петрова П.П. признать виновным и назначить наказание в виде штрафа в размере 15 000 руб. в доход государства.",
+     FINE_LEMMAS, NAMES, {"punishment": "штраф", "type": "", "severity": severity(rubles=15000)}),
+    (IMPRISONMENT, IMPRISONMENT_LEMMAS, NAMES, {"punishment": "лишение свободы на определенный срок",
+                                                 "type": "колония общего режима",
+                                                 "severity": severity(years=2, months=6)}),
+    ("Петрова П.П. признать виновным и назначить наказание в виде обязательных работ на срок 200 часов. "
+     "Вещественные доказательства в соответствии со ст. 82 УПК РФ уничтожить.",
+     "петров п.п. признать виновный и назначить наказание в вид обязательный работа на срок 200 час . вещественный "
+     "доказательство в соответствие с ст. 82 упк рф уничтожить .", NAMES,
+     {"punishment": "обязательные работы", "type": "", "severity": severity(hours=200)}),
+    # Suspended sentence
+    (IMPRISONMENT.replace(".", ", условно с испытательным сроком 1 год."), IMPRISONMENT_LEMMAS, NAMES, None),
+    # Aggregation of punishments
+    ("На основании ч. 2 ст. 69 УК РФ окончательно назначить " + IMPRISONMENT, IMPRISONMENT_LEMMAS, NAMES, None),
+    # Two defendants
+    (IMPRISONMENT, IMPRISONMENT_LEMMAS, {"Петров П П": [], "Сидоров С С": []}, None),
+    # A severity in other units than those of the punishment
+    ("Петрова П.П. признать виновным и назначить наказание в виде штрафа в размере 2 лет.", FINE_LEMMAS, NAMES, None),
+    # Several severities
+    (IMPRISONMENT.replace("6 месяцев", "6 месяцев, на срок 3 года"), IMPRISONMENT_LEMMAS, NAMES, None),
+    # No regime of the colony
+    (IMPRISONMENT.split(" с отбыванием")[0] + ".", IMPRISONMENT_LEMMAS.split(" с отбывание")[0], NAMES, None),
+])
+def test_rule_based_punishment(text, lemmatized, names, expected):
+    extractor = PunishmentExtractor(model=FakeModel())
+    result, confident = extractor.rule_based_punishment(text, lemmatized, names)
+    assert confident == (expected is not None)
+    assert result == ({"Петров П П": {"1": expected}} if expected is not None else None)
+
+
+def test_prompt_names_are_extracted_in_one_batch_off_the_event_loop(monkeypatch):
+    extractor = PunishmentExtractor(model=FakeModel(response=respond))
+    calls = []
+
+    def extract_names_many(texts, **kwargs):
+        calls.append((threading.current_thread() is threading.main_thread(), len(texts)))
+        return [{"Сидоров С С": []} for _ in texts]
+
+    def extract_names(text, **kwargs):
+        calls.append((threading.current_thread() is threading.main_thread(), 1))
+        return {"Сидоров С С": []}
+
+    monkeypatch.setattr(extractor.gender_extractor, "extract_names_many", extract_names_many)
+    monkeypatch.setattr(extractor.gender_extractor, "extract_names", extract_names)
+    rows = asyncio.run(extractor.find_punishments_async([HEADER + BROKEN, HEADER + FINE, "short"]))
+    assert [row["source"] for row in rows] == ["model", "model", None]
+    assert calls == [(False, 2)]
+
+    calls.clear()
+    row = asyncio.run(extractor.find_punishment_async(BROKEN))
+    assert row["result"] == (BROKEN, MODEL_RESULT)
+    assert calls == [(False, 1)]
+
+
+def test_limiter_is_shared_by_calls(extractor):
+    limiter = RateLimiter(requests_per_minute=100)
+    for _ in range(2):
+        rows = asyncio.run(extractor.find_punishments_async([HEADER + BROKEN], limiter=limiter))
+        assert rows[0]["source"] == "model"
+    assert limiter.requests.tokens == pytest.approx(98, abs=0.1)
+
+
+def test_pipeline_keeps_one_limiter():
+    pipeline = Pipeline(court_column=None, articles_column=None, gender_column=None,
+                        punishment_extractor=PunishmentExtractor(model=FakeModel()),
+                        punishment_options={"concurrency": 4, "requests_per_minute": 100, "tokens_per_minute": 10000})
+    limiter = pipeline.punishment_options.pop("limiter")
+    assert pipeline.punishment_options == {"concurrency": 4}
+    assert (limiter.requests.capacity, limiter.tokens.capacity) == (100, 10000)
+
+
+@pytest.mark.parametrize("batch_token_budget", [None, 8000])
+def test_cache_hits_return_the_model_result(extractor, tmp_path, batch_token_budget):
+    extractor.cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    texts = [HEADER + BROKEN]
+    first, = asyncio.run(extractor.find_punishments_async(texts, batch_token_budget=batch_token_budget))
+    second, = asyncio.run(extractor.find_punishments_async(texts, batch_token_budget=batch_token_budget))
+    assert (first["source"], second["source"]) == ("model", "cache")
+    assert second["result"] == first["result"] == ("ПРИГОВОРИЛ: " + BROKEN, MODEL_RESULT)
+    assert extractor.model.calls == 1
+
+    # Results of batch prompts and single prompts are cached apart
+    other, = asyncio.run(extractor.find_punishments_async(texts, batch_token_budget=8000 if batch_token_budget is None
+                                                          else None))
+    assert other["source"] == "model" and extractor.model.calls == 2
+    assert extractor.cache_key(BROKEN) != extractor.cache_key(BROKEN, batch=True)
+
+
+@pytest.mark.parametrize("text, first, last", [
+    # The last anchor is the "признать" of the resolutive part
+    (HEADER + BROKEN, ("ok", HEADER.index("ПРИГОВОРИЛ")), ("ok", len(HEADER) + BROKEN.index("признать"))),
+    # Spaced and mixed case anchors
+    (HEADER.replace("ПРИГОВОРИЛ", "П Р И Г О В О Р И Л") + BROKEN, ("ok", HEADER.index("ПРИГОВОРИЛ")), None),
+    (HEADER.replace("ПРИГОВОРИЛ", "Постановил") + BROKEN, ("ok", HEADER.index("ПРИГОВОРИЛ")), None),
+    (HEADER + BROKEN.replace("признать", "ПРИЗНАТЬ"), ("ok", HEADER.index("ПРИГОВОРИЛ")),
+     ("ok", len(HEADER) + BROKEN.index("признать"))),
+    # Lowercasing "İ" adds a character: the offsets are those of the text
+    ("İ" * 10 + HEADER + BROKEN, ("ok", 10 + HEADER.index("ПРИГОВОРИЛ")), None),
+    (HEADER.replace("ПРИГОВОРИЛ:", "") + "Штраф уплатить.", ("no_anchor", None), ("no_anchor", None)),
+    (BROKEN, ("too_short", None), ("too_short", None)),
+    (HEADER + "Данные изъяты в интересах несовершеннолетнего. " + BROKEN, ("sensitive", None), ("sensitive", None)),
+    (None, ("not_text", None), ("not_text", None)),
+    (float("nan"), ("not_text", None), ("not_text", None)),
+])
+def test_resolutive_locator(text, first, last):
+    extractor = PunishmentExtractor(model=FakeModel())
+    locator = ResolutiveLocator(extractor.pattern, extractor.sensitive_pattern, anchor="last")
+    assert extractor.locate_resolutive_part(text) == first
+    if last is not None:
+        assert locator.locate(text) == last
+    if first[0] == "ok":
+        assert extractor.locator.extract(text) == text[first[1]:]
+
+
+def test_resolutive_locator_with_uppercase_patterns():
+    # Patterns that are not lowercase are matched case-insensitively in the text itself
+    locator = ResolutiveLocator(r"ПРИГОВОРИЛ\s*:", r"НЕ ПОДЛЕЖИТ", min_length=10)
+    assert locator.locate("Суд приговорил: штраф") == ("ok", 4)
+    assert locator.locate("Текст не подлежит публикации") == ("sensitive", None)
+    with pytest.raises(ValueError):
+        ResolutiveLocator(r"приговорил", anchor="middle")